@@ -8,8 +8,13 @@ Currently only implement the chromake pipeline.
 
 
 
-# load subpackages next when importing the main package
-from .pipelines import chromake
+# load the subpackages when they are first used (genomake.chromake), so the cli and the
+# snakefile only import the modules they need
+def __getattr__(name):
+    if name == "chromake":
+        from .pipelines import chromake
+        return chromake
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # make subpackage listed public so that they can be loaded with
 # from <this_package> import *
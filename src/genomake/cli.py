@@ -28,6 +28,25 @@ def _cmd_chromake_pipeline(args):
         cmd.extend(shlex.split("--local-cores 1"))
     else:
         cmd.extend(shlex.split(f"--local-cores {args.local_cores}"))
+    if args.group_size is not None and args.group_size <= 0:
+        print("--group-size was set to a value inferior or equal to 0. Using the value of the configuration file")
+        args.group_size = None
+    # a single --config option, snakemake only keeps the last one
+    config_overrides = []
+    if args.scratch_dir:
+        config_overrides.append(f"SCRATCH_DIR={args.scratch_dir}")
+    if args.alignment_cache:
+        config_overrides.append(f"ALIGNMENT_CACHE={args.alignment_cache}")
+    if args.job_grouping:
+        config_overrides.append(f"JOB_GROUPING={args.job_grouping}")
+    if args.group_size:
+        config_overrides.append(f"GROUP_SIZE={args.group_size}")
+    if config_overrides:
+        cmd.extend(["--config", *config_overrides])
+    # the jobs of a group that don't depend on each other are only run together with --group-components
+    group_components = _get_group_components(args)
+    if group_components:
+        cmd.extend(["--group-components", *(f"{group}={n}" for group, n in group_components.items())])
     if args.others_snakemake != "":
         cmd.extend(shlex.split(args.others_snakemake))
     if args.print_only:
@@ -36,6 +55,68 @@ def _cmd_chromake_pipeline(args):
         Path("./logs").mkdir(parents=True, exist_ok=True)
         subprocess.run(cmd, check=True)
 
+def _get_group_components(args):
+    # the components are only computed when the grouping is requested on the command line, so a wrong configuration is reported by snakemake
+    if args.job_grouping in (None, "none"):
+        return {}
+    import yaml
+    from genomake.pipelines.chromake.scripts.config import check_config_format
+    from genomake.pipelines.chromake.scripts.paths import PathIndex
+    from genomake.pipelines.chromake.scripts.snakemake_functions import get_group_components
+    if not Path(args.config_path).is_file():
+        raise SystemExit(f"The configuration file {args.config_path} doesn't exist.")
+    with open(args.config_path, "r", encoding="utf-8") as fh:
+        cfg = yaml.safe_load(fh)
+    cfg["JOB_GROUPING"] = args.job_grouping
+    if args.group_size:
+        cfg["GROUP_SIZE"] = args.group_size
+    try:
+        check_config_format(cfg)
+    except RuntimeError as error:
+        raise SystemExit(f"The configuration file {args.config_path} is invalid: {error}")
+    return get_group_components(cfg, PathIndex(cfg))
+
+def _cmd_chromake_perf_report(args):
+    import yaml
+    from genomake.pipelines.chromake.scripts import perf_report
+    with open(args.config_path, "r", encoding="utf-8") as fh:
+        cfg = yaml.safe_load(fh)
+    report = perf_report.write_perf_report(cfg, args.output_prefix, args.top)
+    print(f"{len(report['jobs'])} benchmarks collected, report written with the prefix '{args.output_prefix}'.")
+    print("\nPer rule:")
+    print(perf_report.format_table(report["rules"]))
+    print("\nPer sample:")
+    print(perf_report.format_table(report["samples"][:args.top]))
+    print("\nSlowest jobs:")
+    print(perf_report.format_table([
+        {k: job[k] for k in ("SEQUENCING", "PROJECT", "RULE", "JOB", "s", "max_rss", "cpu_time")}
+        for job in report["slowest"]
+    ]))
+
+def _cmd_chromake_validate(args):
+    import yaml
+    from genomake.pipelines.chromake.scripts import validate
+    with open(args.config_path, "r", encoding="utf-8") as fh:
+        cfg = yaml.safe_load(fh)
+    if not validate.validate_report(cfg, args.threads, args.gzip, args.pairing, args.output):
+        raise SystemExit(1)
+
+def _cmd_cache(args):
+    from genomake.pipelines.chromake.scripts import alignment_cache
+    from genomake.pipelines.chromake.scripts.perf_report import format_table
+    if not Path(args.cache_dir).is_dir():
+        raise SystemExit(f"The cache folder {args.cache_dir} doesn't exist.")
+    if args.cache_command == "evict":
+        evicted = alignment_cache.evict_cache(args.cache_dir, args.max_gb)
+        print(f"{len(evicted)} entries evicted ({sum(entry['SIZE_GB'] for entry in evicted):.3f} GB).")
+    elif args.cache_command == "clear":
+        evicted = alignment_cache.evict_cache(args.cache_dir, 0)
+        print(f"{len(evicted)} entries removed.")
+    entries = alignment_cache.list_entries(args.cache_dir)
+    print(f"{len(entries)} entries in the cache ({sum(entry['SIZE_GB'] for entry in entries):.3f} GB).")
+    if args.cache_command == "list" and entries:
+        print(format_table([{k: v for k, v in entry.items() if not k.startswith("_")} for entry in entries]))
+
 # --- CLI setup ---
 
 def main():
@@ -51,8 +132,8 @@ def main():
         "chromake", help="Run the chromake pipeline to align ChIP and ATAC sequencing data and identify enriched peaks."
     )
     parser_chromake.add_argument(
-        "--config-path", "-c", type=str, required=True,
-        help="Path to the configuration file. See 'genomake.pipelines.chromake.scripts.config.create_example_config()' for an example. This python module also contains a function to generate one from a samplesheet."
+        "--config-path", "-c", type=str, default=None,
+        help="Path to the configuration file (required). See 'genomake.pipelines.chromake.scripts.config.create_example_config()' for an example. This python module also contains a function to generate one from a samplesheet."
     )
     parser_chromake.add_argument(
         "--jobs", "-j", type=int, default=5,
@@ -71,13 +152,101 @@ def main():
         help="Other arguments for the snakemake command. Can be used to set the default value for an executor like slurm. Default to ''"
     )
     # --executor slurm --default-resources --slurm-delete-logfiles-older-than 0 --slurm-logdir "logs"
+    parser_chromake.add_argument(
+        "--scratch-dir", type=str, default=None,
+        help="Node-local folder for the intermediate files of the jobs (override the SCRATCH_DIR field of the configuration file). Quote environment variables (e.g. '$TMPDIR') so they are expanded on the nodes running the jobs. Default to the value of the configuration file."
+    )
+    parser_chromake.add_argument(
+        "--alignment-cache", type=str, default=None,
+        help="Folder shared between configurations where the trimmed fastq, the alignments and the fragment files are cached (override the ALIGNMENT_CACHE field of the configuration file). Default to the value of the configuration file."
+    )
+    parser_chromake.add_argument(
+        "--job-grouping", type=str, choices=["none", "sample", "sequencing"], default=None,
+        help="Run the short steps (flagstat and stats, HOMER tracks, bins and multiqc reports) in groups instead of one cluster job each (override the JOB_GROUPING field of the configuration file): 'sample' groups the steps of GROUP_SIZE samples, 'sequencing' groups GROUP_SIZE steps of the samples of a sequencing. The size of the groups is given to snakemake (--group-components) only with this option. Default to the value of the configuration file."
+    )
+    parser_chromake.add_argument(
+        "--group-size", type=int, default=None,
+        help="Number of samples ('sample' grouping) or of jobs ('sequencing' grouping) of each group (override the GROUP_SIZE field of the configuration file). Default to the value of the configuration file."
+    )
     parser_chromake.add_argument(
         "--print-only", "-p", action="store_true", default=False,
         help="Only print the final snakemake command and exit without executing the pipeline."
     )
     parser_chromake.set_defaults(func=_cmd_chromake_pipeline)
 
+    # chromake subcommands (the pipeline is run when no subcommand is given)
+    chromake_subparsers = parser_chromake.add_subparsers(title="chromake commands", dest="chromake_command")
+
+    parser_perf_report = chromake_subparsers.add_parser(
+        "perf-report", help="Summarize the benchmarks recorded by the rules of the pipeline (wall time, memory, CPU) per rule and per sample."
+    )
+    parser_perf_report.add_argument(
+        "--config-path", "-c", type=str, required=True,
+        help="Path to the configuration file of the pipeline."
+    )
+    parser_perf_report.add_argument(
+        "--output-prefix", "-o", type=str, default="chromake_perf",
+        help="Prefix of the TSV files of the report (_jobs.tsv, _rules.tsv, _samples.tsv, _slowest.tsv). Default to 'chromake_perf'."
+    )
+    parser_perf_report.add_argument(
+        "--top", type=int, default=10,
+        help="Number of samples and jobs listed as the slowest. Default to 10."
+    )
+    parser_perf_report.set_defaults(func=_cmd_chromake_perf_report)
+
+    parser_validate = chromake_subparsers.add_parser(
+        "validate", help="Check the fastq files of the samples and of the inputs (existence, size, and optionally gzip integrity and R1/R2 pairing) before running the pipeline."
+    )
+    parser_validate.add_argument(
+        "--config-path", "-c", type=str, required=True,
+        help="Path to the configuration file of the pipeline."
+    )
+    parser_validate.add_argument(
+        "--threads", "-t", type=int, default=16,
+        help="Number of files checked concurrently. Default to 16."
+    )
+    parser_validate.add_argument(
+        "--gzip", action="store_true", default=False,
+        help="Check the integrity of the gzipped fastq by decompressing them entirely (detects truncated and corrupted files)."
+    )
+    parser_validate.add_argument(
+        "--pairing", action="store_true", default=False,
+        help="Check that the R1 and R2 fastq of each lane contain the same reads in the same order (also checks their integrity)."
+    )
+    parser_validate.add_argument(
+        "--output", "-o", type=str, default=None,
+        help="TSV file where the report (one line per lane with the size of its fastq) is written. Default to none."
+    )
+    parser_validate.set_defaults(func=_cmd_chromake_validate)
+
+    # alignment cache maintenance
+    parser_cache = subparsers.add_parser(
+        "cache", help="Maintain the alignment cache shared by the chromake configurations (see the ALIGNMENT_CACHE field)."
+    )
+    cache_subparsers = parser_cache.add_subparsers(title="cache commands", dest="cache_command", required=True)
+    parser_cache_list = cache_subparsers.add_parser(
+        "list", help="List the entries of the cache, from the least to the most recently used."
+    )
+    parser_cache_evict = cache_subparsers.add_parser(
+        "evict", help="Evict the least recently used entries until the cache is below a size."
+    )
+    parser_cache_evict.add_argument(
+        "--max-gb", type=float, required=True,
+        help="Size of the cache (in GB) after the eviction."
+    )
+    parser_cache_clear = cache_subparsers.add_parser(
+        "clear", help="Remove all entries of the cache."
+    )
+    for cache_parser in (parser_cache_list, parser_cache_evict, parser_cache_clear):
+        cache_parser.add_argument(
+            "--cache-dir", "-d", type=str, required=True,
+            help="Folder of the cache (ALIGNMENT_CACHE field of the configurations)."
+        )
+    parser_cache.set_defaults(func=_cmd_cache)
+
     args = parser.parse_args()
+    if args.command == "chromake" and args.chromake_command is None and args.config_path is None:
+        parser_chromake.error("the following arguments are required: --config-path/-c")
     if hasattr(args, "func"):
         args.func(args)
     else:
@@ -6,7 +6,23 @@ Chromake is used to align sequencing data of ChIP-seq and ATAC-seq experiments,
 Notes
 -----
 
-The ressources used can be modified. In particular, the number of cores can be specified in the config file while other ressources (memory, runtime) will necessite to copy and modify the snakefile included in this subpackage.
+The ressources used can be modified. In particular, the number of cores can be specified in the config file. The threads, memory, and runtime of the per-sample rules are estimated from the size of the fastq of each sample (see [](`genomake.pipelines.chromake.scripts.snakemake_functions.estimate_resources`)).
+
+Each run records benchmarks in the QC/BENCHMARKS folder of the sequencings, and the next runs use them to calibrate the estimations. The command `genomake chromake perf-report -c <config>` summarizes those benchmarks per rule and per sample.
+
+The fragments of each sample are written as a bed file (BED/<sample>_sorted.bed) and as a binary fragment store (FRAGMENTS/<sample>.npy and .index.tsv) that the python steps of the pipeline memory-map instead of parsing the bed (see [](`genomake.pipelines.chromake.scripts.fragment_store`)).
+
+The quality controls are computed once per fastq or sample:
+
+- FastQC is run by one single-threaded job per raw fastq, so the reports are spread across the cluster and only the reports of new fastq are computed when samples are added.
+- The trimmed fastq are not read again by FastQC: cutadapt streams the trimmed reads to a collector that writes the R1 and R2 fastq and computes their QC metrics in the same pass, in the format of FastQC read by multiqc (QC/FASTQC/TRIMMED/<fastq>_fastqc/fastqc_data.txt, see [](`genomake.pipelines.chromake.scripts.read_qc`)).
+- The multiqc reports (QC/MULTIQC/Raw_fastq.html, Trimmed_fastq.html and Bam_report.html) are built by separate jobs from the per-sample QC files of the samples of the config, listed explicitly, so they only parse files computed once per sample and don't include the reports of samples removed from the config.
+
+The per-sample steps are wildcard rules (one per sequencing and per step, whatever the number of samples) whose inputs are looked up from the wildcards, so the time snakemake spends parsing the snakefile and building the DAG grows slowly with the number of samples. The command `python -m genomake.pipelines.chromake.scripts.dag_benchmark -n 10 100 1000` measures it on synthetic configurations (see [](`genomake.pipelines.chromake.scripts.dag_benchmark`)).
+
+The checked configuration and the paths of its files are compiled once and cached in .snakemake/chromake_plans under the hash of the configuration, so the cluster jobs load them instead of computing them again (see [](`genomake.pipelines.chromake.scripts.plan`)).
+
+Other modifications will necessite to copy and modify the snakefile included in this subpackage.
 
 Chromake contains submodules ([](`genomake.pipelines.chromake.scripts.config`) and [](`genomake.pipelines.chromake.scripts.paths`)). Among them, [paths](`genomake.pipelines.chromake.scripts.paths`) is used by the snakefile to track the files it generate, while [config](`genomake.pipelines.chromake.scripts.config`) was created to help the user create the YAML config file needed by snakemake.
 
@@ -31,6 +47,7 @@ dependencies:
   - homer
   - openssl
   - picard
+  - pybigwig
   - python
   - ucsc-bedgraphtobigwig
   - ucsc-bedtobigbed
@@ -39,12 +56,13 @@ dependencies:
       - git+https://github.com/Pierre9344/genomake
       - MACS3 # can be modified to MACS2 and the pipeline will detect which version to call in the rule
       - cutadapt
-      - deeptools
+      - matplotlib
       - multiqc
       - snakemake-executor-plugin-slurm
 ```
         
 - you need a configuration file in a yaml format. Check [](`genomake.pipelines.chromake.scripts.config.create_example_config`) for an example. The [config](`genomake.pipelines.chromake.scripts.config`) submodule contains functions to generate such a config file from a samplesheet.
+- the command `genomake chromake validate -c ./config.yaml --pairing` checks the fastq files of the configuration before running the pipeline: existence and size (per sample, the size used to estimate the resources of its jobs), integrity of the gzipped files, and same reads in the R1 and R2 files of each lane (see [](`genomake.pipelines.chromake.scripts.validate`)).
 - The configuration is composed of 3 main fields:
     - SEQUENCINGS
     - PROJECTS
@@ -55,9 +73,18 @@ SEQUENCINGS is used to define the sample of a sequencing run that share similar
 Each sequencing must have a parameters field to indicates at least:
   - the genome reference for bowtie2 (BOWTIE2_REF)
   - a bed of blacklisted regions (BLACKLIST_BED), see https://github.com/Boyle-Lab/Blacklist to download the file corresponding to the genome you use
-  - a file indicating the chromosome size (CHROM_SIZE), see https://hgdownload.cse.ucsc.edu/goldenpath/hg38/bigZips/ to download the one for GRCh38/hg38. UCSC also host the files for other genomes such as mm10.
+  - a file indicating the chromosome size (CHROM_SIZE), see https://hgdownload.cse.ucsc.edu/goldenpath/hg38/bigZips/ to download the one for GRCh38/hg38. UCSC also host the files for other genomes such as mm10. The reads aligned on the contigs of this file are kept, except the mitochondrial genome and the contigs with a '_' in their name (alternative, unplaced, random and patch contigs).
   - the genome used, either the .fa file of the reference used to build bowtie2 reference (toplevel.fa for ensembl) or a string such as hg38 or mm10 if the genome was configured in homer with configureHomer.pl (GENOME)
   - Adaptor trimming will be realized if the `R1_ADAPTOR` and the `R2_ADAPTOR`fields are present
+  - the alignment mode (ALIGNMENT_MODE, optional). With `native` (default), the output of bowtie2 is piped through `samtools fixmate` and `samtools sort`, then the duplicated pairs (same unclipped 5' positions and strands of both mates) are removed by the [deduplicate](`genomake.pipelines.chromake.scripts.deduplicate`) module, one process per chromosome, with a few hundred MB of memory per process. With `streaming`, the duplicates are removed by `samtools markdup`. With `picard`, bowtie2 write a SAM file that is sorted and deduplicated by picard, which needs much more memory and time. All modes create a coordinate-sorted bam without duplicates and a picard-style duplication metrics file (QC/PICARD/<sample>_picard.rmDup.txt).
+  - a contig alias table (CHROM_ALIAS, optional), such as the chromAlias.txt file of UCSC, whose first column is the contig name of the CHROM_SIZE file and the other columns the names used by the bowtie2 reference. Without it, the contigs of the bowtie2 reference are renamed by adding a 'chr' prefix (and MT to chrM).
+  - the number of chunks each lane of a sample is split in before the alignment (ALIGNMENT_CHUNKS, optional, default to 1). With more than one chunk, the chunks are aligned by independent jobs and merged before the duplicate removal.
+  - whether the filtered bam sorted by name (BAM/<sample>_filtered.namesort.bam) is also created (NAMESORT_BAM, optional, default to false). The pipeline only uses the coordinate-sorted bam.
+  - the coverage tracks (BEDGRAPH/<sample>.bw) options: the size of their bins in bp (COVERAGE_BIN_SIZE, optional, default to 1 for the base resolution) and their normalization (COVERAGE_NORMALIZATION, optional, `none` for fragment counts or `CPM` for counts per million of fragments). The tracks are written with pyBigWig if it is installed, or with bedGraphToBigWig otherwise.
+
+The fragments of each sample are also counted in 10 kb bins over the whole genome (BINS/<sample>.npy, a memory-mappable vector computed once per sample, see [](`genomake.pipelines.chromake.scripts.bins`)). The correlation rule of each sequencing assembles the vectors of its samples in a sample x bin coverage matrix (QC/CORRELATION/coverage_matrix.npy), computes their Spearman correlation (QC/CORRELATION/correlation_matrix.tsv) and draws the heatmap of the samples clustered by correlation (QC/CORRELATION/correlation_plot.png), with the number of cores of CORES_PER_JOBS/MULTIBAMSUMMARY. It replaces multiBamSummary and plotCorrelation: the bams are not read again, and the ranks of the samples and the products of the ranks of each pair of samples are cached, so only the new samples are ranked and only the pairs involving a new sample are computed when samples are added, with the same correlation matrix as a full computation (see [](`genomake.pipelines.chromake.scripts.correlation`)).
+
+A sample sequenced on several lanes can list one file per lane in its R1 and R2 fields (in the same order). Each lane is trimmed (TRIMMED/<sample>_L<lane>_R1.fastq.gz, or TRIMMED/<sample>_R1.fastq.gz for a sample with a single lane) and aligned separately, then the lanes are merged in a single bam before the duplicate removal.
 
 ```{.yaml}
 SEQUENCING:
@@ -68,9 +95,13 @@ SEQUENCING:
         TYPE: H3K27AC
         R2: <PATH_TO_R2_fastq>
       PSMD6_F1_Fa:
-        R1: <PATH_TO_R1_fastq>
+        R1:
+          - <PATH_TO_R1_fastq_of_lane_1>
+          - <PATH_TO_R1_fastq_of_lane_2>
         TYPE: ATAC
-        R2: <PATH_TO_R2_fastq>
+        R2:
+          - <PATH_TO_R2_fastq_of_lane_1>
+          - <PATH_TO_R2_fastq_of_lane_2>
     INPUT:
       Input_Batch1:
         R1: <PATH_TO_R1_fastq>
@@ -80,10 +111,16 @@ SEQUENCING:
     R2_ADAPTOR: CTGTCTCTTATACACATCT (modify to the sequence corresponding to your samples or remove this field to not trim)
     PARAMETERS:
       CUTADAPT: -q 20 --pair-filter=any (cutadapt paramters by default, modify or leave empty)
+      ALIGNMENT_MODE: native (optional, 'streaming' removes the duplicates with samtools markdup, 'picard' with picard MarkDuplicates)
+      ALIGNMENT_CHUNKS: 1 (optional, number of parallel alignment jobs per lane)
       BOWTIE2_REF: <PATH>/index-bowtie-2.3.0/Homo_sapiens.GRCh38.dna.toplevel (modify to point to your reference for bowtie2)
       BLACKLIST_BED: <PATH>/hg38-blacklist.v2.bed 
       GENOME: <PATH>/ensembl/release-99/Homo_sapiens.GRCh38.dna.toplevel.fa
       CHROM_SIZE: <PATH>/hg38.chrom.sizes
+      CHROM_ALIAS: <PATH>/hg38.chromAlias.txt (optional)
+      NAMESORT_BAM: false (optional, true to also create the bam sorted by name)
+      COVERAGE_BIN_SIZE: 1 (optional, size of the bins of the coverage tracks)
+      COVERAGE_NORMALIZATION: none (optional, 'CPM' to scale the coverage tracks to counts per million of fragments)
 ```
 
 PROJECTS is used to regroup samples of different sequencing when realising peak calling and the minimal number of samples in which a peak is identified to be keep in the final count matrix. To be regrouped, the samples need to shares the same mark. The path of each project indicate where the files resulting of the peak calling will be created. It is recommanded to use different folders for each projects.
@@ -94,6 +131,7 @@ PROJECTS:
     PROJECT_PATH: <PATH>
     TYPE: ATAC
     MIN_SAMPLES_FOR_PEAKS: 2
+    GENOME_SIZE: hs (optional, effective genome size given to macs: a number or hs, mm, ce, dm)
     SEQUENCING:
     - MO211
   ChIP_H3K27ME3:
@@ -116,6 +154,8 @@ PROJECTS:
     - MO203
 ```
 
+The peaks of each sample of a project are called by macs callpeak from its fragments (BED/<sample>_sorted.bed, with the fragments of the input of its sequencing as control for the ChIP-seq marks), as narrow peaks for H3K27AC and broad peaks for the other marks, in the peaks folder of the project. The peaks of all samples are then merged by the consensus rule of the project: overlapping peaks form a region, and the regions with peaks in at least MIN_SAMPLES_FOR_PEAKS samples are written in peaks/consensus_<project>.bed (chromosome, start, end, name, number of samples with a peak, see [](`genomake.pipelines.chromake.scripts.peaks`)). The fragments of the samples (FRAGMENTS/<sample>.npy) are counted in the consensus peaks by the count_peaks rule of the project, which writes a sparse peak x sample count matrix in counts/counts_<project>.npz (readable with `scipy.sparse.load_npz`) with its rows (.peaks.tsv) and columns (.samples.tsv, with the fraction of fragments in peaks). The column of each sample is cached, so adding samples to a project only counts the new samples as long as the consensus peaks don't change (see [](`genomake.pipelines.chromake.scripts.counts`)). The correlation rule of the project compares the coverage of its samples, which can come from several sequencings, in the correlation folder of the project (<project>_coverage_matrix.npy, <project>_correlation_matrix.tsv and <project>_correlation_plot.png).
+
 The JOBS field is used to indicate the number of cpu to use for multithreadings and the QOS when running jobs on a clusters with an executor like slurm.
 
 ```{.yaml}
@@ -132,6 +172,26 @@ JOBS:
     long:
       MaxWall: 11520
 ```
+
+The optional SCRATCH_DIR field indicates a node-local folder (e.g. `$TMPDIR` or a local SSD) where the jobs write their intermediate files (SAM files, unfiltered bam, temporary files of the sorts and of picard). The environment variables are expanded on the node running the job. Each job works in its own sub-folder, moves its final files to their output path once they are complete, and removes the sub-folder on success and on failure. When SCRATCH_DIR is empty (default), the intermediate files are written next to the outputs. It can also be set with the `--scratch-dir` option of `genomake chromake`.
+
+```{.yaml}
+SCRATCH_DIR: $TMPDIR
+```
+
+The optional ALIGNMENT_CACHE field indicates a folder shared between configurations where the trimmed fastq, the alignments, the filtered bam and the fragment files of the samples are cached. The entries are keyed by the content of the fastq (not their path or the name of the sample), the reference, the trimming options and the version of the pipeline (see [](`genomake.pipelines.chromake.scripts.alignment_cache`)), so re-analyses, new projects, and inputs shared between sequencings link the cached files instead of trimming and aligning the reads again. The samples whose alignment is cached are not aligned at all. When ALIGNMENT_CACHE_MAX_GB is set, the least recently used entries are evicted once the cache exceeds this size. The cache can be set with the `--alignment-cache` option of `genomake chromake`, and maintained with `genomake cache list|evict|clear -d <folder>`.
+
+```{.yaml}
+ALIGNMENT_CACHE: <PATH>/chromake_cache
+ALIGNMENT_CACHE_MAX_GB: 2000
+```
+
+On a cluster, the short steps of the samples (samtools flagstat and stats, HOMER tracks and bins) and the multiqc reports of each sequencing can be grouped so they share cluster jobs instead of paying the queue latency of one submission each, and the `--jobs` limit is used by the alignments and the other long steps. With the optional JOB_GROUPING field set to `sample`, the short steps of each block of GROUP_SIZE samples (in the order of the configuration) run in one cluster job; with `sequencing`, the short steps of the samples of a sequencing run GROUP_SIZE at a time in one cluster job (a group starts once the inputs of all its steps are ready). In both modes, the multiqc reports of each sequencing run in one cluster job. The default `none` submits each step separately. The groups are set in the snakefile from the configuration, and the `--job-grouping` and `--group-size` options of `genomake chromake` override these fields and give the size of the groups to snakemake (`--group-components`), so the steps of a group that don't depend on each other run in the same cluster job. Use `--job-grouping` on a cluster, with the value of JOB_GROUPING. Snakemake ignores the groups when the jobs are run locally.
+
+```{.yaml}
+JOB_GROUPING: sample
+GROUP_SIZE: 5
+```
   
 You can use the genomake cli API to run snakemake:
 
@@ -0,0 +1,373 @@
+"""
+The alignment_cache module of chromake contains functions to share the trimmed fastq, the alignments and the fragment files of the samples between configurations.
+
+The cache is a folder (ALIGNMENT_CACHE field of the configuration) shared by all the configurations that use it. Each entry contains the outputs of one step of one sample (or lane), and it is named after a key computed from what determines them:
+
+- trimming (one entry per lane): the fingerprint of the raw fastq, the adaptors and the CUTADAPT options,
+- alignment (one entry per sample): the fingerprints of the raw fastq of all lanes, the trimming options, BOWTIE2_REF and ALIGNMENT_MODE,
+- filter: the alignment key, and the content of CHROM_SIZE and CHROM_ALIAS,
+- fragments: the filter key, the content of BLACKLIST_BED, COVERAGE_BIN_SIZE and COVERAGE_NORMALIZATION.
+
+All keys contain CACHE_VERSION. The keys don't depend on the name of the sample, of the sequencing or on the path of the fastq, so a fastq copied elsewhere or analyzed by a new configuration reuses the entries. The bam restored from the cache keep the read group of the sample that created them.
+
+The files are hard linked between the outputs and the cache when they are on the same filesystem, else copied. A restored file gets the time of its restoration as modification time (shared with the cache and the other links of the file), so snakemake sees it as newer than the inputs of its job. The entries are evicted in least recently used order when the size of the cache exceeds ALIGNMENT_CACHE_MAX_GB, or with the `genomake cache` command.
+
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+
+CACHE_VERSION = 3
+"""Version of the cached steps, part of all keys. It must be increased when the commands of the cached rules change."""
+
+STAGES = {
+    "trimming": ["R1 trimmed fastq", "R2 trimmed fastq", "R1 read QC", "R2 read QC", "cutadapt log"],
+    "alignment": ["fragment length", "aligned bam", "duplication metrics"],
+    "filter": ["filtered bam", "filtered bam index"],
+    "fragments": ["sorted bed", "coverage bigwig", "fragment store", "fragment store index"],
+}
+"""Files of the entries of each step, in the order of the outputs of the rules storing them."""
+
+FINGERPRINT_BLOCK = 1 << 16
+"""Size of the blocks read at the start and at the end of a fastq to compute its fingerprint."""
+
+MANIFEST = "manifest.json"
+"""File describing an entry, written last so an entry without it is incomplete. Its modification time is the last use of the entry."""
+
+_TMP_DIR = "tmp"
+_TMP_MAX_AGE_S = 24 * 3600
+
+
+def fastq_fingerprint(path: str) -> str:
+    """
+    Compute the fingerprint of the content of a fastq file.
+
+    The fingerprint is the sha256 of the size of the file and of its first and last FINGERPRINT_BLOCK bytes, so it doesn't read the whole file. The end of a gzipped file contains the CRC32 and the size of its decompressed content, so two gzipped fastq with the same fingerprint have the same reads.
+
+    Parameters
+    ----------
+    path : str
+        Path of the fastq.
+
+    Returns
+    -------
+    str
+        The fingerprint (hexadecimal).
+    """
+    digest = hashlib.sha256()
+    size = os.stat(path).st_size
+    digest.update(str(size).encode())
+    with open(path, "rb") as fh:
+        digest.update(fh.read(FINGERPRINT_BLOCK))
+        if size > FINGERPRINT_BLOCK:
+            fh.seek(max(size - FINGERPRINT_BLOCK, FINGERPRINT_BLOCK))
+            digest.update(fh.read())
+    return digest.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """
+    Compute the sha256 of a (small) file such as CHROM_SIZE or BLACKLIST_BED, empty if no path is given.
+    """
+    if not path:
+        return ""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_cache_key(stage: str, *fields) -> str:
+    """
+    Compute the key of a cache entry.
+
+    Parameters
+    ----------
+    stage : str
+        Step of the entry (see STAGES).
+
+    fields :
+        Values (JSON serializable) determining the outputs of the step.
+
+    Returns
+    -------
+    str
+        The sha256 of CACHE_VERSION, of the stage and of the fields.
+    """
+    if stage not in STAGES:
+        raise RuntimeError(f"{stage} is not a step of the alignment cache, use one of: {', '.join(STAGES)}.")
+    return hashlib.sha256(json.dumps([CACHE_VERSION, stage, *fields]).encode()).hexdigest()
+
+
+def get_stage_keys(sequencing_data: dict, lanes: list) -> dict:
+    """
+    Compute the keys of the entries of a sample.
+
+    Parameters
+    ----------
+    sequencing_data : dict
+        Dict representing a sequencing in the configuration (checked, with the default parameters).
+
+    lanes : list
+        (R1, R2) paths of the raw fastq of each lane of the sample.
+
+    Returns
+    -------
+    dict
+        The key of each step: `trimming` (a list, one key per lane, or None without trimming), `alignment`, `filter` and `fragments`.
+    """
+    parameters = sequencing_data["PARAMETERS"]
+    fingerprints = [[fastq_fingerprint(r1), fastq_fingerprint(r2)] for r1, r2 in lanes]
+    trimming = None
+    if sequencing_data.get("R1_ADAPTOR") and sequencing_data.get("R2_ADAPTOR"):
+        trimming = [sequencing_data["R1_ADAPTOR"], sequencing_data["R2_ADAPTOR"], parameters.get("CUTADAPT", "")]
+    keys = {"trimming": None if trimming is None else [get_cache_key("trimming", lane, trimming) for lane in fingerprints]}
+    keys["alignment"] = get_cache_key("alignment", fingerprints, trimming, str(parameters["BOWTIE2_REF"]), parameters.get("ALIGNMENT_MODE", "native"))
+    keys["filter"] = get_cache_key("filter", keys["alignment"], file_digest(parameters["CHROM_SIZE"]), file_digest(parameters.get("CHROM_ALIAS", "")))
+    keys["fragments"] = get_cache_key(
+        "fragments", keys["filter"], file_digest(parameters["BLACKLIST_BED"]),
+        parameters.get("COVERAGE_BIN_SIZE", 1), parameters.get("COVERAGE_NORMALIZATION", "none"),
+    )
+    return keys
+
+
+def get_entry_path(cache_dir: str, key: str) -> Path:
+    """
+    Get the folder of a cache entry.
+    """
+    return Path(cache_dir) / key[:2] / key
+
+
+def is_cached(entry: str) -> bool:
+    """
+    Check if a cache entry is complete.
+    """
+    return bool(entry) and (Path(entry) / MANIFEST).exists()
+
+
+def get_cached_file(entry: str, index: int) -> str:
+    """
+    Get the path of a file of a cache entry (index in the list of files of its step, see STAGES).
+    """
+    return str(Path(entry) / f"file{index}")
+
+
+def _link_or_copy(source: Path, destination: Path) -> None:
+    tmp_path = destination.with_name(destination.name + ".part")
+    tmp_path.unlink(missing_ok=True)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, destination)
+
+
+def fetch_entry(entry: str, outputs: list) -> bool:
+    """
+    Restore the files of a cache entry to the outputs of a job.
+
+    Parameters
+    ----------
+    entry : str
+        Folder of the entry.
+
+    outputs : list
+        Paths where the files of the entry are restored, in the order of the files of its step. A `-` skips the file.
+
+    Returns
+    -------
+    bool
+        True if the entry was restored, False if it isn't in the cache.
+    """
+    if not is_cached(entry):
+        return False
+    entry = Path(entry)
+    with open(entry / MANIFEST, "r", encoding="utf-8") as fh:
+        manifest = json.load(fh)
+    if len(manifest["FILES"]) != len(outputs):
+        raise RuntimeError(f"The cache entry {entry} contains {len(manifest['FILES'])} files, but {len(outputs)} outputs were given.")
+    now = time.time()
+    for index, output in enumerate(outputs):
+        if output == "-":
+            continue
+        output = Path(output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        _link_or_copy(entry / f"file{index}", output)
+        # the restored files are more recent than the inputs of the job, as if it had created them
+        os.utime(output, (now, now))
+    os.utime(entry / MANIFEST)
+    return True
+
+
+def store_entry(entry: str, files: list, label: str = "", max_size_gb: float = 0) -> bool:
+    """
+    Store the outputs of a job in a cache entry.
+
+    The files are linked (or copied) in a temporary folder of the cache that is renamed into the entry once complete, so the jobs running concurrently never see a partial entry.
+
+    Parameters
+    ----------
+    entry : str
+        Folder of the entry.
+
+    files : list
+        Outputs of the job, in the order of the files of its step.
+
+    label : str
+        Description of the entry (such as <sequencing>/<sample>) shown by `genomake cache list`.
+
+    max_size_gb : float
+        Maximal size of the cache. The least recently used entries are evicted after the storage when it is exceeded. 0 for no limit.
+
+    Returns
+    -------
+    bool
+        True if the entry was stored, False if it already existed.
+    """
+    entry = Path(entry)
+    if is_cached(entry):
+        return False
+    cache_dir = entry.parent.parent
+    tmp_entry = cache_dir / _TMP_DIR / f"{entry.name}.{os.getpid()}"
+    shutil.rmtree(tmp_entry, ignore_errors=True)
+    tmp_entry.mkdir(parents=True)
+    try:
+        for index, path in enumerate(files):
+            _link_or_copy(Path(path), tmp_entry / f"file{index}")
+        manifest = {
+            "LABEL": label,
+            "FILES": [Path(path).name for path in files],
+            "SIZE": sum((tmp_entry / f"file{index}").stat().st_size for index in range(len(files))),
+            "CREATED": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with open(tmp_entry / MANIFEST, "w", encoding="utf-8") as fh:
+            json.dump(manifest, fh)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # the entry was stored by another job in the meantime
+            return False
+    finally:
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+    if max_size_gb > 0:
+        evict_cache(cache_dir, max_size_gb)
+    return True
+
+
+def list_entries(cache_dir: str) -> list:
+    """
+    List the complete entries of a cache.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Folder of the cache.
+
+    Returns
+    -------
+    list
+        A list of dict with the KEY, the LABEL, the number of FILES, the SIZE_GB, the CREATED date and the LAST_USED date of each entry, sorted from the least to the most recently used.
+    """
+    entries = []
+    for manifest_path in Path(cache_dir).glob(f"??/*/{MANIFEST}"):
+        try:
+            with open(manifest_path, "r", encoding="utf-8") as fh:
+                manifest = json.load(fh)
+            last_used = manifest_path.stat().st_mtime
+        except (OSError, ValueError):
+            continue
+        entries.append({
+            "KEY": manifest_path.parent.name,
+            "LABEL": manifest.get("LABEL", ""),
+            "FILES": len(manifest.get("FILES", [])),
+            "SIZE_GB": round(manifest.get("SIZE", 0) / 1e9, 3),
+            "CREATED": manifest.get("CREATED", ""),
+            "LAST_USED": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(last_used)),
+            "_MTIME": last_used,
+            "_SIZE": manifest.get("SIZE", 0),
+        })
+    entries.sort(key=lambda entry: entry["_MTIME"])
+    return entries
+
+
+def _remove_entry(cache_dir: str, key: str) -> None:
+    entry = get_entry_path(cache_dir, key)
+    # the manifest is removed first so the entry is never used while it is removed
+    (entry / MANIFEST).unlink(missing_ok=True)
+    shutil.rmtree(entry, ignore_errors=True)
+
+
+def evict_cache(cache_dir: str, max_size_gb: float) -> list:
+    """
+    Evict the least recently used entries of a cache until its size is at most `max_size_gb`. The temporary folders of the storages older than a day are removed too.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Folder of the cache.
+
+    max_size_gb : float
+        Maximal size of the cache in GB.
+
+    Returns
+    -------
+    list
+        The entries evicted (see [](`genomake.pipelines.chromake.scripts.alignment_cache.list_entries`)).
+    """
+    tmp_dir = Path(cache_dir) / _TMP_DIR
+    if tmp_dir.exists():
+        for tmp_entry in tmp_dir.iterdir():
+            try:
+                if time.time() - tmp_entry.stat().st_mtime > _TMP_MAX_AGE_S:
+                    shutil.rmtree(tmp_entry, ignore_errors=True)
+            except OSError:
+                continue
+    entries = list_entries(cache_dir)
+    size = sum(entry["_SIZE"] for entry in entries)
+    evicted = []
+    for entry in entries:
+        if size <= max_size_gb * 1e9:
+            break
+        _remove_entry(cache_dir, entry["KEY"])
+        size -= entry["_SIZE"]
+        evicted.append(entry)
+    return evicted
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Restore the outputs of a job from the alignment cache of chromake, or store them in it."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    parser_fetch = subparsers.add_parser("fetch", help="Restore an entry (exit with 1 if it isn't in the cache).")
+    parser_fetch.add_argument("--entry", type=str, required=True, help="Folder of the entry.")
+    parser_fetch.add_argument("outputs", nargs="+", help="Paths where the files of the entry are restored ('-' to skip a file).")
+    parser_store = subparsers.add_parser("store", help="Store the outputs of a job in an entry.")
+    parser_store.add_argument("--entry", type=str, required=True, help="Folder of the entry.")
+    parser_store.add_argument("--label", type=str, default="", help="Description of the entry.")
+    parser_store.add_argument("--max-gb", type=float, default=0, help="Maximal size of the cache in GB (0 for no limit).")
+    parser_store.add_argument("files", nargs="+", help="Outputs of the job.")
+    args = parser.parse_args()
+
+    if args.command == "fetch":
+        if not fetch_entry(args.entry, args.outputs):
+            sys.exit(1)
+        print(f"Outputs restored from the cache entry {args.entry}.")
+    else:
+        # a failed storage doesn't fail the job, its outputs are complete
+        try:
+            if store_entry(args.entry, args.files, args.label, args.max_gb):
+                print(f"Outputs stored in the cache entry {args.entry}.")
+        except OSError as error:
+            print(f"The outputs can't be stored in the cache entry {args.entry} ({error}).")
+
+
+if __name__ == "__main__":
+    main()
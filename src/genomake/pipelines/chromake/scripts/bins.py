@@ -0,0 +1,172 @@
+"""
+The bins module of chromake contains functions to count the fragments of a sample in bins of fixed size over the whole genome (BINS/<sample>.npy and BINS/<sample>.tsv).
+
+The bin vector of a sample is computed once from its fragment store (see [](`genomake.pipelines.chromake.scripts.fragment_store`)) and replaces the binning of all bams by `multiBamSummary bins` each time the correlation of the samples is computed. It is a 1D int32 numpy array saved as a .npy file, so it is memory-mapped when read. The bins of each chromosome are contiguous, the chromosomes are the contigs kept by the pipeline in the order of the fragment stores, and the layout file gives, for each chromosome, the position of its first bin and its number of bins. The layout only depends on the CHROM_SIZE file and on the bin size, so the vectors of samples of different sequencings aligned on the same genome can be compared.
+
+"""
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+
+from genomake.pipelines.chromake.scripts.contigs import get_allowed_contigs, read_chrom_sizes
+from genomake.pipelines.chromake.scripts.fragment_store import open_fragment_store
+
+DEFAULT_BIN_SIZE = 10000
+"""Size of the bins in bp (the default of multiBamSummary bins)."""
+
+BIN_DTYPE = np.int32
+"""Type of the fragment counts of the bins."""
+
+
+def get_bin_vector_paths(prefix: str) -> tuple:
+    """
+    Get the paths of the two files of the bin vector of a sample.
+
+    Parameters
+    ----------
+    prefix : str
+        Path of the bin vector without extension (e.g. <PATH>/BINS/<sample>).
+
+    Returns
+    -------
+    tuple
+        The paths of the vector (<prefix>.npy) and of its layout (<prefix>.tsv).
+    """
+    return str(prefix) + ".npy", str(prefix) + ".tsv"
+
+
+def get_bin_layout(chrom_size_path: str, bin_size: int = DEFAULT_BIN_SIZE) -> list:
+    """
+    Get the layout of the bins of a genome.
+
+    Parameters
+    ----------
+    chrom_size_path : str
+        Chromosome size file (CHROM_SIZE parameter of the sequencing).
+
+    bin_size : int
+        Size of the bins in bp.
+
+    Returns
+    -------
+    list
+        List of (chromosome, first bin, number of bins), in the order of the fragment stores (byte order of the names of the contigs kept by the pipeline).
+    """
+    chrom_sizes = read_chrom_sizes(chrom_size_path)
+    layout = []
+    first = 0
+    for chrom in sorted(get_allowed_contigs(chrom_size_path)):
+        n_bins = -(-chrom_sizes[chrom] // bin_size)
+        layout.append((chrom, first, n_bins))
+        first += n_bins
+    return layout
+
+
+def read_bin_layout(layout_path: str) -> list:
+    """
+    Read the layout file of a bin vector.
+
+    Parameters
+    ----------
+    layout_path : str
+        Path to the layout file (.tsv).
+
+    Returns
+    -------
+    list
+        List of (chromosome, first bin, number of bins).
+    """
+    layout = []
+    with open(layout_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            chrom, first, n_bins = line.rstrip("\n").split("\t")
+            layout.append((chrom, int(first), int(n_bins)))
+    return layout
+
+
+def bin_fragments(starts: np.ndarray, ends: np.ndarray, n_bins: int, bin_size: int = DEFAULT_BIN_SIZE) -> np.ndarray:
+    """
+    Count the fragments overlapping each bin of a chromosome (a fragment overlapping two bins is counted in both).
+
+    Parameters
+    ----------
+    starts, ends : np.ndarray
+        Fragments of the chromosome (0-based, half-open).
+
+    n_bins : int
+        Number of bins of the chromosome.
+
+    bin_size : int
+        Size of the bins in bp.
+
+    Returns
+    -------
+    np.ndarray
+        The number of fragments of each bin.
+    """
+    first_bins = np.minimum(np.asarray(starts, dtype=np.int64) // bin_size, n_bins - 1)
+    last_bins = np.minimum((np.asarray(ends, dtype=np.int64) - 1) // bin_size, n_bins - 1)
+    # +1 at the first bin of each fragment and -1 after its last bin
+    changes = np.bincount(first_bins, minlength=n_bins + 1) - np.bincount(last_bins + 1, minlength=n_bins + 1)
+    return np.cumsum(changes[:n_bins]).astype(BIN_DTYPE)
+
+
+def write_bin_vector(store_prefix: str, prefix: str, chrom_size_path: str, bin_size: int = DEFAULT_BIN_SIZE) -> int:
+    """
+    Write the bin vector of a sample from its fragment store.
+
+    Parameters
+    ----------
+    store_prefix : str
+        Path of the fragment store of the sample without extension.
+
+    prefix : str
+        Path of the bin vector to write without extension (see [](`genomake.pipelines.chromake.scripts.bins.get_bin_vector_paths`)).
+
+    chrom_size_path : str
+        Chromosome size file (CHROM_SIZE parameter of the sequencing).
+
+    bin_size : int
+        Size of the bins in bp.
+
+    Returns
+    -------
+    int
+        The number of bins of the vector.
+    """
+    layout = get_bin_layout(chrom_size_path, bin_size)
+    store = open_fragment_store(store_prefix)
+    n_total = sum(n_bins for _, _, n_bins in layout)
+    vector = np.zeros(n_total, dtype=BIN_DTYPE)
+    for chrom, first, n_bins in layout:
+        if chrom in store:
+            vector[first:first + n_bins] = bin_fragments(*store[chrom], n_bins, bin_size)
+
+    vector_path, layout_path = get_bin_vector_paths(prefix)
+    Path(vector_path).parent.mkdir(parents=True, exist_ok=True)
+    np.save(vector_path + ".tmp.npy", vector)
+    with open(layout_path + ".tmp", "w", encoding="utf-8") as fh:
+        fh.writelines(f"{chrom}\t{first}\t{n_bins}\n" for chrom, first, n_bins in layout)
+    os.replace(vector_path + ".tmp.npy", vector_path)
+    os.replace(layout_path + ".tmp", layout_path)
+    return n_total
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Count the fragments of a sample in bins of fixed size over the whole genome from its fragment store."
+    )
+    parser.add_argument("--store", "-s", type=str, required=True, help="Path of the fragment store without extension (FRAGMENTS/<sample>).")
+    parser.add_argument("--output", "-o", type=str, required=True, help="Path of the bin vector to write without extension (BINS/<sample>).")
+    parser.add_argument("--chrom-size", type=str, required=True, help="Chromosome size file.")
+    parser.add_argument("--bin-size", type=int, default=DEFAULT_BIN_SIZE, help=f"Size of the bins in bp. Default to {DEFAULT_BIN_SIZE}.")
+    args = parser.parse_args()
+    write_bin_vector(args.store, args.output, args.chrom_size, args.bin_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,13 @@ The config module of chromake contains functions to read and write the config fi
 
 """
 
-import pandas as pd
 from pathlib import Path
 import yaml
 import warnings
 import os
 
+from genomake.pipelines.chromake.scripts.paths import get_sample_fastq
+
 def create_example_config(
     filename: str = "test_config.yaml",
 ) :
@@ -62,9 +63,14 @@ def create_example_config(
                 "R2_ADAPTOR": "AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGT",
                 "PARAMETERS": {
                     "CUTADAPT": "-q 20 --pair-filter=any",
+                    "ALIGNMENT_MODE": "native",
+                    "ALIGNMENT_CHUNKS": 1,
                     "BOWTIE2_REF": "<path to genome reference build for bowtie2>",
                     "BLACKLIST_BED": "<Path to blacklist file in bed format, see https://github.com/Boyle-Lab/Blacklist >",
-                    "CHROM_SIZE": "<path to file wih the size of chromosome (can be found on UCSC) >"
+                    "CHROM_SIZE": "<path to file wih the size of chromosome (can be found on UCSC) >",
+                    "CHROM_ALIAS": "",
+                    "COVERAGE_BIN_SIZE": 1,
+                    "COVERAGE_NORMALIZATION": "none"
                 }
             },
             "MO208": {
@@ -96,9 +102,14 @@ def create_example_config(
                 "R2_ADAPTOR": "AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGT",
                 "PARAMETERS": {
                     "CUTADAPT": "-q 20 --pair-filter=any",
+                    "ALIGNMENT_MODE": "native",
+                    "ALIGNMENT_CHUNKS": 1,
                     "BOWTIE2_REF": "<path to genome reference build for bowtie2>",
                     "BLACKLIST_BED": "<Path to blacklist file in bed format, see https://github.com/Boyle-Lab/Blacklist >",
-                    "CHROM_SIZE": "<path to file wih the size of chromosome (can be found on UCSC) >"
+                    "CHROM_SIZE": "<path to file wih the size of chromosome (can be found on UCSC) >",
+                    "CHROM_ALIAS": "",
+                    "COVERAGE_BIN_SIZE": 1,
+                    "COVERAGE_NORMALIZATION": "none"
                 }
             },
             "MO211": {
@@ -119,9 +130,14 @@ def create_example_config(
                 "R2_ADAPTOR": "CTGTCTCTTATACACATCT",
                 "PARAMETERS": {
                     "CUTADAPT": "-q 20 --pair-filter=any",
+                    "ALIGNMENT_MODE": "native",
+                    "ALIGNMENT_CHUNKS": 1,
                     "BOWTIE2_REF": "<path to genome reference build for bowtie2>",
                     "BLACKLIST_BED": "<Path to blacklist file in bed format, see https://github.com/Boyle-Lab/Blacklist >",
-                    "CHROM_SIZE": "<path to file wih the size of chromosome (can be found on UCSC) >"
+                    "CHROM_SIZE": "<path to file wih the size of chromosome (can be found on UCSC) >",
+                    "CHROM_ALIAS": "",
+                    "COVERAGE_BIN_SIZE": 1,
+                    "COVERAGE_NORMALIZATION": "none"
                 }
             },
         },
@@ -131,24 +147,28 @@ def create_example_config(
                 "TYPE": "H3K27AC",
                 "MIN_SAMPLES_FOR_PEAKS": 2,
                 "PROJECT_PATH": "/scratch/.../ChIP_H3K27AC",
+                "GENOME_SIZE": "hs",
             },
             "ChIP_H3K27ME3": {
                 "SEQUENCINGS": ["MO203"],
                 "TYPE": "H3K27ME3",
                 "MIN_SAMPLES_FOR_PEAKS": 2,
                 "PROJECT_PATH": "/scratch/.../ChIP_H3K27ME3",
+                "GENOME_SIZE": "hs",
             },
             "ChIP_H2AUB": {
                 "SEQUENCINGS": ["MO203", "MO208"],
                 "TYPE": "H2AUB",
                 "MIN_SAMPLES_FOR_PEAKS": 2,
                 "PROJECT_PATH": "/scratch/.../ChIP_H2AUB",
+                "GENOME_SIZE": "hs",
             },
             "ChIP_ATAC": {
                 "SEQUENCINGS": ["MO211"],
                 "TYPE": "ATAC",
                 "MIN_SAMPLES_FOR_PEAKS": 2,
                 "PROJECT_PATH": "/scratch/.../ChIP_ATAC",
+                "GENOME_SIZE": "hs",
             },
         },
         "JOBS": {
@@ -166,6 +186,11 @@ def create_example_config(
                 "long": {"MaxWall": 8 * 24 * 60}, # 8 days in minutes
             },
         },
+        "SCRATCH_DIR": "",
+        "ALIGNMENT_CACHE": "",
+        "ALIGNMENT_CACHE_MAX_GB": 0,
+        "JOB_GROUPING": "none",
+        "GROUP_SIZE": 5,
     }
     
     if (os.path.splitext(filename)[1] == ".yaml") & (os.path.splitext(filename)[0] != ""):
@@ -445,37 +470,31 @@ def create_samplesheet_from_config(
             mark = sample_data.get("TYPE", "")
 
             if strand_columns:
-                # Wide format: separate R1 and R2 into distinct columns
-                row = {
-                    "SAMPLE": sample_name,
-                    "SEQUENCINGS": seq_name,  # SEQUENCING
-                    "PROJECT": "",  # Will update later for regular samples
-                    "TYPE": mark,  # The mark type (H3K27AC, H2AUB, etc.)
-                    "R1": "",  # Placeholder for R1 path
-                    "R2": ""   # Placeholder for R2 path
-                }
-
-                # Add R1 and R2 paths
-                for strand, path in sample_data.items():
-                    if strand == "R1":
-                        if proj_path and not os.path.isabs(path):
-                            row["R1"] = proj_path + path
-                        else:
-                            row["R1"] = path  # Use path as is if it's absolute or no proj_path
+                # Wide format: separate R1 and R2 into distinct columns, one row per lane
+                for r1_path, r2_path in zip(get_sample_fastq(sample_data, "R1") or [""], get_sample_fastq(sample_data, "R2") or [""]):
+                    row = {
+                        "SAMPLE": sample_name,
+                        "SEQUENCINGS": seq_name,  # SEQUENCING
+                        "PROJECT": "",  # Will update later for regular samples
+                        "TYPE": mark,  # The mark type (H3K27AC, H2AUB, etc.)
+                        "R1": "",  # Placeholder for R1 path
+                        "R2": ""   # Placeholder for R2 path
+                    }
 
-                        
-                    elif strand == "R2":
-                        if proj_path and not os.path.isabs(path):
-                            row["R2"] = proj_path + path
+                    # Add R1 and R2 paths
+                    for strand, path in (("R1", r1_path), ("R2", r2_path)):
+                        if proj_path and path and not os.path.isabs(path):
+                            row[strand] = proj_path + path
                         else:
-                            row["R2"] = path  # Use path as is if it's absolute or no proj_path
+                            row[strand] = path  # Use path as is if it's absolute or no proj_path
 
-                rows.append(row)  # Add row for sample with R1 and R2 in separate columns
+                    rows.append(row)  # Add row for sample with R1 and R2 in separate columns
             else:
                 # Long format: one row per strand (R1 or R2)
                 sample_type = sample_data.get("TYPE", "")
-                for strand, path in sample_data.items():
-                    if strand != "TYPE":
+                for strand in ("R1", "R2"):
+                    # A sample sequenced on several lanes has one row per lane and strand
+                    for path in get_sample_fastq(sample_data, strand):
                         # Resolve relative path to full path using project path
                         full_path = (proj_path + path) if proj_path and not os.path.isabs(path) else path
                         rows.append({
@@ -490,38 +509,36 @@ def create_samplesheet_from_config(
         # Process INPUTS (same logic as samples)
         for input_name, input_data in inputs.items():
             if strand_columns:
-                # Wide format: separate R1 and R2 into distinct columns for INPUTS
-                row_input = {
-                    "SAMPLE": input_name,
-                    "SEQUENCINGS": seq_name,  # SEQUENCING
-                    "PROJECT": "INPUT",  # Mark as INPUT
-                    "TYPE": "",  # No mark for INPUT
-                    "R1": "",  # Placeholder for R1 path
-                    "R2": ""   # Placeholder for R2 path
-                }
-
-                # Add R1 and R2 paths for INPUTS
-                for strand, path in input_data.items():
-                    if strand == "R1":
-                        full_path = (proj_path + path) if proj_path and not os.path.isabs(path) else path
-                        row_input["R1"] = full_path
-                    elif strand == "R2":
-                        full_path = (proj_path + path) if proj_path and not os.path.isabs(path) else path
-                        row_input["R2"] = full_path
-                rows.append(row_input)  # Add row for INPUT with R1 and R2 in separate columns
-            else:
-                # Long format: one row per strand for input
-                for strand, path in input_data.items():
-                    # Resolve relative path to full path using project path
-                    full_path = (proj_path + path) if proj_path and not os.path.isabs(path) else path
-                    rows.append({
+                # Wide format: separate R1 and R2 into distinct columns for INPUTS, one row per lane
+                for r1_path, r2_path in zip(get_sample_fastq(input_data, "R1") or [""], get_sample_fastq(input_data, "R2") or [""]):
+                    row_input = {
                         "SAMPLE": input_name,
                         "SEQUENCINGS": seq_name,  # SEQUENCING
                         "PROJECT": "INPUT",  # Mark as INPUT
                         "TYPE": "",  # No mark for INPUT
-                        "STRAND": strand,  # Set STRAND (R1 or R2)
-                        "PATH": full_path
-                    })
+                        "R1": "",  # Placeholder for R1 path
+                        "R2": ""   # Placeholder for R2 path
+                    }
+
+                    # Add R1 and R2 paths for INPUTS
+                    for strand, path in (("R1", r1_path), ("R2", r2_path)):
+                        full_path = (proj_path + path) if proj_path and path and not os.path.isabs(path) else path
+                        row_input[strand] = full_path
+                    rows.append(row_input)  # Add row for INPUT with R1 and R2 in separate columns
+            else:
+                # Long format: one row per strand (and lane) for input
+                for strand in ("R1", "R2"):
+                    for path in get_sample_fastq(input_data, strand):
+                        # Resolve relative path to full path using project path
+                        full_path = (proj_path + path) if proj_path and not os.path.isabs(path) else path
+                        rows.append({
+                            "SAMPLE": input_name,
+                            "SEQUENCINGS": seq_name,  # SEQUENCING
+                            "PROJECT": "INPUT",  # Mark as INPUT
+                            "TYPE": "",  # No mark for INPUT
+                            "STRAND": strand,  # Set STRAND (R1 or R2)
+                            "PATH": full_path
+                        })
 
     # Now, we need to update the PROJECT field for regular samples
     for row in rows:
@@ -538,6 +555,8 @@ def create_samplesheet_from_config(
             row["PROJECT"] = "INPUT"
 
     # Convert the list of rows into a DataFrame
+    # pandas (and openpyxl for the excel files) is only imported by the samplesheet functions, so the cli and the snakefile don't load it
+    import pandas as pd
     df = pd.DataFrame(rows)
 
     # Save as Excel or CSV
@@ -580,6 +599,7 @@ def create_config_from_table(
     """
 
     # Load table
+    import pandas as pd
     if os.path.splitext(table_path)[1] == ".csv":
         df = pd.read_csv(table_path)
     elif os.path.splitext(table_path)[1] in {".xls", ".xlsx"}:
@@ -639,11 +659,14 @@ def create_config_from_table(
         # Initialize sample entry
         target_dict.setdefault(sample_name, {})
 
-        # Add R1 and R2 paths for this sample
-        if strand == "R1":
-            target_dict[sample_name]["R1"] = sample_path
-        elif strand == "R2":
-            target_dict[sample_name]["R2"] = sample_path
+        # Add R1 and R2 paths for this sample, a strand listed several times (one row per lane) becomes a list
+        if strand in ("R1", "R2"):
+            if strand not in target_dict[sample_name]:
+                target_dict[sample_name][strand] = sample_path
+            elif isinstance(target_dict[sample_name][strand], list):
+                target_dict[sample_name][strand].append(sample_path)
+            else:
+                target_dict[sample_name][strand] = [target_dict[sample_name][strand], sample_path]
 
         # If it's not an input sample, set the TYPE
         if proj_name != "INPUT":
@@ -668,56 +691,43 @@ def create_config_from_table(
 
     return output_path
 
-def check_sample_files_exist(config_path: str) -> bool:
+def check_sample_files_exist(config_path: str, threads: int = 16) -> bool:
     """
-    Check if all R1 and R2 FASTQ files listed in the config exist.
+    Check if all R1 and R2 FASTQ files listed in the config (samples and inputs) exist.
+
+    The files are checked concurrently, see [](`genomake.pipelines.chromake.scripts.validate`) (or the `genomake chromake validate` command) to also check their integrity and their pairing.
 
     Parameters
     ----------
     config_path : str
         Path to the YAML config file.
 
+    threads : int
+        Number of files checked concurrently.
+
     Returns
     -------
     bool
         True if all R1 and R2 files exist, False otherwise.
     """
+    from genomake.pipelines.chromake.scripts.validate import list_fastq_files, stat_fastq_files
+
     # Load YAML config
     with open(config_path, "r", encoding="utf-8") as fh:
         config = yaml.safe_load(fh)
 
+    lanes = list_fastq_files(config)
+    sizes = stat_fastq_files([lane[strand] for lane in lanes for strand in ("R1", "R2") if lane[strand]], threads)
     all_exist = True
-
-    # Check the SEQUENCING section
-    sequencing_data = config.get("SEQUENCINGS", {})
-
-    for seq_name, seq_data in sequencing_data.items():
-        samples = seq_data.get("SAMPLES", {})
-        sample_path = seq_data.get("PATH", "")
-
-        for sample_name, sample_data in samples.items():
-            # R1 and R2 paths
-            r1_path = sample_data.get("R1")
-            r2_path = sample_data.get("R2")
-
-            # Check if R1 exists
-            if r1_path:
-                r1_path = sample_path + r1_path
-              #  if platform.system() == "Windows":
-              #      r1_path = r1_path.replace(os.sep, "/")
-                if not os.path.exists(r1_path):
-                    warnings.warn(f"Sample '{sample_name}' in sequencing '{seq_name}': R1 file '{r1_path}' does not exist.")
-                    all_exist = False
-
-            # Check if R2 exists
-            if r2_path:
-                r2_path = sample_path + r2_path
-                if not os.path.exists(r2_path):
-                    warnings.warn(f"Sample '{sample_name}' in sequencing '{seq_name}': R2 file '{r2_path}' does not exist.")
-                    all_exist = False
-                    
-            if not r1_path and not r2_path:
-                print(f"Samples {sample_name} is missing both R1 and R2 paths")
+    for lane in lanes:
+        if "CONFIG_ERROR" in lane:
+            print(f"Samples {lane['SAMPLE']} has {lane['CONFIG_ERROR']}")
+            all_exist = False
+            continue
+        for strand in ("R1", "R2"):
+            if sizes[lane[strand]] is None:
+                warnings.warn(f"Sample '{lane['SAMPLE']}' in sequencing '{lane['SEQUENCING']}': {strand} file '{lane[strand]}' does not exist.")
+                all_exist = False
 
     return all_exist
 
@@ -746,7 +756,10 @@ def check_config_format(cfg: dict, raise_error: bool = True):
               "CORES_PER_JOBS": {
               "FASTQC": 10,
               "CUTADAPT": 10,
-              "BOWTIE2": 30
+              "BOWTIE2": 30,
+              "SAMTOOLS_QC": 5,
+              "MULTIBAMSUMMARY": 5,
+              "BEDTOOLS": 5
               },
               "QOS_INFOS": {
                   "short": {"MaxWall": 2000},
@@ -779,7 +792,7 @@ def check_config_format(cfg: dict, raise_error: bool = True):
                 print("Number of cores not indicated for samtools QC, defaulting to 5")
                 cfg["JOBS"]["CORES_PER_JOBS"]["SAMTOOLS_QC"] = 5
             if "MULTIBAMSUMMARY" not in cfg["JOBS"]["CORES_PER_JOBS"]:
-                print("Number of cores not indicated for deeptools multiBamSummary rule defaulting to 5")
+                print("Number of cores not indicated for the correlation rule (MULTIBAMSUMMARY) defaulting to 5")
                 cfg["JOBS"]["CORES_PER_JOBS"]["MULTIBAMSUMMARY"] = 5
             if "BEDTOOLS" not in cfg["JOBS"]["CORES_PER_JOBS"]:
                 print("Number of cores not indicated for bedtools rule defaulting to 5")
@@ -791,6 +804,51 @@ def check_config_format(cfg: dict, raise_error: bool = True):
                 "medium": {"MaxWall": 5000},
                 "long": {"MaxWall": 15000}
             }
+    # SCRATCH_DIR is optional: node-local folder for the intermediate files of the jobs (empty to write them next to the outputs)
+    if "SCRATCH_DIR" not in cfg or cfg["SCRATCH_DIR"] is None:
+        cfg["SCRATCH_DIR"] = ""
+    elif not isinstance(cfg["SCRATCH_DIR"], str):
+        if raise_error:
+            raise RuntimeError("The 'SCRATCH_DIR' field must be a path (such as /tmp or $TMPDIR) or empty.")
+        else:
+            print("The 'SCRATCH_DIR' field must be a path (such as /tmp or $TMPDIR) or empty. Intermediate files will be written next to the outputs.")
+            cfg["SCRATCH_DIR"] = ""
+    # ALIGNMENT_CACHE is optional: folder shared between configurations where the trimmed fastq, the alignments and the fragment files are cached (empty to disable the cache)
+    if "ALIGNMENT_CACHE" not in cfg or cfg["ALIGNMENT_CACHE"] is None:
+        cfg["ALIGNMENT_CACHE"] = ""
+    elif not isinstance(cfg["ALIGNMENT_CACHE"], str):
+        if raise_error:
+            raise RuntimeError("The 'ALIGNMENT_CACHE' field must be a path or empty.")
+        else:
+            print("The 'ALIGNMENT_CACHE' field must be a path or empty. The cache is disabled.")
+            cfg["ALIGNMENT_CACHE"] = ""
+    # ALIGNMENT_CACHE_MAX_GB is optional: size above which the least recently used entries of the cache are evicted (0 for no limit)
+    if "ALIGNMENT_CACHE_MAX_GB" not in cfg or cfg["ALIGNMENT_CACHE_MAX_GB"] is None:
+        cfg["ALIGNMENT_CACHE_MAX_GB"] = 0
+    elif isinstance(cfg["ALIGNMENT_CACHE_MAX_GB"], bool) or not isinstance(cfg["ALIGNMENT_CACHE_MAX_GB"], (int, float)) or cfg["ALIGNMENT_CACHE_MAX_GB"] < 0:
+        if raise_error:
+            raise RuntimeError("The 'ALIGNMENT_CACHE_MAX_GB' field must be a positive number.")
+        else:
+            print("The 'ALIGNMENT_CACHE_MAX_GB' field must be a positive number. Setting it to 0 (no limit).")
+            cfg["ALIGNMENT_CACHE_MAX_GB"] = 0
+    # JOB_GROUPING is optional: 'sample' or 'sequencing' to run the short steps of the samples in groups of GROUP_SIZE samples or GROUP_SIZE jobs ('none' to submit each step separately)
+    if "JOB_GROUPING" not in cfg or cfg["JOB_GROUPING"] is None:
+        cfg["JOB_GROUPING"] = "none"
+    elif cfg["JOB_GROUPING"] not in ["none", "sample", "sequencing"]:
+        if raise_error:
+            raise RuntimeError("The 'JOB_GROUPING' field is invalid. Possible values are: none, sample, sequencing.")
+        else:
+            print("The 'JOB_GROUPING' field is invalid. Possible values are: none, sample, sequencing. The jobs are not grouped.")
+            cfg["JOB_GROUPING"] = "none"
+    # GROUP_SIZE is optional: number of samples ('sample' grouping) or of jobs ('sequencing' grouping) of each group
+    if "GROUP_SIZE" not in cfg or cfg["GROUP_SIZE"] is None:
+        cfg["GROUP_SIZE"] = 5
+    elif isinstance(cfg["GROUP_SIZE"], bool) or not isinstance(cfg["GROUP_SIZE"], int) or cfg["GROUP_SIZE"] < 1:
+        if raise_error:
+            raise RuntimeError("The 'GROUP_SIZE' field must be a positive integer.")
+        else:
+            print("The 'GROUP_SIZE' field must be a positive integer. Setting it to 5.")
+            cfg["GROUP_SIZE"] = 5
     if "SEQUENCINGS" in cfg:
         for sequencing_name, sequencing_data in cfg["SEQUENCINGS"].items():
             if "PATH" not in sequencing_data:
@@ -799,6 +857,18 @@ def check_config_format(cfg: dict, raise_error: bool = True):
                 else:
                     print(f"The sequencing {sequencing_name} doesn't have a 'PATH' field indicating the absolute path of the project.")
             
+            # an empty INPUT field (no input listed) is the same as no INPUT field
+            if "INPUT" in sequencing_data and not sequencing_data["INPUT"]:
+                del sequencing_data["INPUT"]
+
+            # R1 and R2 can list several files (one per lane), they must be paired
+            for sample_name, sample_data in {**sequencing_data.get("SAMPLES", {}), **(sequencing_data.get("INPUT") or {})}.items():
+                if len(get_sample_fastq(sample_data, "R1")) != len(get_sample_fastq(sample_data, "R2")):
+                    if raise_error:
+                        raise RuntimeError(f"The sample {sample_name} of the {sequencing_name} sequencing doesn't list the same number of R1 and R2 files.")
+                    else:
+                        print(f"The sample {sample_name} of the {sequencing_name} sequencing doesn't list the same number of R1 and R2 files.")
+
             if "INPUT" in sequencing_data and len(sequencing_data["INPUT"]) >= 2:
                 first_input = list(sequencing_data["INPUT"].keys())[0]
                 print(
@@ -818,7 +888,61 @@ def check_config_format(cfg: dict, raise_error: bool = True):
                 if "CUTADAPT" not in cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]:
                     print(f"The {sequencing_name} seqencing don't list parameters for cutadapt. Using the pipeline default: '-q 20 --pair-filter=any'.")
                     cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["CUTADAPT"] = ""
-                
+
+                # ALIGNMENT_MODE is optional: 'native' (samtools pipes and duplicates removed by the deduplicate module), 'streaming' (samtools pipes and markdup) or 'picard' (SAM files sorted and deduplicated by picard)
+                if "ALIGNMENT_MODE" not in cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]:
+                    cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["ALIGNMENT_MODE"] = "native"
+                elif cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["ALIGNMENT_MODE"] not in ["native", "streaming", "picard"]:
+                    if raise_error:
+                        raise RuntimeError(f"The {sequencing_name} sequencing list an invalid 'ALIGNMENT_MODE'. Possible values are: native, streaming, picard.")
+                    else:
+                        print(f"The {sequencing_name} sequencing list an invalid 'ALIGNMENT_MODE'. Possible values are: native, streaming, picard. Defaulting to native.")
+                        cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["ALIGNMENT_MODE"] = "native"
+
+                # ALIGNMENT_CHUNKS is optional: number of chunks each lane is split in to be aligned by parallel jobs
+                if "ALIGNMENT_CHUNKS" not in cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]:
+                    cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["ALIGNMENT_CHUNKS"] = 1
+                elif not isinstance(cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["ALIGNMENT_CHUNKS"], int) or cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["ALIGNMENT_CHUNKS"] < 1:
+                    if raise_error:
+                        raise RuntimeError(f"The {sequencing_name} sequencing list an invalid 'ALIGNMENT_CHUNKS'. It must be an integer greater or equal to 1.")
+                    else:
+                        print(f"The {sequencing_name} sequencing list an invalid 'ALIGNMENT_CHUNKS'. It must be an integer greater or equal to 1. Defaulting to 1.")
+                        cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["ALIGNMENT_CHUNKS"] = 1
+
+                # CHROM_ALIAS is optional: table associating the contig names of the bowtie2 reference to the names of the CHROM_SIZE file
+                if "CHROM_ALIAS" not in cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]:
+                    cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["CHROM_ALIAS"] = ""
+
+                # COVERAGE_BIN_SIZE is optional: size of the bins of the coverage tracks (1 for the base resolution)
+                if "COVERAGE_BIN_SIZE" not in cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]:
+                    cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["COVERAGE_BIN_SIZE"] = 1
+                elif not isinstance(cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["COVERAGE_BIN_SIZE"], int) or cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["COVERAGE_BIN_SIZE"] < 1:
+                    if raise_error:
+                        raise RuntimeError(f"The {sequencing_name} sequencing list an invalid 'COVERAGE_BIN_SIZE'. It must be an integer greater or equal to 1.")
+                    else:
+                        print(f"The {sequencing_name} sequencing list an invalid 'COVERAGE_BIN_SIZE'. It must be an integer greater or equal to 1. Defaulting to 1.")
+                        cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["COVERAGE_BIN_SIZE"] = 1
+
+                # COVERAGE_NORMALIZATION is optional: 'none' (fragment counts) or 'CPM' (counts per million of fragments)
+                if "COVERAGE_NORMALIZATION" not in cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]:
+                    cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["COVERAGE_NORMALIZATION"] = "none"
+                elif cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["COVERAGE_NORMALIZATION"] not in ["none", "CPM"]:
+                    if raise_error:
+                        raise RuntimeError(f"The {sequencing_name} sequencing list an invalid 'COVERAGE_NORMALIZATION'. Possible values are: none, CPM.")
+                    else:
+                        print(f"The {sequencing_name} sequencing list an invalid 'COVERAGE_NORMALIZATION'. Possible values are: none, CPM. Defaulting to none.")
+                        cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["COVERAGE_NORMALIZATION"] = "none"
+
+                # NAMESORT_BAM is optional: also create the filtered bam sorted by name (BAM/<sample>_filtered.namesort.bam), which is not used by the pipeline
+                if "NAMESORT_BAM" not in cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]:
+                    cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["NAMESORT_BAM"] = False
+                elif not isinstance(cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["NAMESORT_BAM"], bool):
+                    if raise_error:
+                        raise RuntimeError(f"The {sequencing_name} sequencing list an invalid 'NAMESORT_BAM'. It must be true or false.")
+                    else:
+                        print(f"The {sequencing_name} sequencing list an invalid 'NAMESORT_BAM'. It must be true or false. Defaulting to false.")
+                        cfg["SEQUENCINGS"][sequencing_name]["PARAMETERS"]["NAMESORT_BAM"] = False
+
                 # Parameters representing path are not optional
                 parameters_error="""
                 Each sequencing must have a parameters field to indicates at least:
@@ -922,6 +1046,15 @@ def check_config_format(cfg: dict, raise_error: bool = True):
                 else:
                     print(f"No minimal number of samples to consider peaks is indicated for the project {project_name}. Defaulting to 1. This will keep all peaks identified by macs!")
                     cfg["PROJECTS"][project_name]["MIN_SAMPLES_FOR_PEAKS"]=1
+                # GENOME_SIZE is optional: effective genome size given to macs callpeak (-g), a number or a shortcut of macs (hs, mm, ce, dm)
+                if "GENOME_SIZE" not in project_data or project_data["GENOME_SIZE"] in (None, ""):
+                    cfg["PROJECTS"][project_name]["GENOME_SIZE"] = "hs"
+                elif not (project_data["GENOME_SIZE"] in ["hs", "mm", "ce", "dm"] or str(project_data["GENOME_SIZE"]).replace("e", "", 1).replace(".", "", 1).isdigit()):
+                    if raise_error:
+                        raise RuntimeError(f"The 'GENOME_SIZE' of the project {project_name} must be a number or one of: hs, mm, ce, dm.")
+                    else:
+                        print(f"The 'GENOME_SIZE' of the project {project_name} must be a number or one of: hs, mm, ce, dm. Defaulting to hs.")
+                        cfg["PROJECTS"][project_name]["GENOME_SIZE"] = "hs"
                 if "PROJECT_PATH" not in project_data:
                     if raise_error:
                         raise RuntimeError(f"The project {project_name} don't have a 'PROJECT_PATH' field!")
@@ -0,0 +1,249 @@
+"""
+The contigs module of chromake contains functions to select the contigs kept by the pipeline and to rename and filter the contigs of a bam file.
+
+The contigs kept are read from the CHROM_SIZE file of the sequencing, so the pipeline isn't limited to the human chromosomes. The contig names of the bam (e.g. ensembl names such as '1' or 'MT') are converted to the names of the CHROM_SIZE file (e.g. UCSC names such as 'chr1' or 'chrM') with an optional alias table.
+
+"""
+import argparse
+import re
+from pathlib import Path
+
+import pysam
+
+EXCLUDED_CONTIGS = ["chrM", "MT", "M"]
+"""Contigs of the CHROM_SIZE file that are never kept (mitochondrial genome)."""
+
+EXCLUDED_CONTIG_PATTERN = re.compile(r"HG10|HG11|HG12|HG13|PATCH|HSCHR|chrKI|chrHS|chrKB|GL|chrJH|chrKL|chrAAB|NOVEL|KZ|KK|KV|KQ|KB|JH|KI|EBV|HLA|decoy")
+"""Patterns of the names of the contigs that are never kept even without a '_' (patches, ensembl and genbank scaffolds such as GL000220.1 or KI270728.1, Epstein-Barr virus, HLA and decoy contigs), the patterns removed by the previous versions of the pipeline."""
+
+
+def read_chrom_sizes(chrom_size_path: str) -> dict:
+    """
+    Read a chromosome size file (two columns: contig name and length).
+
+    Parameters
+    ----------
+    chrom_size_path : str
+        Path to the file indicated by the CHROM_SIZE parameter of a sequencing.
+
+    Returns
+    -------
+    :
+        A dict associating each contig to its length, in the order of the file.
+    """
+    sizes = {}
+    with open(chrom_size_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.split()
+            sizes[fields[0]] = int(fields[1])
+    return sizes
+
+
+def read_contig_aliases(alias_path: str) -> dict:
+    """
+    Read a contig alias table such as the chromAlias.txt files of UCSC.
+
+    The first column is the name used in the CHROM_SIZE file, the other columns are aliases of this contig (e.g. ensembl or genbank names). Lines starting with '#' are ignored.
+
+    Parameters
+    ----------
+    alias_path : str
+        Path to the tab-separated alias table.
+
+    Returns
+    -------
+    :
+        A dict associating each alias to the name used in the CHROM_SIZE file.
+    """
+    aliases = {}
+    with open(alias_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip() or line.startswith("#"):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            for alias in fields[1:]:
+                if alias:
+                    aliases[alias] = fields[0]
+    return aliases
+
+
+def get_allowed_contigs(chrom_size_path: str) -> list:
+    """
+    Get the contigs kept by the pipeline: the contigs of the CHROM_SIZE file except the mitochondrial genome, the alternative, unplaced, random and patch contigs (contigs with a '_' in their UCSC name), and the scaffolds, viral, HLA and decoy contigs (see EXCLUDED_CONTIG_PATTERN).
+
+    Parameters
+    ----------
+    chrom_size_path : str
+        Path to the file indicated by the CHROM_SIZE parameter of a sequencing.
+
+    Returns
+    -------
+    :
+        The list of the contigs to keep, in the order of the CHROM_SIZE file.
+    """
+    return [
+        contig for contig in read_chrom_sizes(chrom_size_path)
+        if "_" not in contig and contig not in EXCLUDED_CONTIGS and not EXCLUDED_CONTIG_PATTERN.search(contig)
+    ]
+
+
+def write_allowed_contigs(chrom_size_path: str, output_path: str) -> str:
+    """
+    Write the contigs kept by the pipeline in a file (one contig per line).
+
+    Parameters
+    ----------
+    chrom_size_path : str
+        Path to the file indicated by the CHROM_SIZE parameter of a sequencing.
+
+    output_path : str
+        Path of the file to write.
+
+    Returns
+    -------
+    str
+        Path to the written file.
+    """
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as fh:
+        for contig in get_allowed_contigs(chrom_size_path):
+            fh.write(contig + "\n")
+    return output_path
+
+
+def read_allowed_contigs(allowlist_path: str) -> list:
+    """
+    Read a file written by [](`genomake.pipelines.chromake.scripts.contigs.write_allowed_contigs`).
+    """
+    with open(allowlist_path, "r", encoding="utf-8") as fh:
+        return [line.strip() for line in fh if line.strip()]
+
+
+def build_contig_map(references: list, allowed: list, aliases: dict = None) -> dict:
+    """
+    Associate the contigs of a bam to their name in the CHROM_SIZE file.
+
+    Without alias table, a contig is renamed by adding a 'chr' prefix if needed ('1' -> 'chr1') and 'MT' is renamed 'chrM', like the previous reheader of the pipeline.
+
+    Parameters
+    ----------
+    references : list
+        Contig names of the bam header.
+
+    allowed : list
+        Contigs kept by the pipeline.
+
+    aliases : dict
+        Dict returned by [](`genomake.pipelines.chromake.scripts.contigs.read_contig_aliases`).
+
+    Returns
+    -------
+    :
+        A dict associating each kept contig of the bam to its new name. Contigs absent from the dict are removed.
+    """
+    allowed = set(allowed)
+    aliases = aliases or {}
+    contig_map = {}
+    for reference in references:
+        if reference in allowed:
+            contig_map[reference] = reference
+        elif aliases.get(reference) in allowed:
+            contig_map[reference] = aliases[reference]
+        elif "chr" + reference in allowed:
+            contig_map[reference] = "chr" + reference
+        elif reference == "MT" and "chrM" in allowed:
+            contig_map[reference] = "chrM"
+    if len(set(contig_map.values())) != len(contig_map):
+        raise RuntimeError("Several contigs of the bam are renamed to the same contig, check the alias table.")
+    return contig_map
+
+
+def rename_and_filter_bam(input_path: str,
+                          output_path: str,
+                          allowed: list,
+                          aliases: dict = None,
+                          threads: int = 1) -> int:
+    """
+    Rename the contigs of a coordinate-sorted bam and remove the reads outside of the allowed contigs in a single pass, then index the bam.
+
+    Reads whose mate is on a removed contig are also removed.
+
+    Parameters
+    ----------
+    input_path : str
+        Path to the coordinate-sorted bam.
+
+    output_path : str
+        Path of the bam to write.
+
+    allowed : list
+        Contigs kept by the pipeline (names of the CHROM_SIZE file).
+
+    aliases : dict
+        Dict returned by [](`genomake.pipelines.chromake.scripts.contigs.read_contig_aliases`).
+
+    threads : int
+        Number of threads used by htslib to decompress and compress the bam.
+
+    Returns
+    -------
+    int
+        The number of reads written.
+    """
+    threads = max(threads, 1)
+    n_reads = 0
+    with pysam.AlignmentFile(input_path, "rb", threads=threads) as bam_in:
+        contig_map = build_contig_map(list(bam_in.references), allowed, aliases)
+        if not contig_map:
+            raise RuntimeError(f"None of the contigs of {input_path} are in the CHROM_SIZE file.")
+        # Keep the order of the input header so the output stays coordinate-sorted
+        header = bam_in.header.to_dict()
+        header["SQ"] = [dict(sq, SN=contig_map[sq["SN"]]) for sq in header["SQ"] if sq["SN"] in contig_map]
+        new_ids = {}
+        for tid, reference in enumerate(bam_in.references):
+            if reference in contig_map:
+                new_ids[tid] = len(new_ids)
+
+        with pysam.AlignmentFile(output_path, "wb", header=header, threads=threads) as bam_out:
+            for read in bam_in.fetch(until_eof=True):
+                if read.reference_id not in new_ids:
+                    continue
+                if read.is_paired and not read.mate_is_unmapped and read.next_reference_id not in new_ids:
+                    continue
+                read.next_reference_id = new_ids.get(read.next_reference_id, -1)
+                read.reference_id = new_ids[read.reference_id]
+                bam_out.write(read)
+                n_reads += 1
+    pysam.index("-@", str(threads), output_path)
+    return n_reads
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Select the contigs kept by chromake and rename/filter the contigs of a bam."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    allowlist_parser = subparsers.add_parser("allowlist", help="Write the contigs kept by the pipeline.")
+    allowlist_parser.add_argument("--chrom-size", type=str, required=True, help="CHROM_SIZE file of the sequencing.")
+    allowlist_parser.add_argument("--output", "-o", type=str, required=True, help="File to write (one contig per line).")
+
+    filter_parser = subparsers.add_parser("filter-bam", help="Rename and filter the contigs of a coordinate-sorted bam.")
+    filter_parser.add_argument("--input", "-i", type=str, required=True, help="Coordinate-sorted bam.")
+    filter_parser.add_argument("--output", "-o", type=str, required=True, help="Bam to write (indexed).")
+    filter_parser.add_argument("--allowlist", type=str, required=True, help="File written by the allowlist command.")
+    filter_parser.add_argument("--aliases", type=str, default="", help="Optional contig alias table (UCSC chromAlias format).")
+    filter_parser.add_argument("--threads", "-@", type=int, default=1, help="Number of compression threads. Default to 1.")
+
+    args = parser.parse_args()
+    if args.command == "allowlist":
+        write_allowed_contigs(args.chrom_size, args.output)
+    else:
+        aliases = read_contig_aliases(args.aliases) if args.aliases else None
+        rename_and_filter_bam(args.input, args.output, read_allowed_contigs(args.allowlist), aliases, args.threads)
+
+
+if __name__ == "__main__":
+    main()
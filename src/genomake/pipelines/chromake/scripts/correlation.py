@@ -0,0 +1,437 @@
+"""
+The correlation module of chromake contains functions to compare the coverage of samples: the sample × bin coverage matrix, the Spearman correlation of the samples, their hierarchical clustering and the correlation heatmap.
+
+It replaces `multiBamSummary bins` and `plotCorrelation -c spearman -p heatmap` of deeptools. The coverage of each sample is read from its bin vector (see [](`genomake.pipelines.chromake.scripts.bins`)), computed once from its fragments, so the bams are never read again and any set of samples can be compared, including samples of different sequencings. The Spearman correlation is the Pearson correlation of the ranks of the bins: the ranks of each sample (average ranks for the ties) are centered and scaled to a unit norm, so the correlation matrix is the product of the scaled ranks by their transpose. All bins are used (like plotCorrelation without --skipZeros), so the ranks of a sample don't depend on the other samples: they are cached in a folder next to the outputs under a key computed from the bin vector, and only the ranks of the new samples are computed when samples are added. The products of the ranks of each pair of samples are cached in the same folder and only the pairs involving a new sample are computed (one matrix product per chunk of bins between the new samples and all samples). Each product is the sum of the same chunk products whatever the other samples, so it only differs from the one computed from scratch by the rounding of the matrix products (~1e-15), below the 6 decimals of the correlation matrix.
+
+The samples are clustered by average linkage on the 1 - correlation distance, and the heatmap shows the samples in the order of the leaves of the clustering. It is drawn with matplotlib.
+
+"""
+import argparse
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from genomake.pipelines.chromake.scripts.bins import BIN_DTYPE, read_bin_layout
+
+try:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+except ImportError:
+    plt = None
+
+CACHE_DIR_NAME = ".ranks"
+"""Folder of the cached ranks, next to the outputs."""
+
+PRODUCTS_FILE_NAME = "products.npz"
+"""File of the cached products of scaled ranks, in the folder of the cached ranks."""
+
+CHUNK_SIZE = 4096
+"""Number of bins of the chunks of scaled ranks multiplied at once to compute the correlation matrix (the products depend on it, it must not change between runs sharing a cache of products)."""
+
+
+def _layout_path(vector_path: str) -> str:
+    return vector_path[:-len(".npy")] + ".tsv" if vector_path.endswith(".npy") else vector_path + ".tsv"
+
+
+def average_ranks(values: np.ndarray) -> np.ndarray:
+    """
+    Rank values, ties receiving the average of their ranks (like `scipy.stats.rankdata`).
+
+    Parameters
+    ----------
+    values : np.ndarray
+        1D array of values.
+
+    Returns
+    -------
+    np.ndarray
+        The ranks of the values (float64, from 1).
+    """
+    order = np.argsort(values, kind="stable")
+    sorted_values = values[order]
+    boundaries = np.flatnonzero(sorted_values[1:] != sorted_values[:-1]) + 1
+    starts = np.concatenate([[0], boundaries])
+    ends = np.concatenate([boundaries, [len(values)]])
+    ranks = np.empty(len(values), dtype=np.float64)
+    ranks[order] = np.repeat((starts + ends + 1) / 2, ends - starts)
+    return ranks
+
+
+def scaled_ranks(vector: np.ndarray) -> np.ndarray:
+    """
+    Compute the centered ranks of a bin vector scaled to a unit norm (zeros if all bins have the same value).
+
+    Parameters
+    ----------
+    vector : np.ndarray
+        Bin vector of a sample.
+
+    Returns
+    -------
+    np.ndarray
+        The scaled ranks (float64), whose dot product with the scaled ranks of another sample is their Spearman correlation.
+    """
+    ranks = average_ranks(np.asarray(vector))
+    ranks -= ranks.mean() if len(ranks) else 0
+    norm = np.sqrt(np.dot(ranks, ranks))
+    return ranks / norm if norm > 0 else ranks
+
+
+def get_rank_key(vector_path: str) -> str:
+    """
+    Get the cache key of the ranks of a sample.
+
+    Parameters
+    ----------
+    vector_path : str
+        Path to the bin vector of the sample (.npy).
+
+    Returns
+    -------
+    str
+        The sha256 of the path, size and modification time of the bin vector.
+    """
+    stat = os.stat(vector_path)
+    identity = f"{os.path.abspath(vector_path)}\n{stat.st_size}\n{stat.st_mtime_ns}"
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+def _cache_ranks(vector_path: str, cache_path: str) -> None:
+    ranks = scaled_ranks(np.load(vector_path, mmap_mode="r"))
+    tmp_path = f"{cache_path[:-len('.npy')]}.{os.getpid()}.tmp.npy"
+    np.save(tmp_path, ranks)
+    os.replace(tmp_path, cache_path)
+
+
+def spearman_correlation(rank_paths: list, known: np.ndarray = None) -> np.ndarray:
+    """
+    Compute the Spearman correlation matrix of samples from their cached scaled ranks.
+
+    Parameters
+    ----------
+    rank_paths : list
+        Paths to the scaled ranks of the samples (.npy files written by [](`genomake.pipelines.chromake.scripts.correlation.scaled_ranks`)).
+
+    known : np.ndarray
+        Products of scaled ranks already computed (NaN for the pairs to compute), as returned by [](`genomake.pipelines.chromake.scripts.correlation.read_cached_products`). Default to None (all pairs are computed).
+
+    Returns
+    -------
+    np.ndarray
+        The correlation matrix (NaN for the samples whose bins all have the same value).
+    """
+    products = compute_products(rank_paths, known)
+    ranks = [np.load(path, mmap_mode="r") for path in rank_paths]
+    constant = np.array([not np.any(r) for r in ranks], dtype=bool)
+    correlation = np.clip(products, -1.0, 1.0)
+    correlation[constant, :] = np.nan
+    correlation[:, constant] = np.nan
+    return correlation
+
+
+def compute_products(rank_paths: list, known: np.ndarray = None) -> np.ndarray:
+    """
+    Compute the products of the scaled ranks of each pair of samples.
+
+    Each product is the sum, in the order of the bins, of the products of the chunks of CHUNK_SIZE bins of the two samples. The samples with a pair to compute are multiplied by all samples (one matrix product per chunk), and the product of a pair is only written once (by the first of its samples to compute, the other value is the same product), so the products of a previous comparison can be reused for the pairs of samples already compared. For a fixed CHUNK_SIZE, the result only differs from the computation of all pairs by the rounding of the matrix products (~1e-15).
+
+    Parameters
+    ----------
+    rank_paths : list
+        Paths to the scaled ranks of the samples.
+
+    known : np.ndarray
+        Products already computed (NaN for the pairs to compute). Default to None (all pairs are computed).
+
+    Returns
+    -------
+    np.ndarray
+        The matrix of the products.
+    """
+    n = len(rank_paths)
+    products = np.full((n, n), np.nan, dtype=np.float64) if known is None else np.array(known, dtype=np.float64)
+    new = np.flatnonzero(np.isnan(products).any(axis=1))
+    if len(new) == 0:
+        return products
+    ranks = [np.load(path, mmap_mode="r") for path in rank_paths]
+    n_bins = len(ranks[0])
+    sums = np.zeros((len(new), n), dtype=np.float64)
+    # chunks of bins, so only one chunk of the ranks of all samples is in memory at once
+    for start in range(0, n_bins, CHUNK_SIZE):
+        chunk = np.vstack([r[start:start + CHUNK_SIZE] for r in ranks])
+        sums += chunk[new] @ chunk.T
+    for row, i in enumerate(new):
+        missing = np.isnan(products[i])
+        products[i, missing] = sums[row, missing]
+        products[missing, i] = sums[row, missing]
+    return products
+
+
+def read_cached_products(cache_path: str, keys: list) -> np.ndarray:
+    """
+    Read the products of scaled ranks cached by a previous comparison.
+
+    Parameters
+    ----------
+    cache_path : str
+        Path to the cached products (.npz file with the keys of the ranks of the samples and the matrix of their products).
+
+    keys : list
+        Keys of the ranks of the samples to compare (see [](`genomake.pipelines.chromake.scripts.correlation.get_rank_key`)).
+
+    Returns
+    -------
+    np.ndarray
+        The matrix of the products of the samples, NaN for the pairs that are not in the cache.
+    """
+    known = np.full((len(keys), len(keys)), np.nan, dtype=np.float64)
+    if not os.path.exists(cache_path):
+        return known
+    with np.load(cache_path) as cache:
+        cached_keys = [str(key) for key in cache["keys"]]
+        cached_products = cache["products"]
+    position = {key: index for index, key in enumerate(cached_keys)}
+    found = [(row, position[key]) for row, key in enumerate(keys) if key in position]
+    if found:
+        rows, cached_rows = (np.array(values) for values in zip(*found))
+        known[np.ix_(rows, rows)] = cached_products[np.ix_(cached_rows, cached_rows)]
+    return known
+
+
+def write_cached_products(cache_path: str, keys: list, products: np.ndarray) -> None:
+    """
+    Write the products of scaled ranks of the compared samples, to be reused by the next comparison.
+
+    Parameters
+    ----------
+    cache_path : str
+        Path of the .npz file to write.
+
+    keys : list
+        Keys of the ranks of the samples.
+
+    products : np.ndarray
+        Matrix of the products of the samples.
+    """
+    tmp_path = f"{cache_path[:-len('.npz')]}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, keys=np.array(keys), products=products)
+    os.replace(tmp_path, cache_path)
+
+
+def cluster_order(correlation: np.ndarray) -> list:
+    """
+    Cluster samples by average linkage on the 1 - correlation distance.
+
+    Parameters
+    ----------
+    correlation : np.ndarray
+        Correlation matrix of the samples (the NaN are treated as no correlation).
+
+    Returns
+    -------
+    list
+        The indexes of the samples in the order of the leaves of the clustering.
+    """
+    n = len(correlation)
+    distances = 1.0 - np.nan_to_num(correlation, nan=0.0)
+    np.fill_diagonal(distances, np.inf)
+    clusters = [[index] for index in range(n)]
+    active = np.ones(n, dtype=bool)
+    for _ in range(n - 1):
+        masked = np.where(active[:, None] & active[None, :], distances, np.inf)
+        i, j = divmod(int(np.argmin(masked)), n)
+        i, j = min(i, j), max(i, j)
+        # average distance of the merged cluster, weighted by the size of the two clusters
+        size_i, size_j = len(clusters[i]), len(clusters[j])
+        merged = (distances[i] * size_i + distances[j] * size_j) / (size_i + size_j)
+        distances[i, :] = merged
+        distances[:, i] = merged
+        distances[i, i] = np.inf
+        clusters[i] = clusters[i] + clusters[j]
+        active[j] = False
+    return clusters[0] if n else []
+
+
+def write_correlation_matrix(correlation: np.ndarray, labels: list, output: str) -> None:
+    """
+    Write a correlation matrix as a tab-separated file (samples as rows and columns, in the order of labels).
+
+    Parameters
+    ----------
+    correlation : np.ndarray
+        Correlation matrix.
+
+    labels : list
+        Names of the samples.
+
+    output : str
+        Path of the file to write.
+    """
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as fh:
+        fh.write("SAMPLE\t" + "\t".join(labels) + "\n")
+        for label, row in zip(labels, correlation.tolist()):
+            fh.write(label + "\t" + "\t".join("nan" if value != value else f"{value:.6f}" for value in row) + "\n")
+
+
+def plot_correlation(correlation: np.ndarray, labels: list, order: list, output: str) -> None:
+    """
+    Draw the heatmap of a correlation matrix, with the samples in the order of their clustering.
+
+    Parameters
+    ----------
+    correlation : np.ndarray
+        Correlation matrix.
+
+    labels : list
+        Names of the samples.
+
+    order : list
+        Order of the samples in the heatmap (see [](`genomake.pipelines.chromake.scripts.correlation.cluster_order`)).
+
+    output : str
+        Path of the image to write.
+    """
+    if plt is None:
+        raise RuntimeError("matplotlib is needed to draw the correlation heatmap.")
+    size = max(6.0, 0.3 * len(labels) + 3)
+    figure, axis = plt.subplots(figsize=(size, size))
+    image = axis.imshow(correlation[np.ix_(order, order)], cmap="RdYlBu", interpolation="nearest")
+    axis.set_xticks(range(len(order)))
+    axis.set_yticks(range(len(order)))
+    axis.set_xticklabels([labels[index] for index in order], rotation=90)
+    axis.set_yticklabels([labels[index] for index in order])
+    axis.set_title("Spearman correlation of the binned coverage")
+    figure.colorbar(image, ax=axis, fraction=0.046, pad=0.04)
+    figure.tight_layout()
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    figure.savefig(output, dpi=100)
+    plt.close(figure)
+
+
+def write_coverage_matrix(vector_paths: list, output: str) -> tuple:
+    """
+    Write the sample × bin coverage matrix of samples as a .npy file (one row per sample, in the order of vector_paths).
+
+    Parameters
+    ----------
+    vector_paths : list
+        Bin vectors of the samples (.npy), with the same layout.
+
+    output : str
+        Path of the .npy file to write.
+
+    Returns
+    -------
+    tuple
+        The shape of the matrix.
+    """
+    n_bins = len(np.load(vector_paths[0], mmap_mode="r")) if vector_paths else 0
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    tmp_output = output[:-len(".npy")] + ".tmp.npy" if output.endswith(".npy") else output + ".tmp.npy"
+    # the vectors are copied in a memory-mapped array, so the matrix is never held in memory
+    matrix = np.lib.format.open_memmap(tmp_output, mode="w+", dtype=BIN_DTYPE, shape=(len(vector_paths), n_bins))
+    for row, path in enumerate(vector_paths):
+        matrix[row] = np.load(path, mmap_mode="r")
+    matrix.flush()
+    del matrix
+    os.replace(tmp_output, output)
+    return len(vector_paths), n_bins
+
+
+def compare_samples(vector_paths: list,
+                    labels: list,
+                    matrix_output: str,
+                    correlation_output: str,
+                    plot_output: str,
+                    threads: int = 1,
+                    cache_dir: str = None) -> dict:
+    """
+    Write the coverage matrix, the Spearman correlation matrix and the correlation heatmap of samples.
+
+    Parameters
+    ----------
+    vector_paths : list
+        Bin vectors of the samples (.npy), with the same layout (see [](`genomake.pipelines.chromake.scripts.bins`)).
+
+    labels : list
+        Names of the samples, in the order of vector_paths.
+
+    matrix_output : str
+        Path of the sample × bin coverage matrix (.npy) to write.
+
+    correlation_output : str
+        Path of the correlation matrix (.tsv) to write.
+
+    plot_output : str
+        Path of the heatmap (.png) to write.
+
+    threads : int
+        Number of samples ranked in parallel.
+
+    cache_dir : str
+        Folder of the cached ranks and products of ranks. Default to <folder of the correlation matrix>/.ranks. The ranks and products of the samples that are not compared anymore are removed.
+
+    Returns
+    -------
+    dict
+        The number of samples, of bins, of samples ranked and of pairs of samples compared (not found in the cache).
+    """
+    if len(labels) != len(vector_paths):
+        raise RuntimeError("The number of labels and of bin vectors must be identical.")
+    if len(set(labels)) != len(labels):
+        raise RuntimeError("The labels of the samples must be unique.")
+    layouts = [read_bin_layout(_layout_path(path)) for path in vector_paths]
+    if any(layout != layouts[0] for layout in layouts[1:]):
+        raise RuntimeError("The bin vectors don't have the same layout (different genomes or bin sizes), they can't be compared.")
+    if cache_dir is None:
+        cache_dir = str(Path(correlation_output).parent / CACHE_DIR_NAME)
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    rank_paths = [str(Path(cache_dir) / (get_rank_key(path) + ".npy")) for path in vector_paths]
+
+    missing = {path: vector for vector, path in zip(vector_paths, rank_paths) if not os.path.exists(path)}
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(min(threads, len(missing)), 1)) as pool:
+            list(pool.map(_cache_ranks, missing.values(), missing.keys()))
+
+    keys = [Path(path).stem for path in rank_paths]
+    products_path = str(Path(cache_dir) / PRODUCTS_FILE_NAME)
+    known = read_cached_products(products_path, keys)
+    computed = int(np.isnan(known[np.triu_indices(len(keys))]).sum())
+    products = compute_products(rank_paths, known)
+    write_cached_products(products_path, keys, products)
+    correlation = spearman_correlation(rank_paths, products)
+    shape = write_coverage_matrix(vector_paths, matrix_output)
+    write_correlation_matrix(correlation, labels, correlation_output)
+    plot_correlation(correlation, labels, cluster_order(correlation), plot_output)
+
+    # the ranks of the samples removed from the comparison are not kept
+    used = {Path(path).name for path in rank_paths}
+    for path in Path(cache_dir).glob("*.npy"):
+        if path.name not in used:
+            path.unlink(missing_ok=True)
+    return {"SAMPLES": shape[0], "BINS": shape[1], "RANKED": len(missing), "PAIRS": computed}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the coverage of samples from their bin vectors: sample x bin coverage matrix, Spearman correlation matrix and correlation heatmap."
+    )
+    parser.add_argument("-i", "--inputs", type=str, nargs="+", required=True, help="Bin vectors of the samples (BINS/<sample>.npy).")
+    parser.add_argument("--labels", type=str, nargs="+", required=True, help="Names of the samples, in the order of --inputs.")
+    parser.add_argument("--matrix", type=str, required=True, help="Sample x bin coverage matrix (.npy) to write.")
+    parser.add_argument("--correlation", type=str, required=True, help="Spearman correlation matrix (.tsv) to write.")
+    parser.add_argument("--plot", type=str, required=True, help="Correlation heatmap (.png) to write.")
+    parser.add_argument("--cache-dir", type=str, default=None, help=f"Folder of the cached ranks. Default to {CACHE_DIR_NAME} in the folder of the correlation matrix.")
+    parser.add_argument("-@", "--threads", type=int, default=1, help="Number of samples ranked in parallel. Default to 1.")
+    args = parser.parse_args()
+    result = compare_samples(args.inputs, args.labels, args.matrix, args.correlation, args.plot, args.threads, args.cache_dir)
+    print(f"{result['SAMPLES']} samples x {result['BINS']} bins compared ({result['RANKED']} ranked and {result['PAIRS']} pairs computed, the others read from the cache).")
+
+
+if __name__ == "__main__":
+    main()
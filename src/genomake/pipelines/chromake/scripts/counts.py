@@ -0,0 +1,283 @@
+"""
+The counts module of chromake contains functions to count the fragments of the samples of a project in its consensus peaks and to write the peak × sample count matrix.
+
+The fragments of each sample are read from its memory-mapped fragment store (see [](`genomake.pipelines.chromake.scripts.fragment_store`)). On each chromosome, the number of fragments overlapping a peak is the number of fragments starting before its end minus the number of fragments ending before its start, both given by `np.searchsorted` on the sorted starts and ends of the chromosome. The samples are counted in parallel by a process pool, each process holding the fragments of a single chromosome of a sample at a time.
+
+The count matrix is written as a sparse matrix in compressed sparse column format (`<prefix>.npz`, in the layout of `scipy.sparse.save_npz`, readable with `scipy.sparse.load_npz`), with the peaks as rows (`<prefix>.peaks.tsv`) and the samples as columns (`<prefix>.samples.tsv`). The column of each sample is cached in a folder next to the matrix under a key computed from the consensus peaks and from the fragment store of the sample, so when samples are added to a project whose consensus peaks don't change, only the new columns are counted.
+
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from genomake.pipelines.chromake.scripts.fragment_store import open_fragment_store
+
+COUNT_DTYPE = np.int32
+"""Type of the counts of the matrix."""
+
+CACHE_DIR_NAME = ".columns"
+"""Folder of the cached columns, next to the matrix."""
+
+_PEAKS = None
+"""Peaks of each chromosome, set in the processes of the pool by their initializer."""
+
+
+def get_count_matrix_paths(prefix: str) -> list:
+    """
+    Get the files of a count matrix.
+
+    Parameters
+    ----------
+    prefix : str
+        Path of the matrix without extension (e.g. <PROJECT_PATH>/counts/counts_<project>).
+
+    Returns
+    -------
+    list
+        The paths of the sparse matrix (<prefix>.npz), of the peaks (<prefix>.peaks.tsv) and of the samples (<prefix>.samples.tsv).
+    """
+    return [f"{prefix}.npz", f"{prefix}.peaks.tsv", f"{prefix}.samples.tsv"]
+
+
+def read_consensus_peaks(path: str):
+    """
+    Read the peaks of a bed file (such as the consensus peaks of a project).
+
+    Parameters
+    ----------
+    path : str
+        Path to the bed file (chrom, start, end and optionally a name in the fourth column).
+
+    Returns
+    -------
+    :
+        The list of the bed lines (split in fields), and a dict associating each chromosome to the (rows, starts, ends) arrays of its peaks.
+    """
+    rows = []
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) < 4:
+                fields.append(f"{fields[0]}:{fields[1]}-{fields[2]}")
+            rows.append(fields)
+    by_chrom = {}
+    for row, fields in enumerate(rows):
+        by_chrom.setdefault(fields[0], []).append((row, int(fields[1]), int(fields[2])))
+    peaks = {}
+    for chrom, chrom_peaks in by_chrom.items():
+        array = np.array(chrom_peaks, dtype=np.int64).reshape(-1, 3)
+        peaks[chrom] = (array[:, 0], array[:, 1], array[:, 2])
+    return rows, peaks
+
+
+def count_fragments(starts: np.ndarray, ends: np.ndarray, peak_starts: np.ndarray, peak_ends: np.ndarray) -> np.ndarray:
+    """
+    Count the fragments overlapping each peak of a chromosome.
+
+    Parameters
+    ----------
+    starts, ends : np.ndarray
+        Fragments of the chromosome, sorted by start (0-based, half-open).
+
+    peak_starts, peak_ends : np.ndarray
+        Peaks of the chromosome (0-based, half-open).
+
+    Returns
+    -------
+    np.ndarray
+        The number of fragments overlapping each peak (a fragment overlapping two peaks is counted in both).
+    """
+    # a fragment ending before the start of a peak also starts before its end
+    started = np.searchsorted(starts, peak_ends, side="left")
+    ended = np.searchsorted(np.sort(ends), peak_starts, side="right")
+    return (started - ended).astype(COUNT_DTYPE)
+
+
+def _init_worker(peaks: dict) -> None:
+    global _PEAKS
+    _PEAKS = peaks
+
+
+def _count_column(fragments: str, cache_path: str) -> tuple:
+    """
+    Count the fragments of a sample in all peaks and write its column in the cache. Run in the processes of the pool.
+    """
+    store = open_fragment_store(fragments[:-len(".npy")] if fragments.endswith(".npy") else fragments)
+    rows = []
+    counts = []
+    total = 0
+    for chrom, (starts, ends) in store.items():
+        total += len(starts)
+        if chrom not in _PEAKS or len(starts) == 0:
+            continue
+        peak_rows, peak_starts, peak_ends = _PEAKS[chrom]
+        chrom_counts = count_fragments(starts, ends, peak_starts, peak_ends)
+        covered = chrom_counts > 0
+        rows.append(peak_rows[covered])
+        counts.append(chrom_counts[covered])
+    rows = np.concatenate(rows).astype(np.int32) if rows else np.zeros(0, dtype=np.int32)
+    counts = np.concatenate(counts) if counts else np.zeros(0, dtype=COUNT_DTYPE)
+    order = np.argsort(rows, kind="stable")
+    meta = np.array([len(rows), total, int(counts.sum(dtype=np.int64))], dtype=np.int64)
+    _write_column(cache_path, rows[order], counts[order], meta)
+    return tuple(meta)
+
+
+def _write_column(path: str, rows: np.ndarray, counts: np.ndarray, meta: np.ndarray) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path[:-len('.npz')]}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, rows=rows, counts=counts, meta=meta)
+    os.replace(tmp_path, path)
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_column_key(peaks_digest: str, fragments: str) -> str:
+    """
+    Get the cache key of the column of a sample.
+
+    Parameters
+    ----------
+    peaks_digest : str
+        sha256 of the peak file.
+
+    fragments : str
+        Path to the fragment store of the sample (.npy).
+
+    Returns
+    -------
+    str
+        The sha256 of the peaks digest and of the path, size and modification time of the fragment store.
+    """
+    stat = os.stat(fragments)
+    identity = f"{peaks_digest}\n{os.path.abspath(fragments)}\n{stat.st_size}\n{stat.st_mtime_ns}"
+    return hashlib.sha256(identity.encode()).hexdigest()
+
+
+def build_count_matrix(peaks_path: str,
+                       columns: list,
+                       fragments: list,
+                       prefix: str,
+                       threads: int = 1,
+                       cache_dir: str = None) -> dict:
+    """
+    Count the fragments of samples in peaks and write the sparse count matrix with its row and column metadata.
+
+    Parameters
+    ----------
+    peaks_path : str
+        Bed file of the peaks (rows of the matrix).
+
+    columns : list
+        Names of the samples (columns of the matrix).
+
+    fragments : list
+        Fragment stores of the samples (.npy files), in the order of columns.
+
+    prefix : str
+        Path of the matrix without extension (see [](`genomake.pipelines.chromake.scripts.counts.get_count_matrix_paths`)).
+
+    threads : int
+        Number of samples counted in parallel.
+
+    cache_dir : str
+        Folder of the cached columns. Default to <folder of the matrix>/.columns. The columns of the previous peak sets are removed.
+
+    Returns
+    -------
+    dict
+        The number of peaks, of samples, of samples counted (not found in the cache) and of non-zero counts.
+    """
+    if len(columns) != len(fragments):
+        raise RuntimeError("The number of column names and of fragment stores must be identical.")
+    if len(set(columns)) != len(columns):
+        raise RuntimeError("The column names of the count matrix must be unique.")
+    matrix_path, peaks_output, samples_output = get_count_matrix_paths(prefix)
+    if cache_dir is None:
+        cache_dir = str(Path(matrix_path).parent / CACHE_DIR_NAME)
+    peak_rows, peaks = read_consensus_peaks(peaks_path)
+    peaks_digest = _file_digest(peaks_path)
+    column_cache = Path(cache_dir) / peaks_digest[:16]
+    cache_paths = [str(column_cache / (get_column_key(peaks_digest, path) + ".npz")) for path in fragments]
+
+    missing = [index for index, path in enumerate(cache_paths) if not os.path.exists(path)]
+    if missing:
+        with ProcessPoolExecutor(max_workers=max(min(threads, len(missing)), 1), initializer=_init_worker, initargs=(peaks,)) as pool:
+            list(pool.map(_count_column, [fragments[index] for index in missing], [cache_paths[index] for index in missing]))
+
+    metas = []
+    for path in cache_paths:
+        with np.load(path) as column:
+            metas.append(column["meta"])
+    metas = np.array(metas, dtype=np.int64).reshape(-1, 3)
+    indptr = np.concatenate([[0], np.cumsum(metas[:, 0])]).astype(np.int64)
+
+    # the columns are copied in memory-mapped arrays, so the matrix is never held in memory
+    Path(matrix_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".counts_", dir=Path(matrix_path).parent)
+    try:
+        data = np.lib.format.open_memmap(os.path.join(tmp_dir, "data.npy"), mode="w+", dtype=COUNT_DTYPE, shape=(int(indptr[-1]),))
+        indices = np.lib.format.open_memmap(os.path.join(tmp_dir, "indices.npy"), mode="w+", dtype=np.int32, shape=(int(indptr[-1]),))
+        for index, path in enumerate(cache_paths):
+            with np.load(path) as column:
+                indices[indptr[index]:indptr[index + 1]] = column["rows"]
+                data[indptr[index]:indptr[index + 1]] = column["counts"]
+        tmp_matrix = os.path.join(tmp_dir, "matrix.npz")
+        np.savez(
+            tmp_matrix, format=np.array("csc"), shape=np.array([len(peak_rows), len(columns)], dtype=np.int64),
+            data=data, indices=indices, indptr=indptr,
+        )
+        del data, indices
+        os.replace(tmp_matrix, matrix_path)
+    finally:
+        for name in ("data.npy", "indices.npy", "matrix.npz"):
+            Path(tmp_dir, name).unlink(missing_ok=True)
+        os.rmdir(tmp_dir)
+
+    with open(peaks_output, "w", encoding="utf-8") as fh:
+        fh.write("PEAK\tCHROM\tSTART\tEND\n")
+        fh.writelines(f"{fields[3]}\t{fields[0]}\t{fields[1]}\t{fields[2]}\n" for fields in peak_rows)
+    with open(samples_output, "w", encoding="utf-8") as fh:
+        fh.write("SAMPLE\tFRAGMENTS\tTOTAL_FRAGMENTS\tCOUNTS_IN_PEAKS\tFRIP\n")
+        for column, path, (_, total, in_peaks) in zip(columns, fragments, metas.tolist()):
+            fh.write(f"{column}\t{path}\t{total}\t{in_peaks}\t{round(in_peaks / total, 4) if total else 0}\n")
+
+    # the columns of other peak sets can't be reused
+    for other in Path(cache_dir).iterdir():
+        if other.is_dir() and other != column_cache:
+            for path in other.iterdir():
+                path.unlink(missing_ok=True)
+            other.rmdir()
+    return {"PEAKS": len(peak_rows), "SAMPLES": len(columns), "COUNTED": len(missing), "NON_ZERO": int(indptr[-1])}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Count the fragments of samples in peaks and write the sparse peak x sample count matrix (<prefix>.npz, <prefix>.peaks.tsv and <prefix>.samples.tsv)."
+    )
+    parser.add_argument("--peaks", type=str, required=True, help="Bed file of the peaks (rows of the matrix).")
+    parser.add_argument("--columns", type=str, nargs="+", required=True, help="Names of the samples (columns of the matrix).")
+    parser.add_argument("--fragments", type=str, nargs="+", required=True, help="Fragment stores of the samples (FRAGMENTS/<sample>.npy), in the order of --columns.")
+    parser.add_argument("-o", "--prefix", type=str, required=True, help="Path of the matrix without extension.")
+    parser.add_argument("--cache-dir", type=str, default=None, help=f"Folder of the cached columns. Default to {CACHE_DIR_NAME} in the folder of the matrix.")
+    parser.add_argument("-@", "--threads", type=int, default=1, help="Number of samples counted in parallel. Default to 1.")
+    args = parser.parse_args()
+    result = build_count_matrix(args.peaks, args.columns, args.fragments, args.prefix, args.threads, args.cache_dir)
+    print(f"{result['PEAKS']} peaks x {result['SAMPLES']} samples ({result['COUNTED']} counted, the others read from the cache), {result['NON_ZERO']} non-zero counts.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+The coverage module of chromake contains functions to compute the coverage of the samples by their fragments and to write it as a bigWig file (BEDGRAPH/<sample>.bw).
+
+The coverage of a chromosome is computed in memory from its sorted fragments with numpy (cumulative sum of the +1/-1 at the fragment boundaries), optionally averaged in bins of fixed size and scaled to counts per million of fragments (CPM). The bigWig is written directly with pyBigWig when it is installed; otherwise a temporary bedGraph is converted with bedGraphToBigWig.
+
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from genomake.pipelines.chromake.scripts.contigs import read_chrom_sizes
+from genomake.pipelines.chromake.scripts.fragment_store import open_fragment_store, read_fragment_index
+
+try:
+    import pyBigWig
+except ImportError:
+    pyBigWig = None
+
+NORMALIZATIONS = ["none", "CPM"]
+"""Normalizations of the coverage: raw fragment counts or counts per million of fragments."""
+
+WRITE_CHUNK = 1_000_000
+"""Number of intervals written at once in the bigWig (or bedGraph) file."""
+
+
+def fragment_coverage(starts: np.ndarray, ends: np.ndarray):
+    """
+    Compute the coverage of a chromosome by its fragments, merging the adjacent positions of same depth (like `bedtools genomecov -bg`).
+
+    Parameters
+    ----------
+    starts, ends : np.ndarray
+        Fragments of a chromosome.
+
+    Returns
+    -------
+    :
+        Three arrays (starts, ends, depth) of the intervals with a non-null coverage.
+    """
+    if len(starts) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    positions, inverse = np.unique(np.concatenate([starts, ends]), return_inverse=True)
+    deltas = np.bincount(inverse, weights=np.concatenate([np.ones(len(starts)), -np.ones(len(ends))])).astype(np.int64)
+    changed = deltas != 0
+    positions = positions[changed]
+    depth = np.cumsum(deltas[changed])
+    interval_starts = positions[:-1]
+    interval_ends = positions[1:]
+    depth = depth[:-1]
+    covered = depth > 0
+    return interval_starts[covered], interval_ends[covered], depth[covered]
+
+
+def _merge_runs(starts: np.ndarray, ends: np.ndarray, values: np.ndarray):
+    """
+    Remove the intervals of null value and merge the contiguous intervals of same value.
+    """
+    kept = values != 0
+    starts, ends, values = starts[kept], ends[kept], values[kept]
+    if len(starts) == 0:
+        return starts, ends, values
+    new_run = np.ones(len(starts), dtype=bool)
+    new_run[1:] = (starts[1:] != ends[:-1]) | (values[1:] != values[:-1])
+    run_starts = np.flatnonzero(new_run)
+    run_ends = np.append(run_starts[1:], len(starts)) - 1
+    return starts[run_starts], ends[run_ends], values[run_starts]
+
+
+def bin_coverage(starts: np.ndarray,
+                 ends: np.ndarray,
+                 depth: np.ndarray,
+                 chrom_size: int,
+                 bin_size: int):
+    """
+    Average the coverage of a chromosome in bins of fixed size.
+
+    Parameters
+    ----------
+    starts, ends, depth : np.ndarray
+        Intervals returned by [](`genomake.pipelines.chromake.scripts.coverage.fragment_coverage`).
+
+    chrom_size : int
+        Length of the chromosome (the last bin ends at the end of the chromosome).
+
+    bin_size : int
+        Size of the bins in bp.
+
+    Returns
+    -------
+    :
+        Three arrays (starts, ends, mean depth) of the bins with a non-null coverage, the contiguous bins of same value being merged.
+    """
+    edges = np.append(np.arange(0, chrom_size, bin_size, dtype=np.int64), chrom_size)
+    if len(starts) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0, dtype=np.float64)
+    # area under the coverage from the start of the chromosome to each bin edge
+    cumulative = np.concatenate([[0], np.cumsum(depth * (ends - starts))])
+    interval = np.searchsorted(starts, edges, side="right") - 1
+    inside = np.clip(edges - starts[np.maximum(interval, 0)], 0, (ends - starts)[np.maximum(interval, 0)])
+    area = np.where(interval >= 0, cumulative[np.maximum(interval, 0)] + depth[np.maximum(interval, 0)] * inside, 0)
+    values = np.diff(area) / np.diff(edges)
+    return _merge_runs(edges[:-1], edges[1:], values)
+
+
+def chromosome_coverage(starts: np.ndarray,
+                        ends: np.ndarray,
+                        chrom_size: int,
+                        bin_size: int = 1):
+    """
+    Compute the coverage track of a chromosome.
+
+    Parameters
+    ----------
+    starts, ends : np.ndarray
+        Fragments of the chromosome.
+
+    chrom_size : int
+        Length of the chromosome.
+
+    bin_size : int
+        Size of the bins in bp. With 1, the coverage is given at base resolution.
+
+    Returns
+    -------
+    :
+        Three arrays (starts, ends, values) of the intervals with a non-null coverage.
+    """
+    coverage = fragment_coverage(starts, ends)
+    if bin_size > 1:
+        return bin_coverage(*coverage, chrom_size, bin_size)
+    return coverage
+
+
+def get_scale_factor(n_fragments: int, normalization: str = "none") -> float:
+    """
+    Get the factor applied to the coverage of a sample.
+
+    Parameters
+    ----------
+    n_fragments : int
+        Number of fragments of the sample.
+
+    normalization : str
+        One of NORMALIZATIONS.
+
+    Returns
+    -------
+    float
+        1 without normalization, the number of million of fragments for CPM.
+    """
+    if normalization not in NORMALIZATIONS:
+        raise RuntimeError(f"Unknown coverage normalization '{normalization}'. Possible values are: {', '.join(NORMALIZATIONS)}.")
+    if normalization == "CPM" and n_fragments > 0:
+        return 1e6 / n_fragments
+    return 1.0
+
+
+def write_bigwig(bigwig_path: str, chrom_sizes: list, tracks, scale: float = 1.0, tmp_dir: str = None) -> None:
+    """
+    Write coverage tracks in a bigWig file.
+
+    Parameters
+    ----------
+    bigwig_path : str
+        Path of the bigWig to write.
+
+    chrom_sizes : list
+        List of (chromosome, length) in the order of the tracks.
+
+    tracks
+        Iterable of (chromosome, starts, ends, values), one per chromosome, in the order of `chrom_sizes`.
+
+    scale : float
+        Factor applied to the values.
+
+    tmp_dir : str
+        Folder of the temporary bedGraph used when pyBigWig isn't installed. Default to the folder of the bigWig.
+    """
+    if pyBigWig is not None:
+        bw = pyBigWig.open(bigwig_path, "w")
+        try:
+            bw.addHeader([(chrom, int(size)) for chrom, size in chrom_sizes])
+            for chrom, starts, ends, values in tracks:
+                values = values * scale if scale != 1 else values
+                for first in range(0, len(starts), WRITE_CHUNK):
+                    last = first + WRITE_CHUNK
+                    bw.addEntries(
+                        [chrom] * len(starts[first:last]),
+                        starts[first:last].tolist(),
+                        ends=ends[first:last].tolist(),
+                        values=values[first:last].astype(np.float64).tolist()
+                    )
+        finally:
+            bw.close()
+        return
+
+    # fallback: temporary bedGraph converted by bedGraphToBigWig
+    tmp_dir = tempfile.mkdtemp(prefix=".coverage_", dir=tmp_dir or Path(bigwig_path).parent)
+    try:
+        bedgraph_path = Path(tmp_dir) / "coverage.bedGraph"
+        chrom_size_path = Path(tmp_dir) / "chrom.sizes"
+        with open(chrom_size_path, "w", encoding="utf-8") as fh:
+            fh.write("".join(f"{chrom}\t{size}\n" for chrom, size in chrom_sizes))
+        with open(bedgraph_path, "w", encoding="utf-8") as fh:
+            for chrom, starts, ends, values in tracks:
+                values = values * scale if scale != 1 else values
+                for first in range(0, len(starts), WRITE_CHUNK):
+                    last = first + WRITE_CHUNK
+                    fh.write("".join(
+                        f"{chrom}\t{start}\t{end}\t{value}\n"
+                        for start, end, value in zip(starts[first:last].tolist(), ends[first:last].tolist(), values[first:last].tolist())
+                    ))
+        subprocess.run(["bedGraphToBigWig", str(bedgraph_path), str(chrom_size_path), bigwig_path], check=True)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def save_track(path: str, starts: np.ndarray, ends: np.ndarray, values: np.ndarray) -> str:
+    """
+    Save the coverage track of a chromosome in a temporary .npz file, used to gather the tracks computed by several processes.
+    """
+    np.savez(path, starts=starts, ends=ends, values=values)
+    return path
+
+
+def load_tracks(chromosomes: list):
+    """
+    Iterate over the tracks saved by [](`genomake.pipelines.chromake.scripts.coverage.save_track`), deleting each file once read.
+
+    Parameters
+    ----------
+    chromosomes : list
+        List of (chromosome, path of the .npz file).
+    """
+    for chrom, path in chromosomes:
+        with np.load(path) as track:
+            starts, ends, values = track["starts"], track["ends"], track["values"]
+        os.remove(path)
+        yield chrom, starts, ends, values
+
+
+def _store_chromosome_track(store_prefix: str, chrom: str, chrom_size: int, bin_size: int, tmp_dir: str) -> str:
+    """
+    Compute the coverage track of a chromosome of a fragment store in a temporary file (run in a worker process).
+    """
+    starts, ends = open_fragment_store(store_prefix)[chrom]
+    return save_track(
+        str(Path(tmp_dir) / f"{chrom}.npz"),
+        *chromosome_coverage(np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64), chrom_size, bin_size)
+    )
+
+
+def create_bigwig_from_store(store_prefix: str,
+                             bigwig_path: str,
+                             chrom_size_path: str,
+                             bin_size: int = 1,
+                             normalization: str = "none",
+                             threads: int = 1) -> int:
+    """
+    Create the coverage track of a sample from its fragment store, e.g. to get a track with other bins or normalization than the pipeline.
+
+    Parameters
+    ----------
+    store_prefix : str
+        Path of the fragment store without extension (see [](`genomake.pipelines.chromake.scripts.fragment_store`)).
+
+    bigwig_path : str
+        Path of the bigWig to write.
+
+    chrom_size_path : str
+        Chromosome size file.
+
+    bin_size : int
+        Size of the bins in bp (1 for the base resolution).
+
+    normalization : str
+        One of NORMALIZATIONS.
+
+    threads : int
+        Number of chromosomes processed in parallel.
+
+    Returns
+    -------
+    int
+        The number of fragments of the sample.
+    """
+    chrom_sizes = read_chrom_sizes(chrom_size_path)
+    index = read_fragment_index(store_prefix)
+    chroms = [chrom for chrom in index if chrom in chrom_sizes]
+    n_fragments = sum(count for chrom, (_, count) in index.items() if chrom in chrom_sizes)
+    scale = get_scale_factor(n_fragments, normalization)
+    tmp_dir = tempfile.mkdtemp(prefix=".coverage_", dir=Path(bigwig_path).parent)
+    try:
+        with ProcessPoolExecutor(max_workers=max(threads, 1)) as pool:
+            futures = [
+                pool.submit(_store_chromosome_track, store_prefix, chrom, chrom_sizes[chrom], bin_size, tmp_dir)
+                for chrom in chroms
+            ]
+            tracks = [(chrom, future.result()) for chrom, future in zip(chroms, futures)]
+        write_bigwig(bigwig_path, [(chrom, chrom_sizes[chrom]) for chrom in chroms], load_tracks(tracks), scale, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return n_fragments
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create the coverage track (bigWig) of a sample from its binary fragment store."
+    )
+    parser.add_argument("--input", "-i", type=str, required=True, help="Path of the fragment store without extension (FRAGMENTS/<sample>).")
+    parser.add_argument("--output", "-o", type=str, required=True, help="BigWig to write.")
+    parser.add_argument("--chrom-size", type=str, required=True, help="Chromosome size file.")
+    parser.add_argument("--bin-size", type=int, default=1, help="Size of the bins in bp. Default to 1 (base resolution).")
+    parser.add_argument("--normalization", type=str, default="none", choices=NORMALIZATIONS, help="Normalization of the coverage. Default to none.")
+    parser.add_argument("--threads", "-@", type=int, default=1, help="Number of chromosomes processed in parallel. Default to 1.")
+    args = parser.parse_args()
+    create_bigwig_from_store(args.input, args.output, args.chrom_size, args.bin_size, args.normalization, args.threads)
+
+
+if __name__ == "__main__":
+    main()
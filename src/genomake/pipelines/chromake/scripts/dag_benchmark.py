@@ -0,0 +1,293 @@
+"""
+The dag_benchmark module of chromake contains functions to measure the time snakemake needs to parse the snakefile of the pipeline and to build its DAG for configurations of increasing size.
+
+The configurations are synthetic: one sequencing with adaptors and an input, whose samples have empty fastq files. Each size is measured with two snakemake commands run in a new process (like the jobs of a cluster): `--list-rules` (parse of the snakefile and of the configuration) and `--dry-run` (parse and DAG building).
+
+The module also checks the import time of the modules loaded by the cli and by the snakefile, and the parse time of the snakefile (`--imports`, also run by the tests in tests/test_startup.py), which must not load pandas or openpyxl.
+
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import yaml
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+"""Numbers of samples measured by default."""
+
+STARTUP_MODULES = {
+    "cli": ["genomake.cli"],
+    "snakefile": [
+        "genomake.pipelines.chromake.scripts.paths",
+        "genomake.pipelines.chromake.scripts.config",
+        "genomake.pipelines.chromake.scripts.plan",
+        "genomake.pipelines.chromake.scripts.snakemake_functions",
+    ],
+}
+"""Modules imported when the cli starts and when the snakefile is evaluated (by the controller and by each cluster job)."""
+
+HEAVY_MODULES = ["pandas", "openpyxl"]
+"""Modules only imported by the samplesheet functions of the config module."""
+
+IMPORT_BUDGET_MS = 200
+"""Default maximal import time of the STARTUP_MODULES (ms)."""
+
+PARSE_BUDGET_S = 20
+"""Default maximal time of the parse of the snakefile by snakemake for a configuration of 10 samples (s)."""
+
+
+def create_benchmark_config(directory: str, n_samples: int) -> str:
+    """
+    Create a synthetic configuration and its (empty) fastq files.
+
+    Parameters
+    ----------
+    directory : str
+        Folder where the configuration and the sequencing are created.
+
+    n_samples : int
+        Number of samples of the sequencing (an input is added).
+
+    Returns
+    -------
+    str
+        The path of the configuration file.
+    """
+    directory = Path(directory)
+    (directory / "FASTQ").mkdir(parents=True, exist_ok=True)
+    samples = {
+        f"S{index}": {"R1": f"FASTQ/S{index}_R1.fastq.gz", "R2": f"FASTQ/S{index}_R2.fastq.gz", "TYPE": "ATAC"}
+        for index in range(n_samples)
+    }
+    inputs = {"Input": {"R1": "FASTQ/Input_R1.fastq.gz", "R2": "FASTQ/Input_R2.fastq.gz"}}
+    for sample_data in list(samples.values()) + list(inputs.values()):
+        for strand in ("R1", "R2"):
+            (directory / sample_data[strand]).touch()
+    (directory / "chrom.sizes").write_text("chr1\t248956422\n", encoding="utf-8")
+    cfg = {
+        "SEQUENCINGS": {
+            "BENCHMARK": {
+                "SAMPLES": samples,
+                "INPUT": inputs,
+                "PATH": str(directory),
+                "R1_ADAPTOR": "CTGTCTCTTATACACATCT",
+                "R2_ADAPTOR": "CTGTCTCTTATACACATCT",
+                "PARAMETERS": {
+                    "CUTADAPT": "-q 20 --pair-filter=any",
+                    "BOWTIE2_REF": str(directory / "bowtie2_ref"),
+                    "BLACKLIST_BED": str(directory / "blacklist.bed"),
+                    "CHROM_SIZE": str(directory / "chrom.sizes"),
+                    "GENOME": "hg38",
+                },
+            }
+        },
+        "PROJECTS": {},
+        "JOBS": {
+            "CORES_PER_JOBS": {"FASTQC": 10, "CUTADAPT": 10, "BOWTIE2": 30, "SAMTOOLS_QC": 10, "MULTIBAMSUMMARY": 10, "BEDTOOLS": 10},
+            "QOS_INFOS": {"short": {"MaxWall": 1440}, "medium": {"MaxWall": 4320}, "long": {"MaxWall": 11520}},
+        },
+    }
+    config_path = directory / "config.yaml"
+    with open(config_path, "w", encoding="utf-8") as fh:
+        yaml.safe_dump(cfg, fh, sort_keys=False)
+    return str(config_path)
+
+
+def _time_snakemake(snakefile: str, config_path: str, options: list) -> float:
+    start = time.perf_counter()
+    process = subprocess.run(
+        ["snakemake", "--snakefile", snakefile, "--configfile", config_path, "--cores", "1", *options],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, cwd=Path(config_path).parent,
+    )
+    elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"snakemake {' '.join(options)} failed:\n{process.stdout[-2000:]}")
+    return elapsed
+
+
+def measure_dag_time(n_samples: int, snakefile: str = None) -> dict:
+    """
+    Measure the parse and the DAG building times of the pipeline for a synthetic configuration.
+
+    Parameters
+    ----------
+    n_samples : int
+        Number of samples of the configuration.
+
+    snakefile : str
+        Snakefile to measure. Default to the snakefile of chromake.
+
+    Returns
+    -------
+    dict
+        The number of samples, the PARSE_S (--list-rules) and DRY_RUN_S (--dry-run) wall times in seconds, and DAG_S, their difference.
+    """
+    if snakefile is None:
+        snakefile = str(Path(__file__).parents[1] / "Snakefile")
+    with tempfile.TemporaryDirectory(prefix="chromake_dag_") as directory:
+        config_path = create_benchmark_config(directory, n_samples)
+        parse_time = _time_snakemake(snakefile, config_path, ["--list-rules"])
+        dry_run_time = _time_snakemake(snakefile, config_path, ["--dry-run", "--quiet"])
+    return {
+        "SAMPLES": n_samples,
+        "PARSE_S": round(parse_time, 2),
+        "DRY_RUN_S": round(dry_run_time, 2),
+        "DAG_S": round(max(dry_run_time - parse_time, 0), 2),
+    }
+
+
+def _read_importtime(stderr: str) -> list:
+    imports = []
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package (indented by 2 spaces per level)
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def _genomake_env() -> dict:
+    # the new python processes (snakemake runs in another folder) import the same genomake package as this module
+    env = dict(os.environ)
+    package_dir = str(Path(__file__).parents[4])
+    env["PYTHONPATH"] = os.pathsep.join(path for path in (package_dir, env.get("PYTHONPATH", "")) if path)
+    return env
+
+
+def measure_import_time(modules: list) -> dict:
+    """
+    Measure the import time of modules in a new python process with `python -X importtime`.
+
+    Parameters
+    ----------
+    modules : list
+        Names of the modules imported.
+
+    Returns
+    -------
+    dict
+        The IMPORT_MS (total import time in ms, including the dependencies not yet imported by python at startup) and the HEAVY_MODULES imported.
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True, env=_genomake_env(),
+    )
+    imports = _read_importtime(process.stderr)
+    imported = {name for name, _, _, _ in imports}
+    return {
+        "IMPORT_MS": round(sum(self_us for _, self_us, _, _ in imports) / 1000, 1),
+        "HEAVY_MODULES": [module for module in HEAVY_MODULES if module in imported],
+    }
+
+
+def measure_snakefile_parse(n_samples: int = 10, snakefile: str = None) -> dict:
+    """
+    Measure the parse of the snakefile by snakemake (`--list-rules`) for a synthetic configuration, in a new python process with `python -X importtime`.
+
+    Parameters
+    ----------
+    n_samples : int
+        Number of samples of the configuration.
+
+    snakefile : str
+        Snakefile to measure. Default to the snakefile of chromake.
+
+    Returns
+    -------
+    dict
+        The PARSE_S wall time of snakemake in seconds, the IMPORT_MS spent importing the genomake modules imported by the snakefile (with their dependencies not yet imported by snakemake) and the HEAVY_MODULES imported.
+    """
+    if snakefile is None:
+        snakefile = str(Path(__file__).parents[1] / "Snakefile")
+    with tempfile.TemporaryDirectory(prefix="chromake_parse_") as directory:
+        config_path = create_benchmark_config(directory, n_samples)
+        start = time.perf_counter()
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-m", "snakemake", "--snakefile", snakefile, "--configfile", config_path, "--cores", "1", "--list-rules"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, cwd=directory, env=_genomake_env(),
+        )
+        elapsed = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"snakemake --list-rules failed:\n{(process.stdout + process.stderr)[-2000:]}")
+    imports = _read_importtime(process.stderr)
+    imported = {name for name, _, _, _ in imports}
+    # the imports of the snakefile are top-level imports, the modules of snakemake are imported before
+    snakefile_us = sum(cumulative_us for name, _, cumulative_us, depth in imports if depth == 0 and name.split(".")[0] == "genomake")
+    return {
+        "PARSE_S": round(elapsed, 2),
+        "IMPORT_MS": round(snakefile_us / 1000, 1),
+        "HEAVY_MODULES": [module for module in HEAVY_MODULES if module in imported],
+    }
+
+
+def check_import_time(budget_ms: float = IMPORT_BUDGET_MS, parse_budget_s: float = PARSE_BUDGET_S) -> bool:
+    """
+    Check that the cli and the snakefile start fast: they don't import the HEAVY_MODULES, each set of STARTUP_MODULES is imported in less than `budget_ms`, and snakemake parses the snakefile in less than `parse_budget_s`.
+
+    Parameters
+    ----------
+    budget_ms : float
+        Maximal import time (ms).
+
+    parse_budget_s : float
+        Maximal parse time of the snakefile (s), for a configuration of 10 samples.
+
+    Returns
+    -------
+    bool
+        True if the check passed. The import times are printed.
+    """
+    passed = True
+    for name, modules in STARTUP_MODULES.items():
+        result = measure_import_time(modules)
+        print(f"{name}: {result['IMPORT_MS']} ms", end="")
+        if result["HEAVY_MODULES"]:
+            print(f", imports {', '.join(result['HEAVY_MODULES'])}!")
+            passed = False
+        elif result["IMPORT_MS"] > budget_ms:
+            print(f", above the budget of {budget_ms} ms!")
+            passed = False
+        else:
+            print()
+    result = measure_snakefile_parse()
+    print(f"snakefile parse: {result['PARSE_S']} s (imports of the snakefile: {result['IMPORT_MS']} ms)", end="")
+    if result["HEAVY_MODULES"]:
+        print(f", imports {', '.join(result['HEAVY_MODULES'])}!")
+        passed = False
+    elif result["IMPORT_MS"] > budget_ms or result["PARSE_S"] > parse_budget_s:
+        print(f", above the budget of {budget_ms} ms or {parse_budget_s} s!")
+        passed = False
+    else:
+        print()
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the time snakemake needs to parse the chromake snakefile and to build its DAG for synthetic configurations of increasing size."
+    )
+    parser.add_argument("--samples", "-n", type=int, nargs="+", default=DEFAULT_SIZES, help="Numbers of samples to measure. Default to 10 100 1000 10000.")
+    parser.add_argument("--snakefile", "-s", type=str, default=None, help="Snakefile to measure (e.g. a previous version). Default to the snakefile of chromake.")
+    parser.add_argument("--imports", action="store_true", default=False, help="Only check the import time of the cli and of the modules of the snakefile (exit with an error if pandas or openpyxl is imported or if the budget is exceeded).")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET_MS, help=f"Maximal import time in ms for --imports. Default to {IMPORT_BUDGET_MS}.")
+    args = parser.parse_args()
+
+    if args.imports:
+        if not check_import_time(args.import_budget):
+            sys.exit(1)
+        return
+
+    print("SAMPLES\tPARSE_S\tDRY_RUN_S\tDAG_S")
+    for n_samples in args.samples:
+        row = measure_dag_time(n_samples, args.snakefile)
+        print("\t".join(str(row[key]) for key in ("SAMPLES", "PARSE_S", "DRY_RUN_S", "DAG_S")), flush=True)
+
+
+if __name__ == "__main__":
+    main()
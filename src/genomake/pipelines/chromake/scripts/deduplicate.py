@@ -0,0 +1,419 @@
+"""
+The deduplicate module of chromake contains functions to remove the duplicated read pairs of a coordinate-sorted bam, replacing picard MarkDuplicates.
+
+Two read pairs are duplicates when they have the same library and the same fragment coordinates: the unclipped 5' position and the strand of both mates, like picard. In each group of duplicates, the pair with the highest sum of base qualities (bases of quality 15 or more) is kept, and the first pair in the coordinate order is kept in case of a tie. The pairs whose mates are on different chromosomes are compared in the same way, and both mates of their duplicates are removed, like picard. A read whose mate is unmapped is a duplicate when a pair has an end at its position and strand, or when another such read with a higher quality has the same position and strand.
+
+The chromosomes are processed in parallel. Each process reads the alignments of one chromosome twice through the bam index. The first pass stores a name hash (to find the mates), a position code and a score per read in compact arrays, finds the duplicates with numpy and saves their indices in the coordinate order. The reads whose mate is on another chromosome are returned with their names, and their duplicates are found once all chromosomes are scanned. The second pass writes the reads that are not duplicates: the duplicated reads are found by their index, the reads whose mate is on another chromosome and the secondary and supplementary alignments by the exact names of the duplicates. The memory used is bounded by the number of reads of the largest chromosome (about 30 bytes per read) and the names of the reads whose mate is on another chromosome, instead of the whole bam for picard. Optical duplicates are not distinguished (READ_PAIR_OPTICAL_DUPLICATES is 0), and unmapped reads are not written.
+
+"""
+import argparse
+import os
+import shutil
+import tempfile
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pysam
+
+from genomake.pipelines.chromake.scripts.duplicates import estimate_library_size, write_picard_metrics
+
+MIN_BASE_QUALITY = 15
+"""Bases of this quality or more are counted in the score of a read (like picard SUM_OF_BASE_QUALITIES)."""
+
+_POSITION_OFFSET = 1 << 20
+"""Offset added to the unclipped positions, which can be negative at the start of a chromosome."""
+
+_CLIPS = (4, 5)
+"""CIGAR operations of the soft and hard clips."""
+
+_QUALITY_SCORES = bytes(q if q >= MIN_BASE_QUALITY else 0 for q in range(256))
+"""Translation table setting the qualities below MIN_BASE_QUALITY to 0."""
+
+_PAIR, _SINGLE, _SPLIT = 0, 1, 2
+"""Kinds of primary reads: mate on the same chromosome, mate unmapped (or unpaired read), mate on another chromosome."""
+
+_METRICS = ["UNPAIRED_READS_EXAMINED", "READ_PAIRS_EXAMINED", "SECONDARY_OR_SUPPLEMENTARY_RDS", "UNPAIRED_READ_DUPLICATES", "READ_PAIR_DUPLICATES"]
+
+
+def _end_code(read, library: int) -> int:
+    """
+    Get the code of the unclipped 5' end of a read: library, position and strand in a single integer.
+    """
+    cigar = read.cigartuples
+    if read.is_reverse:
+        position = read.reference_end - 1
+        for operation, length in reversed(cigar):
+            if operation not in _CLIPS:
+                break
+            position += length
+    else:
+        position = read.reference_start
+        for operation, length in cigar:
+            if operation not in _CLIPS:
+                break
+            position -= length
+    return (library << 33) | ((position + _POSITION_OFFSET) << 1) | read.is_reverse
+
+
+def _score(read) -> int:
+    qualities = read.query_qualities
+    if qualities is None:
+        return 0
+    return sum(qualities.tobytes().translate(_QUALITY_SCORES))
+
+
+def _first_of_groups(keys: list, scores: np.ndarray) -> np.ndarray:
+    """
+    Find the best element of each group of elements with the same keys (highest score, first in the input order in case of a tie).
+
+    Returns
+    -------
+    :
+        A boolean array, True for the duplicates (the elements that are not the best of their group).
+    """
+    duplicates = np.zeros(len(scores), dtype=bool)
+    if len(scores) == 0:
+        return duplicates
+    # lexsort is stable: the first element of each group has the highest score and the smallest index among them
+    order = np.lexsort([-scores] + keys[::-1])
+    new_group = np.zeros(len(order), dtype=bool)
+    new_group[0] = True
+    for key in keys:
+        sorted_key = key[order]
+        new_group[1:] |= sorted_key[1:] != sorted_key[:-1]
+    duplicates[order[~new_group]] = True
+    return duplicates
+
+
+def _mates(names: np.ndarray):
+    """
+    Find the two mates of each pair of reads with the same name.
+
+    Returns
+    -------
+    :
+        The order of the reads sorted by name (stable, so the coordinate order is kept for the same name), the positions in this order of the first mate of each pair, and a boolean array in this order, True for the reads whose mate was found.
+    """
+    # the two mates of a pair are consecutive once the reads are sorted by name
+    order = np.argsort(names, kind="stable")
+    sorted_names = names[order]
+    is_first = np.zeros(len(sorted_names), dtype=bool)
+    if len(sorted_names) > 1:
+        same = sorted_names[1:] == sorted_names[:-1]
+        is_first[:-1] = same
+        is_first[1:-1] &= ~same[:-1]
+    first = np.flatnonzero(is_first)
+    mated = np.zeros(len(sorted_names), dtype=bool)
+    mated[first] = True
+    mated[first + 1] = True
+    return order, first, mated
+
+
+def find_duplicates(pair_names: np.ndarray, pair_codes: np.ndarray, pair_scores: np.ndarray,
+                    single_codes: np.ndarray, single_scores: np.ndarray, other_ends: np.ndarray = None):
+    """
+    Find the duplicated read pairs and single reads of a chromosome.
+
+    Parameters
+    ----------
+    pair_names, pair_codes, pair_scores : np.ndarray
+        Name hash, end code and score of the reads whose mate is mapped on the same chromosome, in the coordinate order.
+
+    single_codes, single_scores : np.ndarray
+        End code and score of the reads whose mate is unmapped (and of the unpaired reads), in the coordinate order.
+
+    other_ends : np.ndarray
+        End codes of the reads whose mate is mapped on another chromosome: they are pair ends for the single reads. Default to None (no such read).
+
+    Returns
+    -------
+    :
+        Two boolean arrays, True for the duplicated reads among the pair reads (both mates of a duplicated pair) and among the single reads, and the number of read pairs, of single reads, of duplicated pairs and of duplicated single reads.
+    """
+    order, first, mated = _mates(pair_names)
+    # reads whose mate was not found (e.g. filtered) are examined as single reads
+    orphans = order[~mated]
+    codes = np.concatenate([single_codes, pair_codes[orphans]])
+    scores = np.concatenate([single_scores, pair_scores[orphans]])
+
+    # mate1 is the first mate in the coordinate order, the library is in the high bits of the codes
+    mate1, mate2 = order[first], order[first + 1]
+    codes1, codes2 = pair_codes[mate1], pair_codes[mate2]
+    low = np.minimum(codes1, codes2)
+    high = np.maximum(codes1, codes2) & ~(np.int64(-1) << np.int64(33))
+    pair_order = np.argsort(mate1, kind="stable")
+    low, high = low[pair_order], high[pair_order]
+    duplicated_pairs = _first_of_groups([low, high], (pair_scores[mate1] + pair_scores[mate2])[pair_order])
+
+    # single reads: duplicates of any pair end at the same position, or of a better single read
+    pair_ends = np.sort(np.concatenate([codes1, codes2] + ([other_ends] if other_ends is not None else [])))
+    on_pair = np.zeros(len(codes), dtype=bool)
+    if len(pair_ends):
+        on_pair = pair_ends[np.minimum(np.searchsorted(pair_ends, codes), len(pair_ends) - 1)] == codes
+    duplicated_singles = _first_of_groups([codes], scores) | on_pair
+
+    pair_duplicates = np.zeros(len(pair_codes), dtype=bool)
+    pair_duplicates[mate1[pair_order][duplicated_pairs]] = True
+    pair_duplicates[mate2[pair_order][duplicated_pairs]] = True
+    pair_duplicates[orphans] = duplicated_singles[len(single_codes):]
+    return pair_duplicates, duplicated_singles[:len(single_codes)], len(first), len(codes), int(duplicated_pairs.sum()), int(duplicated_singles.sum())
+
+
+def find_split_duplicates(names: np.ndarray, chroms: np.ndarray, indices: np.ndarray, codes: np.ndarray, scores: np.ndarray):
+    """
+    Find the duplicated read pairs whose mates are mapped on different chromosomes.
+
+    Parameters
+    ----------
+    names : np.ndarray
+        Names of the reads whose mate is mapped on another chromosome.
+
+    chroms, indices, codes, scores : np.ndarray
+        Index of the chromosome, index of the read in the coordinate order of its chromosome, end code and score of the reads.
+
+    Returns
+    -------
+    :
+        A boolean array, True for the duplicated reads (both mates of a duplicated pair), and the number of read pairs, of single reads (reads whose mate was not found), of duplicated pairs and of duplicated single reads.
+    """
+    order, first, mated = _mates(names)
+    # mate1 is the mate on the first chromosome
+    swap = chroms[order[first]] > chroms[order[first + 1]]
+    mate1 = np.where(swap, order[first + 1], order[first])
+    mate2 = np.where(swap, order[first], order[first + 1])
+    pair_order = np.lexsort([indices[mate1], chroms[mate1]])
+    mate1, mate2 = mate1[pair_order], mate2[pair_order]
+    keys = [chroms[mate1], codes[mate1], chroms[mate2], codes[mate2] & ~(np.int64(-1) << np.int64(33))]
+    duplicated_pairs = _first_of_groups(keys, scores[mate1] + scores[mate2])
+
+    orphans = order[~mated]
+    orphans = orphans[np.lexsort([indices[orphans], chroms[orphans]])]
+    duplicated_singles = _first_of_groups([chroms[orphans], codes[orphans]], scores[orphans])
+
+    duplicates = np.zeros(len(names), dtype=bool)
+    duplicates[mate1[duplicated_pairs]] = True
+    duplicates[mate2[duplicated_pairs]] = True
+    duplicates[orphans[duplicated_singles]] = True
+    return duplicates, len(first), len(orphans), int(duplicated_pairs.sum()), int(duplicated_singles.sum())
+
+
+def _get_libraries(header: dict) -> dict:
+    """
+    Get the index of the library of each read group of a bam header.
+    """
+    libraries = {}
+    read_groups = {}
+    for read_group in header.get("RG", []):
+        library = read_group.get("LB", "Unknown Library")
+        read_groups[read_group["ID"]] = libraries.setdefault(library, len(libraries))
+    return read_groups
+
+
+def _to_numpy(values: array, dtype) -> np.ndarray:
+    return np.frombuffer(values, dtype=dtype) if len(values) else np.zeros(0, dtype=dtype)
+
+
+def _scan_chromosome(bam_path: str, chrom: str, header: dict, duplicates_path: str) -> tuple:
+    """
+    Find the duplicates of a chromosome (first pass) and save the indices of the duplicated primary reads in the coordinate order.
+
+    Returns
+    -------
+    :
+        The duplication metrics of the chromosome, the reads whose mate is on another chromosome (names, indices, end codes and scores), the names of the duplicates whose secondary or supplementary alignments come before them, and the names of the secondary and supplementary alignments.
+    """
+    read_groups = _get_libraries(header)
+    several_libraries = len(set(read_groups.values())) > 1
+    kinds, names, codes, scores = array("b"), array("q"), array("q"), array("q")
+    split_names = []
+    secondary_names = set()
+    late = {}
+    secondary = 0
+    with pysam.AlignmentFile(bam_path, "rb") as bam:
+        chrom_id = bam.get_tid(chrom)
+        for read in bam.fetch(chrom):
+            if read.is_unmapped:
+                continue
+            name = read.query_name
+            if read.is_secondary or read.is_supplementary:
+                secondary += 1
+                secondary_names.add(name)
+                continue
+            if name in secondary_names:
+                late[len(kinds)] = name
+            library = read_groups.get(read.get_tag("RG"), 0) if several_libraries and read.has_tag("RG") else 0
+            if not read.is_paired or read.mate_is_unmapped:
+                kind = _SINGLE
+            elif read.next_reference_id == chrom_id:
+                kind = _PAIR
+            else:
+                kind = _SPLIT
+                split_names.append(name)
+            kinds.append(kind)
+            names.append(hash(name))
+            codes.append(_end_code(read, library))
+            scores.append(_score(read))
+
+    kinds = _to_numpy(kinds, np.int8)
+    names, codes, scores = (_to_numpy(values, np.int64) for values in (names, codes, scores))
+    pair, single, split = kinds == _PAIR, kinds == _SINGLE, kinds == _SPLIT
+    pair_duplicates, single_duplicates, read_pairs, single_reads, duplicated_pairs, duplicated_singles = find_duplicates(
+        names[pair], codes[pair], scores[pair], codes[single], scores[single], codes[split]
+    )
+    duplicates = np.zeros(len(kinds), dtype=bool)
+    duplicates[pair] = pair_duplicates
+    duplicates[single] = single_duplicates
+    np.save(duplicates_path, np.flatnonzero(duplicates))
+    metrics = {
+        "UNPAIRED_READS_EXAMINED": single_reads,
+        "READ_PAIRS_EXAMINED": read_pairs,
+        "SECONDARY_OR_SUPPLEMENTARY_RDS": secondary,
+        "UNPAIRED_READ_DUPLICATES": duplicated_singles,
+        "READ_PAIR_DUPLICATES": duplicated_pairs,
+    }
+    split_reads = (split_names, np.flatnonzero(split), codes[split], scores[split])
+    return metrics, split_reads, [name for index, name in late.items() if duplicates[index]], secondary_names
+
+
+def _write_chromosome(bam_path: str, chrom: str, output_path: str, header: dict, duplicates_path: str, names: list, secondary_names: set) -> None:
+    """
+    Write the reads of a chromosome that are not duplicates (second pass).
+
+    The duplicated primary reads are found by their index in the coordinate order (the same as in the first pass), the reads whose mate is on another chromosome and the secondary and supplementary alignments by the exact names of the duplicates.
+    """
+    duplicates = np.load(duplicates_path)
+    names = set(names)
+    index = 0
+    position = 0
+    next_duplicate = duplicates[0] if len(duplicates) else -1
+    with pysam.AlignmentFile(bam_path, "rb") as bam, pysam.AlignmentFile(output_path, "wb", header=header) as out:
+        for read in bam.fetch(chrom):
+            if read.is_unmapped:
+                continue
+            if read.is_secondary or read.is_supplementary:
+                if read.query_name not in names:
+                    out.write(read)
+                continue
+            if index == next_duplicate:
+                # the secondary and supplementary alignments of the duplicates are removed with them
+                if read.query_name in secondary_names:
+                    names.add(read.query_name)
+                position += 1
+                next_duplicate = duplicates[position] if position < len(duplicates) else -1
+            elif read.query_name not in names:
+                out.write(read)
+            index += 1
+
+
+def remove_duplicates(bam_path: str, output_path: str, metrics_path: str, threads: int = 1, library: str = None) -> dict:
+    """
+    Remove the duplicated read pairs of a coordinate-sorted bam and write the picard-style duplication metrics.
+
+    Parameters
+    ----------
+    bam_path : str
+        Path to a coordinate-sorted bam. It is indexed if it has no index.
+
+    output_path : str
+        Path of the coordinate-sorted bam without duplicates to write.
+
+    metrics_path : str
+        Path of the metrics file to write (see [](`genomake.pipelines.chromake.scripts.duplicates.write_picard_metrics`)).
+
+    threads : int
+        Number of chromosomes processed in parallel.
+
+    library : str
+        Name of the library written in the metrics. Default to the libraries of the read groups of the bam.
+
+    Returns
+    -------
+    dict
+        The picard DuplicationMetrics fields of the bam.
+    """
+    if not (os.path.exists(f"{bam_path}.bai") or os.path.exists(f"{bam_path}.csi")):
+        pysam.index("-@", str(max(threads, 1)), bam_path)
+    with pysam.AlignmentFile(bam_path, "rb") as bam:
+        header = bam.header.to_dict()
+        statistics = bam.get_index_statistics()
+        unmapped = sum(s.unmapped for s in statistics) + bam.nocoordinate
+    header.setdefault("PG", []).append({"ID": "chromake.deduplicate", "PN": "chromake", "CL": f"deduplicate -i {bam_path} -o {output_path}"})
+    chroms = [s.contig for s in statistics if s.mapped > 0]
+    if library is None:
+        library = ",".join(dict.fromkeys(rg.get("LB", "Unknown Library") for rg in header.get("RG", []))) or "Unknown Library"
+
+    metrics = dict.fromkeys(_METRICS, 0)
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".deduplicate_", dir=Path(output_path).parent)
+    try:
+        parts = [str(Path(tmp_dir) / f"{index}.bam") for index in range(len(chroms))]
+        duplicates = [str(Path(tmp_dir) / f"{index}.npy") for index in range(len(chroms))]
+        # the largest chromosomes are submitted first so they don't end last
+        sizes = {s.contig: s.mapped for s in statistics}
+        indices = sorted(range(len(chroms)), key=lambda index: -sizes[chroms[index]])
+        with ProcessPoolExecutor(max_workers=max(threads, 1)) as pool:
+            futures = {index: pool.submit(_scan_chromosome, bam_path, chroms[index], header, duplicates[index]) for index in indices}
+            scans = [futures[index].result() for index in range(len(chroms))]
+            for chrom_metrics, _, _, _ in scans:
+                for key, value in chrom_metrics.items():
+                    metrics[key] += value
+
+            # the pairs whose mates are on different chromosomes are compared once all chromosomes are scanned, and both mates of the duplicates are removed
+            split_names = np.array([name for scan in scans for name in scan[1][0]], dtype=str)
+            split_chroms = np.repeat(np.arange(len(chroms)), [len(scan[1][0]) for scan in scans])
+            split_indices, split_codes, split_scores = (np.concatenate([scan[1][k] for scan in scans] or [np.zeros(0, dtype=np.int64)]) for k in (1, 2, 3))
+            split_duplicates, read_pairs, single_reads, duplicated_pairs, duplicated_singles = find_split_duplicates(split_names, split_chroms, split_indices, split_codes, split_scores)
+            metrics["READ_PAIRS_EXAMINED"] += read_pairs
+            metrics["UNPAIRED_READS_EXAMINED"] += single_reads
+            metrics["READ_PAIR_DUPLICATES"] += duplicated_pairs
+            metrics["UNPAIRED_READ_DUPLICATES"] += duplicated_singles
+            names = [list(scan[2]) for scan in scans]
+            for index in np.flatnonzero(split_duplicates):
+                names[split_chroms[index]].append(str(split_names[index]))
+
+            futures = {
+                index: pool.submit(_write_chromosome, bam_path, chroms[index], parts[index], header, duplicates[index], names[index], scans[index][3])
+                for index in indices
+            }
+            for index in range(len(chroms)):
+                futures[index].result()
+        tmp_output = str(Path(tmp_dir) / "deduplicated.bam")
+        if parts:
+            # the parts are concatenated in the order of the header, so the output stays coordinate-sorted
+            pysam.cat("-o", tmp_output, *parts)
+        else:
+            with pysam.AlignmentFile(tmp_output, "wb", header=header):
+                pass
+        shutil.move(tmp_output, output_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    read_pairs = metrics["READ_PAIRS_EXAMINED"]
+    metrics.update({
+        "LIBRARY": library,
+        "UNMAPPED_READS": unmapped,
+        "READ_PAIR_OPTICAL_DUPLICATES": 0,
+        "ESTIMATED_LIBRARY_SIZE": estimate_library_size(read_pairs, read_pairs - metrics["READ_PAIR_DUPLICATES"]),
+    })
+    write_picard_metrics(metrics, metrics_path, bam_path, "chromake deduplicate")
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Remove the duplicated read pairs of a coordinate-sorted bam and write a picard MarkDuplicates metrics file."
+    )
+    parser.add_argument("--input", "-i", type=str, required=True, help="Coordinate-sorted bam (indexed if it has no index).")
+    parser.add_argument("--output", "-o", type=str, required=True, help="Coordinate-sorted bam without duplicates to write.")
+    parser.add_argument("--metrics", "-m", type=str, required=True, help="Picard-style metrics file to write.")
+    parser.add_argument("--threads", "-@", type=int, default=1, help="Number of chromosomes processed in parallel. Default to 1.")
+    parser.add_argument("--library", type=str, default=None, help="Name of the library in the metrics. Default to the libraries of the read groups.")
+    args = parser.parse_args()
+    metrics = remove_duplicates(args.input, args.output, args.metrics, args.threads, args.library)
+    print(f"{metrics['READ_PAIR_DUPLICATES']} duplicated pairs removed out of {metrics['READ_PAIRS_EXAMINED']} read pairs.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+The duplicates module of chromake contains functions to write the duplication metrics of the pipeline in the format of picard MarkDuplicates.
+
+The metrics files are parsed by MultiQC the same way whichever tool removed the duplicates.
+
+"""
+import argparse
+import math
+from datetime import datetime
+from pathlib import Path
+
+
+PICARD_METRICS_COLUMNS = [
+    "LIBRARY",
+    "UNPAIRED_READS_EXAMINED",
+    "READ_PAIRS_EXAMINED",
+    "SECONDARY_OR_SUPPLEMENTARY_RDS",
+    "UNMAPPED_READS",
+    "UNPAIRED_READ_DUPLICATES",
+    "READ_PAIR_DUPLICATES",
+    "READ_PAIR_OPTICAL_DUPLICATES",
+    "PERCENT_DUPLICATION",
+    "ESTIMATED_LIBRARY_SIZE",
+]
+
+
+def estimate_library_size(read_pairs: int, unique_read_pairs: int):
+    """
+    Estimate the size of a library from the number of read pairs and of unique read pairs, using the Lander-Waterman equation like picard.
+
+    Parameters
+    ----------
+    read_pairs : int
+        Number of read pairs examined.
+
+    unique_read_pairs : int
+        Number of read pairs that are not duplicates.
+
+    Returns
+    -------
+    :
+        The estimated number of unique molecules in the library, or None if it can't be estimated.
+    """
+    duplicate_pairs = read_pairs - unique_read_pairs
+    if read_pairs <= 0 or unique_read_pairs <= 0 or duplicate_pairs <= 0:
+        return None
+
+    def f(x, c, n):
+        return c / x - 1 + math.exp(-n / x)
+
+    m = 1.0
+    M = 100.0
+    if f(m * unique_read_pairs, unique_read_pairs, read_pairs) < 0:
+        return None
+    while f(M * unique_read_pairs, unique_read_pairs, read_pairs) > 0:
+        M *= 10.0
+    for _ in range(40):
+        r = (m + M) / 2.0
+        u = f(r * unique_read_pairs, unique_read_pairs, read_pairs)
+        if u == 0:
+            break
+        elif u > 0:
+            m = r
+        else:
+            M = r
+    return int(unique_read_pairs * (m + M) / 2.0)
+
+
+def read_samtools_markdup_stats(stats_path: str) -> dict:
+    """
+    Read the statistics written by `samtools markdup -f`.
+
+    Parameters
+    ----------
+    stats_path : str
+        Path to the file written by samtools markdup.
+
+    Returns
+    -------
+    :
+        A dict associating each statistic (e.g. 'DUPLICATE PAIR') to its value.
+    """
+    stats = {}
+    with open(stats_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if ":" not in line or line.startswith("COMMAND"):
+                continue
+            key, value = line.split(":", 1)
+            try:
+                stats[key.strip()] = int(value.strip())
+            except ValueError:
+                continue
+    return stats
+
+
+def samtools_stats_to_metrics(stats: dict, library: str) -> dict:
+    """
+    Convert the statistics of samtools markdup to the picard DuplicationMetrics fields.
+
+    samtools counts duplicated reads while picard counts duplicated pairs, so the paired statistics are divided by 2.
+
+    Parameters
+    ----------
+    stats : dict
+        Statistics returned by [](`genomake.pipelines.chromake.scripts.duplicates.read_samtools_markdup_stats`).
+
+    library : str
+        Name of the library (LB field of the read group).
+
+    Returns
+    -------
+    :
+        A dict with the picard DuplicationMetrics fields.
+    """
+    read_pairs = stats.get("PAIRED", 0) // 2
+    pair_duplicates = stats.get("DUPLICATE PAIR", 0) // 2
+    optical_duplicates = stats.get("DUPLICATE PAIR OPTICAL", 0) // 2
+    metrics = {
+        "LIBRARY": library,
+        "UNPAIRED_READS_EXAMINED": stats.get("SINGLE", 0),
+        "READ_PAIRS_EXAMINED": read_pairs,
+        "SECONDARY_OR_SUPPLEMENTARY_RDS": stats.get("EXCLUDED", 0),
+        "UNMAPPED_READS": 0,
+        "UNPAIRED_READ_DUPLICATES": stats.get("DUPLICATE SINGLE", 0),
+        "READ_PAIR_DUPLICATES": pair_duplicates,
+        "READ_PAIR_OPTICAL_DUPLICATES": optical_duplicates,
+    }
+    if "ESTIMATED_LIBRARY_SIZE" in stats:
+        metrics["ESTIMATED_LIBRARY_SIZE"] = stats["ESTIMATED_LIBRARY_SIZE"]
+    else:
+        metrics["ESTIMATED_LIBRARY_SIZE"] = estimate_library_size(read_pairs - optical_duplicates, read_pairs - pair_duplicates)
+    return metrics
+
+
+def write_picard_metrics(metrics: dict, output_path: str, input_path: str, tool: str) -> str:
+    """
+    Write duplication metrics in the format of the METRICS_FILE of picard MarkDuplicates.
+
+    Parameters
+    ----------
+    metrics : dict
+        Dict with the picard DuplicationMetrics fields. PERCENT_DUPLICATION is computed if absent.
+
+    output_path : str
+        Path of the metrics file to write.
+
+    input_path : str
+        Path of the bam used to identify the duplicates. MultiQC use it to name the sample.
+
+    tool : str
+        Name of the tool that removed the duplicates, written in the header of the file.
+
+    Returns
+    -------
+    str
+        Path to the written metrics file.
+    """
+    metrics = dict(metrics)
+    if "PERCENT_DUPLICATION" not in metrics:
+        examined = metrics["UNPAIRED_READS_EXAMINED"] + 2 * metrics["READ_PAIRS_EXAMINED"]
+        duplicates = metrics["UNPAIRED_READ_DUPLICATES"] + 2 * metrics["READ_PAIR_DUPLICATES"]
+        metrics["PERCENT_DUPLICATION"] = round(duplicates / examined, 6) if examined > 0 else 0
+    if metrics.get("ESTIMATED_LIBRARY_SIZE") is None:
+        metrics["ESTIMATED_LIBRARY_SIZE"] = ""
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as fh:
+        fh.write("## htsjdk.samtools.metrics.StringHeader\n")
+        fh.write(f"# MarkDuplicates INPUT=[{input_path}] OUTPUT=[] METRICS_FILE={output_path} REMOVE_DUPLICATES=true ({tool})\n")
+        fh.write("## htsjdk.samtools.metrics.StringHeader\n")
+        fh.write(f"# Started on: {datetime.now().strftime('%a %b %d %H:%M:%S %Y')}\n")
+        fh.write("\n")
+        fh.write("## METRICS CLASS\tpicard.sam.DuplicationMetrics\n")
+        fh.write("\t".join(PICARD_METRICS_COLUMNS) + "\n")
+        fh.write("\t".join(str(metrics[c]) for c in PICARD_METRICS_COLUMNS) + "\n")
+        fh.write("\n")
+    return output_path
+
+
+def samtools_markdup_to_picard(stats_path: str, output_path: str, input_path: str, library: str) -> str:
+    """
+    Convert the statistics of `samtools markdup -f` in a picard MarkDuplicates metrics file.
+
+    Parameters
+    ----------
+    stats_path : str
+        Path to the file written by samtools markdup.
+
+    output_path : str
+        Path of the metrics file to write.
+
+    input_path : str
+        Path of the bam given to samtools markdup.
+
+    library : str
+        Name of the library (LB field of the read group).
+
+    Returns
+    -------
+    str
+        Path to the written metrics file.
+    """
+    metrics = samtools_stats_to_metrics(read_samtools_markdup_stats(stats_path), library)
+    return write_picard_metrics(metrics, output_path, input_path, "samtools markdup")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert the statistics of 'samtools markdup -f' in a picard MarkDuplicates metrics file."
+    )
+    parser.add_argument("--stats", type=str, required=True, help="File written by 'samtools markdup -f'.")
+    parser.add_argument("--output", "-o", type=str, required=True, help="Picard-style metrics file to write.")
+    parser.add_argument("--input-bam", type=str, default="", help="Bam given to samtools markdup, used by MultiQC to name the sample.")
+    parser.add_argument("--library", type=str, default="Unknown Library", help="Name of the library.")
+    args = parser.parse_args()
+    samtools_markdup_to_picard(args.stats, args.output, args.input_bam, args.library)
+
+
+if __name__ == "__main__":
+    main()
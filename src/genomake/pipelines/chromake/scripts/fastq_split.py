@@ -0,0 +1,128 @@
+"""
+The fastq_split module of chromake contains functions to split a pair of fastq files in read-synchronized chunks.
+
+It is used by the scatter mode of the pipeline (ALIGNMENT_CHUNKS > 1) to align the chunks of a sample as parallel jobs.
+
+"""
+import argparse
+import gzip
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+BATCH_SIZE = 10000
+"""Number of reads written in a chunk before switching to the next one."""
+
+
+def _open_reader(path: str):
+    """
+    Open a fastq file (gzipped or not) for reading. pigz is used for the decompression if it is installed.
+    """
+    if path.endswith(".gz"):
+        if shutil.which("pigz"):
+            proc = subprocess.Popen(["pigz", "-dc", path], stdout=subprocess.PIPE)
+            return proc.stdout, proc
+        return gzip.open(path, "rb"), None
+    return open(path, "rb"), None
+
+
+def _compress(lines: list) -> bytes:
+    """
+    Compress a batch of lines as a gzip member (the members of a chunk are concatenated, which is a valid gzip file).
+    """
+    return gzip.compress(b"".join(lines), compresslevel=1, mtime=0)
+
+
+def split_fastq_pair(r1: str,
+                     r2: str,
+                     r1_outputs: list,
+                     r2_outputs: list,
+                     batch_size: int = BATCH_SIZE,
+                     threads: int = 1) -> int:
+    """
+    Split a pair of fastq files in chunks that keep the mates synchronized.
+
+    Reads are distributed by batches of `batch_size` reads in a round-robin way, so each chunk contains about the same number of reads and the same reads in its R1 and R2 files. The batches are compressed by a pool of threads (zlib releases the GIL), so the number of cores used doesn't depend on the number of chunks.
+
+    Parameters
+    ----------
+    r1 : str
+        Path to the R1 fastq file.
+
+    r2 : str
+        Path to the R2 fastq file.
+
+    r1_outputs : list
+        Paths to the gzipped R1 chunks to create.
+
+    r2_outputs : list
+        Paths to the gzipped R2 chunks to create (same length as r1_outputs).
+
+    batch_size : int
+        Number of reads written in a chunk before switching to the next one.
+
+    threads : int
+        Number of threads of the job: one for the reading (and the pigz decompression) and the others for the compression of the batches.
+
+    Returns
+    -------
+    int
+        The number of read pairs.
+    """
+    if len(r1_outputs) != len(r2_outputs) or len(r1_outputs) < 1:
+        raise RuntimeError("The number of R1 and R2 chunks must be identical and at least 1.")
+
+    r1_reader, r1_proc = _open_reader(r1)
+    r2_reader, r2_proc = _open_reader(r2)
+    outputs = [open(path, "wb") for path in r1_outputs + r2_outputs]
+    # compressed batch being computed for each output, written before the next batch of the output to keep the order of the reads
+    pending = [None] * len(outputs)
+    n_reads = 0
+    chunk = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(threads - 1, 1)) as pool:
+            while True:
+                r1_lines = list(islice(r1_reader, 4 * batch_size))
+                r2_lines = list(islice(r2_reader, 4 * batch_size))
+                if len(r1_lines) != len(r2_lines) or len(r1_lines) % 4 != 0:
+                    raise RuntimeError(f"The files {r1} and {r2} don't contain the same number of reads.")
+                if not r1_lines:
+                    break
+                for output, lines in ((chunk, r1_lines), (len(r1_outputs) + chunk, r2_lines)):
+                    if pending[output] is not None:
+                        outputs[output].write(pending[output].result())
+                    pending[output] = pool.submit(_compress, lines)
+                n_reads += len(r1_lines) // 4
+                chunk = (chunk + 1) % len(r1_outputs)
+            for output, future in enumerate(pending):
+                # a chunk without reads is an empty gzip file
+                outputs[output].write(future.result() if future is not None else _compress([]))
+    finally:
+        for fh in outputs:
+            fh.close()
+        r1_reader.close()
+        r2_reader.close()
+        errors = [proc.wait() for proc in (r1_proc, r2_proc) if proc is not None]
+    if any(errors):
+        raise RuntimeError(f"The decompression of {r1} or {r2} failed.")
+    return n_reads
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Split a pair of fastq files in read-synchronized gzipped chunks."
+    )
+    parser.add_argument("-1", dest="r1", type=str, required=True, help="R1 fastq file.")
+    parser.add_argument("-2", dest="r2", type=str, required=True, help="R2 fastq file.")
+    parser.add_argument("--r1-outputs", type=str, nargs="+", required=True, help="R1 chunks to create.")
+    parser.add_argument("--r2-outputs", type=str, nargs="+", required=True, help="R2 chunks to create.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"Number of reads written in a chunk before switching to the next one. Default to {BATCH_SIZE}.")
+    parser.add_argument("--threads", "-@", type=int, default=1, help="Number of threads (one reads the fastq files, the others compress the chunks). Default to 1.")
+    args = parser.parse_args()
+    n_reads = split_fastq_pair(args.r1, args.r2, args.r1_outputs, args.r2_outputs, args.batch_size, args.threads)
+    print(f"{n_reads} read pairs split in {len(args.r1_outputs)} chunks.")
+
+
+if __name__ == "__main__":
+    main()
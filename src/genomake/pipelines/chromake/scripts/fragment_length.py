@@ -0,0 +1,122 @@
+"""
+The fragment_length module of chromake contains functions to compute the histogram of the fragment length (TLEN) of the aligned reads.
+
+The alignments are read once and the lengths are counted with a fixed-size numpy bincount, so the memory used doesn't depend on the number of reads.
+
+"""
+import argparse
+from array import array
+
+import numpy as np
+import pysam
+
+DEFAULT_MAX_LENGTH = 10000
+"""Fragment lengths up to this value are counted in the bincount array, longer ones (rare) are counted in a dict."""
+
+CHUNK_SIZE = 1_000_000
+"""Number of reads buffered before being added to the histogram."""
+
+
+def _add_chunk(counts: np.ndarray, overflow: dict, chunk: array) -> None:
+    """
+    Add a chunk of template lengths to the histogram.
+    """
+    if len(chunk) == 0:
+        return
+    values = np.abs(np.frombuffer(chunk, dtype=np.int64))
+    in_range = values < counts.shape[0]
+    counts += np.bincount(values[in_range], minlength=counts.shape[0])
+    if not in_range.all():
+        for value, count in zip(*np.unique(values[~in_range], return_counts=True)):
+            overflow[int(value)] = overflow.get(int(value), 0) + int(count)
+
+
+def fragment_length_histogram(alignment_path: str,
+                              threads: int = 1,
+                              max_length: int = DEFAULT_MAX_LENGTH) -> dict:
+    """
+    Count the absolute template length (TLEN) of all mapped reads of a SAM or BAM file.
+
+    Parameters
+    ----------
+    alignment_path : str
+        Path to a SAM or BAM file (the order of the reads doesn't matter).
+
+    threads : int
+        Number of threads used by htslib to decompress the file.
+
+    max_length : int
+        Size of the bincount array. Longer fragments are still counted.
+
+    Returns
+    -------
+    :
+        A dict associating each absolute template length to its number of reads (each mate is counted).
+    """
+    counts = np.zeros(max_length + 1, dtype=np.int64)
+    overflow = {}
+    chunk = array("q")
+    with pysam.AlignmentFile(alignment_path, "r", threads=max(threads, 1), check_sq=False) as fh:
+        for read in fh.fetch(until_eof=True):
+            if read.is_unmapped:
+                continue
+            chunk.append(read.template_length)
+            if len(chunk) >= CHUNK_SIZE:
+                _add_chunk(counts, overflow, chunk)
+                chunk = array("q")
+    _add_chunk(counts, overflow, chunk)
+
+    histogram = {int(length): int(counts[length]) for length in np.flatnonzero(counts)}
+    for length, count in overflow.items():
+        histogram[length] = histogram.get(length, 0) + count
+    return histogram
+
+
+def _format_half(count: int) -> str:
+    """
+    Format count/2 like awk print (integers as is, others with the '%.6g' OFMT).
+    """
+    if count % 2 == 0:
+        return str(count // 2)
+    return "%.6g" % (count / 2)
+
+
+def write_fragment_length(histogram: dict, output_path: str) -> str:
+    """
+    Write the fragment length histogram in the two-column format of the pipeline (length, number of fragments).
+
+    The lines are in the order of `sort | uniq -c` (lexicographic order of the lengths) and the number of reads is divided by 2 to count fragments, so the file is identical to the one created by the previous shell command.
+
+    Parameters
+    ----------
+    histogram : dict
+        Dict returned by [](`genomake.pipelines.chromake.scripts.fragment_length.fragment_length_histogram`).
+
+    output_path : str
+        Path of the file to write.
+
+    Returns
+    -------
+    str
+        Path to the written file.
+    """
+    with open(output_path, "w", encoding="utf-8") as fh:
+        for length in sorted(histogram, key=str):
+            fh.write(f"{length}\t{_format_half(histogram[length])}\n")
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compute the fragment length histogram of a SAM/BAM file in a single pass."
+    )
+    parser.add_argument("--input", "-i", type=str, required=True, help="SAM or BAM file.")
+    parser.add_argument("--output", "-o", type=str, required=True, help="Two-column histogram to write.")
+    parser.add_argument("--threads", "-@", type=int, default=1, help="Number of decompression threads. Default to 1.")
+    parser.add_argument("--max-length", type=int, default=DEFAULT_MAX_LENGTH, help=f"Size of the bincount array. Default to {DEFAULT_MAX_LENGTH}.")
+    args = parser.parse_args()
+    write_fragment_length(fragment_length_histogram(args.input, args.threads, args.max_length), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+The fragment_store module of chromake contains functions to write and read the binary fragment files of the samples (FRAGMENTS/<sample>.npy and FRAGMENTS/<sample>.index.tsv).
+
+A fragment store contains the same fragments as BED/<sample>_sorted.bed in a columnar format: a (2, n) int32 numpy array (first row: starts, second row: ends, 0-based half-open) where the fragments of each chromosome are contiguous and sorted by start then end. The index file gives, for each chromosome, the position of its first fragment and its number of fragments. The array is memory-mapped when read, so a consumer only loads the chromosomes it uses and never parses text.
+
+"""
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+
+STORE_DTYPE = np.int32
+"""Type of the coordinates stored (chromosomes must be shorter than 2^31 bp)."""
+
+WRITE_CHUNK = 1_000_000
+"""Number of lines formatted at once when a store is written as a bed file."""
+
+
+def _check_coordinates(name: str, ends: np.ndarray) -> None:
+    if len(ends) and int(ends.max()) > np.iinfo(STORE_DTYPE).max:
+        raise RuntimeError(f"A fragment of {name} ends after {np.iinfo(STORE_DTYPE).max}, it can't be stored as {np.dtype(STORE_DTYPE).name}.")
+
+
+def get_fragment_store_paths(prefix: str) -> tuple:
+    """
+    Get the paths of the two files of a fragment store.
+
+    Parameters
+    ----------
+    prefix : str
+        Path of the store without extension (e.g. <PATH>/FRAGMENTS/<sample>).
+
+    Returns
+    -------
+    tuple
+        The paths of the array (<prefix>.npy) and of the index (<prefix>.index.tsv).
+    """
+    return str(prefix) + ".npy", str(prefix) + ".index.tsv"
+
+
+def write_fragment_store(prefix: str, chromosomes: list) -> int:
+    """
+    Write a fragment store.
+
+    Parameters
+    ----------
+    prefix : str
+        Path of the store without extension.
+
+    chromosomes : list
+        List of (chromosome, fragments) in the order of the store. `fragments` is a (2, n) array of the starts and ends of the chromosome sorted by start then end, or the path to a .npy file of such an array (see [](`genomake.pipelines.chromake.scripts.fragment_store.save_chromosome`)).
+
+    Returns
+    -------
+    int
+        The number of fragments written.
+    """
+    array_path, index_path = get_fragment_store_paths(prefix)
+    Path(array_path).parent.mkdir(parents=True, exist_ok=True)
+    chromosomes = [
+        (chrom, np.load(fragments, mmap_mode="r") if isinstance(fragments, (str, os.PathLike)) else fragments)
+        for chrom, fragments in chromosomes
+    ]
+    total = sum(fragments.shape[1] for _, fragments in chromosomes)
+
+    # write in temporary files so an interrupted job never leaves a truncated store
+    tmp_array = array_path + ".tmp.npy"
+    store = np.lib.format.open_memmap(tmp_array, mode="w+", dtype=STORE_DTYPE, shape=(2, total))
+    first = 0
+    with open(index_path + ".tmp", "w", encoding="utf-8") as fh:
+        for chrom, fragments in chromosomes:
+            count = fragments.shape[1]
+            if fragments.dtype != STORE_DTYPE:
+                _check_coordinates(chrom, fragments[1])
+            store[:, first:first + count] = fragments
+            fh.write(f"{chrom}\t{first}\t{count}\n")
+            first += count
+    store.flush()
+    del store
+    os.replace(tmp_array, array_path)
+    os.replace(index_path + ".tmp", index_path)
+    return total
+
+
+def save_chromosome(path: str, starts: np.ndarray, ends: np.ndarray) -> str:
+    """
+    Save the fragments of a chromosome in a temporary .npy file of shape (2, n), used to build a store from several processes.
+    """
+    _check_coordinates(path, ends)
+    np.save(path, np.vstack([starts, ends]).astype(STORE_DTYPE, copy=False).reshape(2, -1))
+    return path
+
+
+def read_fragment_index(prefix: str) -> dict:
+    """
+    Read the index of a fragment store.
+
+    Parameters
+    ----------
+    prefix : str
+        Path of the store without extension.
+
+    Returns
+    -------
+    dict
+        A dict associating each chromosome to the (first, count) of its fragments, in the order of the store.
+    """
+    index = {}
+    with open(get_fragment_store_paths(prefix)[1], "r", encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            chrom, first, count = line.rstrip("\n").split("\t")
+            index[chrom] = (int(first), int(count))
+    return index
+
+
+def open_fragment_store(prefix: str) -> dict:
+    """
+    Open a fragment store without loading it in memory.
+
+    Parameters
+    ----------
+    prefix : str
+        Path of the store without extension.
+
+    Returns
+    -------
+    dict
+        A dict associating each chromosome to its (starts, ends) int32 arrays. The arrays are read-only views of the memory-mapped store.
+    """
+    store = np.load(get_fragment_store_paths(prefix)[0], mmap_mode="r")
+    return {
+        chrom: (store[0, first:first + count], store[1, first:first + count])
+        for chrom, (first, count) in read_fragment_index(prefix).items()
+    }
+
+
+def fragment_store_from_bed(bed_path: str, prefix: str) -> int:
+    """
+    Convert a fragment file (BED/<sample>_sorted.bed) to a fragment store, e.g. for samples processed by a previous version of the pipeline.
+
+    Parameters
+    ----------
+    bed_path : str
+        Bed file of the fragments (chromosome, start, end), sorted by chromosome, start and end.
+
+    prefix : str
+        Path of the store to write, without extension.
+
+    Returns
+    -------
+    int
+        The number of fragments written.
+    """
+    chromosomes = {}
+    with open(bed_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            fields = line.split("\t", 3)
+            if len(fields) < 3:
+                continue
+            starts, ends = chromosomes.setdefault(fields[0], ([], []))
+            starts.append(int(fields[1]))
+            ends.append(int(fields[2]))
+    return write_fragment_store(prefix, [
+        (chrom, np.array([starts, ends], dtype=np.int64).reshape(2, -1))
+        for chrom, (starts, ends) in chromosomes.items()
+    ])
+
+
+def fragment_store_to_bed(prefix: str, bed_path: str) -> int:
+    """
+    Write the fragments of a store as a bed file (chromosome, start, end).
+
+    Parameters
+    ----------
+    prefix : str
+        Path of the store without extension.
+
+    bed_path : str
+        Path of the bed file to write.
+
+    Returns
+    -------
+    int
+        The number of fragments written.
+    """
+    total = 0
+    with open(bed_path, "w", encoding="utf-8") as fh:
+        for chrom, (starts, ends) in open_fragment_store(prefix).items():
+            for first in range(0, len(starts), WRITE_CHUNK):
+                fh.write("".join(
+                    f"{chrom}\t{start}\t{end}\n"
+                    for start, end in zip(starts[first:first + WRITE_CHUNK].tolist(), ends[first:first + WRITE_CHUNK].tolist())
+                ))
+            total += len(starts)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert the fragment files of chromake between the bed and the binary fragment store formats."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    from_bed_parser = subparsers.add_parser("from-bed", help="Create a fragment store from a sorted fragment bed.")
+    from_bed_parser.add_argument("--input", "-i", type=str, required=True, help="Sorted fragment bed (BED/<sample>_sorted.bed).")
+    from_bed_parser.add_argument("--output", "-o", type=str, required=True, help="Path of the store without extension.")
+
+    to_bed_parser = subparsers.add_parser("to-bed", help="Write a fragment store as a bed file.")
+    to_bed_parser.add_argument("--input", "-i", type=str, required=True, help="Path of the store without extension.")
+    to_bed_parser.add_argument("--output", "-o", type=str, required=True, help="Bed file to write.")
+
+    args = parser.parse_args()
+    if args.command == "from-bed":
+        n_fragments = fragment_store_from_bed(args.input, args.output)
+    else:
+        n_fragments = fragment_store_to_bed(args.input, args.output)
+    print(f"{n_fragments} fragments written.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+The fragments module of chromake contains functions to create the fragment files of the samples (BED/<sample>_sorted.bed) and their coverage track from the aligned reads.
+
+It replaces the bedtools pipeline of the chromake (bamtobed -bedpe, fragment length filter, contig filter, blacklist removal, sort, genomecov, sort, and bedGraphToBigWig) by a single read of the bam. The chromosomes are processed in parallel and only the fragments of one chromosome per process are kept in memory. The coverage track is computed by the [coverage](`genomake.pipelines.chromake.scripts.coverage`) module.
+
+"""
+import argparse
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pysam
+
+from genomake.pipelines.chromake.scripts.contigs import read_allowed_contigs, read_chrom_sizes
+from genomake.pipelines.chromake.scripts.coverage import NORMALIZATIONS, chromosome_coverage, get_scale_factor, load_tracks, save_track, write_bigwig
+from genomake.pipelines.chromake.scripts.fragment_store import save_chromosome, write_fragment_store
+
+MAX_FRAGMENT_LENGTH = 1000
+"""Fragments of this length or longer are removed."""
+
+BLACKLIST_OVERLAP = 0.5
+"""Minimal reciprocal overlap between a fragment and a blacklisted region to remove the fragment (like `bedtools intersect -f 0.5 -r -v`)."""
+
+WRITE_CHUNK = 1_000_000
+"""Number of lines formatted at once when writing the text files."""
+
+
+def read_blacklist(blacklist_path: str) -> dict:
+    """
+    Read a bed file of blacklisted regions.
+
+    Parameters
+    ----------
+    blacklist_path : str
+        Path to the BLACKLIST_BED file of a sequencing.
+
+    Returns
+    -------
+    :
+        A dict associating each chromosome to a (n, 2) int64 array of the regions (start, end), sorted by start.
+    """
+    regions = {}
+    with open(blacklist_path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip() or line.startswith(("#", "track", "browser")):
+                continue
+            fields = line.split("\t")
+            regions.setdefault(fields[0], []).append((int(fields[1]), int(fields[2])))
+    return {
+        chrom: np.array(sorted(chrom_regions), dtype=np.int64).reshape(-1, 2)
+        for chrom, chrom_regions in regions.items()
+    }
+
+
+def chromosome_fragments(bam_path: str, chrom: str, max_length: int = MAX_FRAGMENT_LENGTH):
+    """
+    Get the fragments of the read pairs aligned on a chromosome.
+
+    A fragment starts at the start of the leftmost mate and ends at the end of the other mate (the R2 if both mates start at the same position), like the BEDPE of `bedtools bamtobed -bedpe`. Pairs with a mate on another chromosome are ignored.
+
+    Parameters
+    ----------
+    bam_path : str
+        Path to an indexed, coordinate-sorted bam.
+
+    chrom : str
+        Name of the chromosome.
+
+    max_length : int
+        Fragments of this length or longer are removed.
+
+    Returns
+    -------
+    :
+        Two int64 arrays (starts and ends, 0-based half-open) sorted by start then end.
+    """
+    starts = []
+    ends = []
+    pending = {}
+    with pysam.AlignmentFile(bam_path, "rb") as bam:
+        for read in bam.fetch(chrom):
+            if read.is_unmapped or read.is_secondary or read.is_supplementary or not read.is_paired:
+                continue
+            if read.mate_is_unmapped or read.next_reference_id != read.reference_id:
+                continue
+            mate = pending.pop(read.query_name, None)
+            if mate is None:
+                pending[read.query_name] = (read.reference_start, read.reference_end, read.is_read1)
+                continue
+            # order the mates like bedtools bamtobed -bedpe (R1 first in a name-sorted bam)
+            current = (read.reference_start, read.reference_end, read.is_read1)
+            first, second = (mate, current) if mate[2] else (current, mate)
+            if first[0] > second[0]:
+                first, second = second, first
+            if second[1] - first[0] < max_length:
+                starts.append(first[0])
+                ends.append(second[1])
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.array(ends, dtype=np.int64)
+    order = np.lexsort((ends, starts))
+    return starts[order], ends[order]
+
+
+def remove_blacklisted(starts: np.ndarray,
+                       ends: np.ndarray,
+                       regions: np.ndarray,
+                       fraction: float = BLACKLIST_OVERLAP,
+                       max_length: int = MAX_FRAGMENT_LENGTH):
+    """
+    Remove the fragments overlapping a blacklisted region with a reciprocal overlap (like `bedtools intersect -f fraction -r -v`).
+
+    Parameters
+    ----------
+    starts, ends : np.ndarray
+        Fragments of a chromosome, sorted by start.
+
+    regions : np.ndarray
+        Blacklisted regions of the chromosome ((n, 2) array).
+
+    fraction : float
+        Minimal fraction of the fragment and of the region that must overlap.
+
+    max_length : int
+        Maximal length of the fragments (used to limit the search).
+
+    Returns
+    -------
+    :
+        The starts and ends of the fragments kept.
+    """
+    if len(starts) == 0 or regions is None or len(regions) == 0:
+        return starts, ends
+    keep = np.ones(len(starts), dtype=bool)
+    for region_start, region_end in regions:
+        # a region can only match a fragment of at most max_length bp if it is shorter than max_length / fraction
+        if (region_end - region_start) * fraction > max_length:
+            continue
+        first = np.searchsorted(starts, region_start - max_length, side="left")
+        last = np.searchsorted(starts, region_end, side="left")
+        if first >= last:
+            continue
+        s = starts[first:last]
+        e = ends[first:last]
+        overlap = np.minimum(e, region_end) - np.maximum(s, region_start)
+        hit = (overlap > 0) & (overlap >= fraction * (e - s)) & (overlap >= fraction * (region_end - region_start))
+        keep[first:last] &= ~hit
+    return starts[keep], ends[keep]
+
+
+def _write_columns(fh, chrom: str, *columns) -> None:
+    """
+    Write tab-separated columns prefixed by the chromosome name.
+    """
+    columns = [c.tolist() for c in columns]
+    for first in range(0, len(columns[0]), WRITE_CHUNK):
+        rows = zip(*(c[first:first + WRITE_CHUNK] for c in columns))
+        fh.write("".join(chrom + "\t" + "\t".join(map(str, row)) + "\n" for row in rows))
+
+
+def _process_chromosome(bam_path: str,
+                        chrom: str,
+                        chrom_size: int,
+                        regions,
+                        tmp_dir: str,
+                        max_length: int,
+                        bin_size: int) -> tuple:
+    """
+    Create the fragments (text and binary) and the coverage track of a chromosome in temporary files (run in a worker process).
+    """
+    starts, ends = chromosome_fragments(bam_path, chrom, max_length)
+    n_fragments = len(starts)
+    starts, ends = remove_blacklisted(starts, ends, regions, max_length=max_length)
+    bed_path = Path(tmp_dir) / f"{chrom}.bed"
+    with open(bed_path, "w", encoding="utf-8") as fh:
+        _write_columns(fh, chrom, starts, ends)
+    npy_path = save_chromosome(str(Path(tmp_dir) / f"{chrom}.npy"), starts, ends)
+    track_path = save_track(str(Path(tmp_dir) / f"{chrom}.npz"), *chromosome_coverage(starts, ends, chrom_size, bin_size))
+    return chrom, str(bed_path), npy_path, track_path, len(starts), n_fragments - len(starts)
+
+
+def create_fragment_files(bam_path: str,
+                          sorted_bed_path: str,
+                          bigwig_path: str,
+                          allowlist_path: str,
+                          blacklist_path: str,
+                          chrom_size_path: str,
+                          threads: int = 1,
+                          max_length: int = MAX_FRAGMENT_LENGTH,
+                          store_prefix: str = None,
+                          bin_size: int = 1,
+                          normalization: str = "none") -> dict:
+    """
+    Create the sorted fragment file, the coverage track (bigWig) and optionally the binary fragment store of a sample.
+
+    Parameters
+    ----------
+    bam_path : str
+        Path to the indexed, coordinate-sorted bam of the sample.
+
+    sorted_bed_path : str
+        Path of the fragment file to write (chromosome, start, end), sorted like `bedtools sort`.
+
+    bigwig_path : str
+        Path of the coverage track to write.
+
+    allowlist_path : str
+        File of the contigs kept by the pipeline (see [](`genomake.pipelines.chromake.scripts.contigs.write_allowed_contigs`)).
+
+    blacklist_path : str
+        Bed file of the blacklisted regions.
+
+    chrom_size_path : str
+        Chromosome size file.
+
+    threads : int
+        Number of chromosomes processed in parallel.
+
+    max_length : int
+        Fragments of this length or longer are removed.
+
+    store_prefix : str
+        Path (without extension) of the fragment store to write (see [](`genomake.pipelines.chromake.scripts.fragment_store`)). No store is written if None.
+
+    bin_size : int
+        Size of the bins of the coverage track in bp (1 for the base resolution).
+
+    normalization : str
+        Normalization of the coverage track (see [](`genomake.pipelines.chromake.scripts.coverage.NORMALIZATIONS`)).
+
+    Returns
+    -------
+    dict
+        The number of fragments kept and of fragments removed by the blacklist for each chromosome.
+    """
+    allowed = set(read_allowed_contigs(allowlist_path))
+    blacklist = read_blacklist(blacklist_path)
+    chrom_sizes = read_chrom_sizes(chrom_size_path)
+    with pysam.AlignmentFile(bam_path, "rb") as bam:
+        # byte order of the chromosome names, like bedtools sort and sort -k1,1
+        chroms = sorted(c for c in bam.references if c in allowed and c in chrom_sizes)
+
+    stats = {}
+    chromosome_arrays = []
+    tracks = []
+    tmp_dir = tempfile.mkdtemp(prefix=".fragments_", dir=Path(sorted_bed_path).parent)
+    try:
+        with ProcessPoolExecutor(max_workers=max(threads, 1)) as pool:
+            futures = [
+                pool.submit(_process_chromosome, bam_path, chrom, chrom_sizes[chrom], blacklist.get(chrom), tmp_dir, max_length, bin_size)
+                for chrom in chroms
+            ]
+            with open(sorted_bed_path, "wb") as bed_out:
+                for future in futures:
+                    chrom, chrom_bed, chrom_npy, chrom_track, n_fragments, n_blacklisted = future.result()
+                    with open(chrom_bed, "rb") as fh:
+                        shutil.copyfileobj(fh, bed_out)
+                    os.remove(chrom_bed)
+                    chromosome_arrays.append((chrom, chrom_npy))
+                    tracks.append((chrom, chrom_track))
+                    stats[chrom] = {"FRAGMENTS": n_fragments, "BLACKLISTED": n_blacklisted}
+        if store_prefix is not None:
+            write_fragment_store(store_prefix, chromosome_arrays)
+        # the scale factor (CPM) needs the fragments of all chromosomes
+        scale = get_scale_factor(sum(s["FRAGMENTS"] for s in stats.values()), normalization)
+        write_bigwig(bigwig_path, [(chrom, chrom_sizes[chrom]) for chrom in chroms], load_tracks(tracks), scale, tmp_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Create the sorted fragment file and the coverage track of a sample from its coordinate-sorted bam."
+    )
+    parser.add_argument("--input", "-i", type=str, required=True, help="Indexed, coordinate-sorted bam.")
+    parser.add_argument("--sorted-bed", type=str, required=True, help="Fragment file to write.")
+    parser.add_argument("--bigwig", type=str, required=True, help="Coverage track to write.")
+    parser.add_argument("--allowlist", type=str, required=True, help="Contigs kept by the pipeline.")
+    parser.add_argument("--blacklist", type=str, required=True, help="Bed file of the blacklisted regions.")
+    parser.add_argument("--chrom-size", type=str, required=True, help="Chromosome size file.")
+    parser.add_argument("--threads", "-@", type=int, default=1, help="Number of chromosomes processed in parallel. Default to 1.")
+    parser.add_argument("--store", type=str, default=None, help="Path (without extension) of the binary fragment store to write. Default to no store.")
+    parser.add_argument("--bin-size", type=int, default=1, help="Size of the bins of the coverage track in bp. Default to 1 (base resolution).")
+    parser.add_argument("--normalization", type=str, default="none", choices=NORMALIZATIONS, help="Normalization of the coverage track. Default to none.")
+    parser.add_argument("--max-length", type=int, default=MAX_FRAGMENT_LENGTH, help=f"Fragments of this length or longer are removed. Default to {MAX_FRAGMENT_LENGTH}.")
+    args = parser.parse_args()
+    stats = create_fragment_files(
+        args.input, args.sorted_bed, args.bigwig, args.allowlist,
+        args.blacklist, args.chrom_size, args.threads, args.max_length, args.store,
+        args.bin_size, args.normalization
+    )
+    print(f"{sum(s['FRAGMENTS'] for s in stats.values())} fragments kept, {sum(s['BLACKLISTED'] for s in stats.values())} removed by the blacklist.")
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,386 @@ from pathlib import Path
 import re
 
 
+def get_sample_fastq(sample_data: dict, strand: str) -> list:
+    """
+    Get the fastq files of a sample for one strand.
+
+    The R1 and R2 fields of a sample can be a single path or a list of paths (one per sequencing lane).
+
+    Parameters
+    ----------
+    sample_data : dict
+        Dict representing a sample (or an input) in the configuration.
+
+    strand: str
+        R1 or R2.
+
+    Returns
+    -------
+    :
+        A list of paths (relative to the sequencing PATH), empty if the strand is missing.
+    """
+    fastq = sample_data.get(strand)
+    if not fastq:
+        return []
+    if isinstance(fastq, str):
+        return [fastq]
+    return list(fastq)
+
+
+def get_fastq_lanes(sample_data: dict) -> list:
+    """
+    Get the pairs of fastq files of a sample, one per sequencing lane.
+
+    Parameters
+    ----------
+    sample_data : dict
+        Dict representing a sample (or an input) in the configuration.
+
+    Returns
+    -------
+    :
+        A list of (R1, R2) tuples with the paths relative to the sequencing PATH.
+    """
+    return list(zip(get_sample_fastq(sample_data, "R1"), get_sample_fastq(sample_data, "R2")))
+
+
+def has_trimming(sequencing_data: dict) -> bool:
+    """
+    Check if the fastq of a sequencing are trimmed by cutadapt (both R1_ADAPTOR and R2_ADAPTOR are set).
+
+    Parameters
+    ----------
+    sequencing_data : dict
+        Dict representing a sequencing in the configuration.
+
+    Returns
+    -------
+    bool
+        True if the adaptors are trimmed.
+    """
+    return bool(sequencing_data.get("R1_ADAPTOR", "")) and bool(sequencing_data.get("R2_ADAPTOR", ""))
+
+
+def get_sample_units(sample_name: str, sample_data: dict) -> list:
+    """
+    Get the sequencing units (lanes) of a sample, trimmed and aligned by separate jobs.
+
+    Parameters
+    ----------
+    sample_name : str
+        Name of the sample (or of the input).
+
+    sample_data : dict
+        Dict representing a sample (or an input) in the configuration.
+
+    Returns
+    -------
+    :
+        A list of (unit, R1, R2) tuples. The unit is the sample name for a sample with a single lane, else <sample>_L<lane> (lanes numbered from 1). The fastq paths are relative to the sequencing PATH.
+    """
+    lanes = get_fastq_lanes(sample_data)
+    if len(lanes) == 1:
+        return [(sample_name, *lanes[0])]
+    return [(f"{sample_name}_L{lane_index}", r1, r2) for lane_index, (r1, r2) in enumerate(lanes, start=1)]
+
+
+def _fastqc_stem(fastq: str) -> str:
+    return re.sub(r"\.fastq(\.gz)?$", "", Path(fastq).name)
+
+
+def _fastqc_name(fastq: str) -> str:
+    return _fastqc_stem(fastq) + "_fastqc.html"
+
+
+def _trimmed_fastq(base: str, unit: str, strand: str) -> str:
+    return f"{base}/TRIMMED/{unit}_{strand}.fastq.gz"
+
+
+SAMPLE_ARTIFACTS = {
+    "fastq_raw": lambda base, name, units: [str(Path(base) / u[1]) for u in units] + [str(Path(base) / u[2]) for u in units],
+    "fastqc_raw": lambda base, name, units: [f"{base}/QC/FASTQC/RAW/{_fastqc_name(u[1])}" for u in units] + [f"{base}/QC/FASTQC/RAW/{_fastqc_name(u[2])}" for u in units],
+    "cutadapt": lambda base, name, units: [_trimmed_fastq(base, u[0], "R1") for u in units] + [_trimmed_fastq(base, u[0], "R2") for u in units],
+    "fastqc_trimmed": lambda base, name, units: [f"{base}/QC/FASTQC/TRIMMED/{u[0]}_{strand}_fastqc/fastqc_data.txt" for strand in ("R1", "R2") for u in units],
+    "bam": lambda base, name, units: [f"{base}/BAM/{name}.bam"],
+    "bam_filtered_coord": lambda base, name, units: [f"{base}/BAM/{name}_filtered.coordsort.bam"],
+    "bam_filtered_name": lambda base, name, units: [f"{base}/BAM/{name}_filtered.namesort.bam"],
+    "flagstat": lambda base, name, units: [f"{base}/QC/flagstat/{name}_flagstat.txt"],
+    "stats": lambda base, name, units: [f"{base}/QC/stats/{name}_stats.txt"],
+    "bedgraph": lambda base, name, units: [f"{base}/BEDGRAPH/{name}_UCSC_track.bedGraph"],
+    # the fragments are written sorted, so the bed mode gives the same file as bed_sorted
+    "bed": lambda base, name, units: [f"{base}/BED/{name}_sorted.bed"],
+    "bed_sorted": lambda base, name, units: [f"{base}/BED/{name}_sorted.bed"],
+    "fragment_store": lambda base, name, units: [f"{base}/FRAGMENTS/{name}.npy"],
+    "bins": lambda base, name, units: [f"{base}/BINS/{name}.npy"],
+}
+"""
+Files generated for each sample (and input) of a sequencing. Each function receives the sequencing PATH (normalized, without trailing '/'), the sample name and the units of the sample (see [](`genomake.pipelines.chromake.scripts.paths.get_sample_units`)). The per-lane files list all R1 then all R2. The paths are built as strings, as the index of a large configuration contains several hundred thousands of them.
+"""
+
+SEQUENCING_ARTIFACTS = {
+    "SEQUENCINGS": lambda base: [base],
+    "multiqc_raw": lambda base: [f"{base}/QC/MULTIQC/Raw_fastq.html"],
+    "multiqc_trimmed": lambda base: [f"{base}/QC/MULTIQC/Trimmed_fastq.html"],
+    "multiqc_bam": lambda base: [f"{base}/QC/MULTIQC/Bam_report.html"],
+    "correlation": lambda base: [f"{base}/QC/CORRELATION/coverage_matrix.npy", f"{base}/QC/CORRELATION/correlation_matrix.tsv", f"{base}/QC/CORRELATION/correlation_plot.png"],
+}
+"""Files generated once per sequencing."""
+
+TRIMMING_ARTIFACTS = ["cutadapt", "fastqc_trimmed", "multiqc_trimmed"]
+"""Files only generated for the sequencings with adaptor trimming."""
+
+
+class PathIndex:
+    """
+    Index of the files generated by the pipeline, built once from a configuration.
+
+    The files of each sequencing are computed when the index is created, so the lookups don't walk the configuration again; the files of a sample are generated from its units when they are requested. The lists returned don't contain duplicates and keep the order of the configuration (samples, then inputs). The index reflects the configuration at the time of its creation, and it can be pickled (see [](`genomake.pipelines.chromake.scripts.plan`)).
+
+    Parameters
+    ----------
+    cfg : dict
+        Dict representing the configuration of an analysis with the chromake pipeline.
+
+    Examples
+    --------
+    ```{.python}
+    index = PathIndex(cfg)
+    index.all_paths("bam_filtered_coord")
+    index.sequencing_paths("MO211", "flagstat")
+    index.sample_path("MO211", "USP7-YVL_S20", "bed_sorted")
+    ```
+    """
+
+    MODES = list(SEQUENCING_ARTIFACTS) + list(SAMPLE_ARTIFACTS)
+    """Accepted values of the mode argument of the lookups."""
+
+    def __init__(self, cfg: dict):
+        self._sequencing_paths = {}
+        self._samples = {}
+        self._units = {}
+        self._raw_fastqc = {}
+        self._sequencings = {}
+        for sequencing_name, sequencing_data in cfg["SEQUENCINGS"].items():
+            base = str(Path(sequencing_data["PATH"]))
+            trimming = has_trimming(sequencing_data)
+            samples = {**sequencing_data.get("SAMPLES", {}), **(sequencing_data.get("INPUT") or {})}
+            self._samples[sequencing_name] = {}
+            self._units[sequencing_name] = {}
+            self._raw_fastqc[sequencing_name] = {}
+            self._sequencings[sequencing_name] = (base, trimming, sequencing_data.get("PARAMETERS", {}).get("ALIGNMENT_CHUNKS", 1))
+            sequencing_paths = {mode: {} for mode in self.MODES}
+            for mode, artifact in SEQUENCING_ARTIFACTS.items():
+                if mode in TRIMMING_ARTIFACTS and not trimming:
+                    continue
+                sequencing_paths[mode].update(dict.fromkeys(artifact(base)))
+            for sample_name, sample_data in samples.items():
+                units = get_sample_units(sample_name, sample_data)
+                self._samples[sequencing_name][sample_name] = [unit for unit, _, _ in units]
+                for unit, r1, r2 in units:
+                    self._units[sequencing_name][unit] = (sample_name, r1, r2)
+                    self._raw_fastqc[sequencing_name][_fastqc_stem(r1)] = unit
+                    self._raw_fastqc[sequencing_name][_fastqc_stem(r2)] = unit
+                for mode, artifact in SAMPLE_ARTIFACTS.items():
+                    if mode in TRIMMING_ARTIFACTS and not trimming:
+                        continue
+                    sequencing_paths[mode].update(dict.fromkeys(artifact(base, sample_name, units)))
+            for mode, paths in sequencing_paths.items():
+                self._sequencing_paths[(sequencing_name, mode)] = list(paths)
+
+    def _check_mode(self, mode: str) -> None:
+        if mode not in self.MODES:
+            raise RuntimeError(f"Unknown mode '{mode}'. Accepted values are: {', '.join(self.MODES)}.")
+
+    def samples(self, sequencing_name: str) -> list:
+        """
+        Get the names of the samples and inputs of a sequencing.
+        """
+        return list(self._samples[sequencing_name])
+
+    def sample_paths(self, sequencing_name: str, sample_name: str, mode: str) -> list:
+        """
+        Get the files of a mode for a sample (or input) of a sequencing.
+
+        Parameters
+        ----------
+        sequencing_name : str
+            Name of the sequencing.
+
+        sample_name : str
+            Name of the sample or of the input.
+
+        mode : str
+            One of PathIndex.MODES (per-sample files only).
+
+        Returns
+        -------
+        list
+            The paths (empty for the trimming files of a sequencing without trimming).
+        """
+        self._check_mode(mode)
+        if mode not in SAMPLE_ARTIFACTS:
+            raise RuntimeError(f"The {mode} mode doesn't generate files for each sample.")
+        base, trimming, _ = self._sequencings[sequencing_name]
+        if mode in TRIMMING_ARTIFACTS and not trimming:
+            return []
+        units = [(unit, *self._units[sequencing_name][unit][1:]) for unit in self._samples[sequencing_name][sample_name]]
+        return SAMPLE_ARTIFACTS[mode](base, sample_name, units)
+
+    def sample_path(self, sequencing_name: str, sample_name: str, mode: str) -> str:
+        """
+        Get the file of a mode generating a single file per sample (such as bam_filtered_coord or bed_sorted).
+        """
+        paths = self.sample_paths(sequencing_name, sample_name, mode)
+        if len(paths) != 1:
+            raise RuntimeError(f"The {mode} mode has {len(paths)} files for the sample {sample_name} of the sequencing {sequencing_name}.")
+        return paths[0]
+
+    def sequencing_paths(self, sequencing_name: str, mode: str) -> list:
+        """
+        Get the files of a mode for a sequencing (the per-sequencing files and the files of all its samples and inputs).
+        """
+        self._check_mode(mode)
+        if sequencing_name not in self._samples:
+            raise RuntimeError(f"The configuration file don't contains a {sequencing_name} sequencing!")
+        return list(self._sequencing_paths[(sequencing_name, mode)])
+
+    def all_paths(self, mode: str) -> list:
+        """
+        Get the files of a mode for all sequencings.
+        """
+        self._check_mode(mode)
+        paths = {}
+        for sequencing_name in self._samples:
+            paths.update(dict.fromkeys(self._sequencing_paths[(sequencing_name, mode)]))
+        return list(paths)
+
+    def units(self, sequencing_name: str, sample_name: str) -> list:
+        """
+        Get the names of the units (lanes) of a sample (see [](`genomake.pipelines.chromake.scripts.paths.get_sample_units`)).
+        """
+        return list(self._samples[sequencing_name][sample_name])
+
+    def unit_sample(self, sequencing_name: str, unit: str) -> str:
+        """
+        Get the name of the sample of a unit.
+        """
+        return self._units[sequencing_name][unit][0]
+
+    def unit_fastq(self, sequencing_name: str, unit: str, mode: str = "fastq_raw") -> list:
+        """
+        Get the (R1, R2) fastq of a unit.
+
+        Parameters
+        ----------
+        sequencing_name : str
+            Name of the sequencing.
+
+        unit : str
+            Name of the unit.
+
+        mode : str
+            `fastq_raw` for the fastq of the configuration, `cutadapt` for the trimmed fastq, or `aligned` for the fastq given to bowtie2 (the trimmed fastq if the sequencing has adaptors, else the raw fastq).
+
+        Returns
+        -------
+        list
+            The paths of the R1 and R2 fastq.
+        """
+        base, trimming, _ = self._sequencings[sequencing_name]
+        _, r1, r2 = self._units[sequencing_name][unit]
+        if mode == "aligned":
+            mode = "cutadapt" if trimming else "fastq_raw"
+        if mode == "fastq_raw":
+            return [str(Path(base) / r1), str(Path(base) / r2)]
+        if mode == "cutadapt":
+            return [_trimmed_fastq(base, unit, "R1"), _trimmed_fastq(base, unit, "R2")]
+        raise RuntimeError(f"Unknown mode '{mode}'. Accepted values are: fastq_raw, cutadapt, aligned.")
+
+    def raw_fastqc_unit(self, sequencing_name: str, fastqc_stem: str) -> str:
+        """
+        Get the unit of a raw fastq from the name of its FastQC report (QC/FASTQC/RAW/<fastqc_stem>_fastqc.html, the name of the fastq without its .fastq or .fastq.gz extension).
+        """
+        return self._raw_fastqc[sequencing_name][fastqc_stem]
+
+    def raw_fastq(self, sequencing_name: str, fastqc_stem: str) -> str:
+        """
+        Get the raw fastq analyzed by a FastQC report (see [](`genomake.pipelines.chromake.scripts.paths.PathIndex.raw_fastqc_unit`)).
+        """
+        r1, r2 = self.unit_fastq(sequencing_name, self.raw_fastqc_unit(sequencing_name, fastqc_stem), "fastq_raw")
+        return r1 if _fastqc_stem(r1) == fastqc_stem else r2
+
+    def job_sample(self, sequencing_name: str, job_name: str, wildcard: str = "sample") -> tuple:
+        """
+        Get the sample of a job of a per-sample rule from its name (the value of its wildcard, which names its benchmark).
+
+        Parameters
+        ----------
+        sequencing_name : str
+            Name of the sequencing.
+
+        job_name : str
+            Name of the job: a sample, a unit, a chunk (<unit>_C<chunk>) or a raw fastq (named after its FastQC report, see [](`genomake.pipelines.chromake.scripts.paths.PathIndex.raw_fastqc_unit`)).
+
+        wildcard : str
+            `sample`, `unit`, `chunk` or `fastq`.
+
+        Returns
+        -------
+        tuple
+            The name of the sample and the number of jobs of the rule sharing the fastq of the sample (1 for a sample, the number of lanes for a unit, the number of chunks of all lanes for a chunk, and twice the number of lanes for a raw fastq), or (None, 0) if the job is not in the index.
+        """
+        if sequencing_name not in self._samples:
+            return None, 0
+        if wildcard == "sample":
+            return (job_name, 1) if job_name in self._samples[sequencing_name] else (None, 0)
+        if wildcard == "fastq":
+            unit = self._raw_fastqc[sequencing_name].get(job_name)
+        elif wildcard == "chunk":
+            match = re.fullmatch(r"(.+)_C(\d+)", job_name)
+            unit = match.group(1) if match and 1 <= int(match.group(2)) <= self._sequencings[sequencing_name][2] else None
+        else:
+            unit = job_name
+        if unit not in self._units[sequencing_name]:
+            return None, 0
+        sample_name = self._units[sequencing_name][unit][0]
+        n_units = len(self._samples[sequencing_name][sample_name])
+        parts = {"unit": n_units, "chunk": n_units * self._sequencings[sequencing_name][2], "fastq": 2 * n_units}[wildcard]
+        return sample_name, parts
+
+    def chunk_bams(self, sequencing_name: str, sample_name: str) -> list:
+        """
+        Get the bam files aligned by the chunk jobs of a sample (BAM/CHUNKS/<unit>_C<chunk>.bam), merged before the duplicate removal.
+        """
+        base, _, chunks = self._sequencings[sequencing_name]
+        return [
+            f"{base}/BAM/CHUNKS/{unit}_C{chunk_index}.bam"
+            for unit in self._samples[sequencing_name][sample_name]
+            for chunk_index in range(1, chunks + 1)
+        ]
+
+    def is_scattered(self, sequencing_name: str, sample_name: str) -> bool:
+        """
+        Check if the alignment of a sample is split in several jobs (several lanes or ALIGNMENT_CHUNKS above 1).
+        """
+        return len(self.chunk_bams(sequencing_name, sample_name)) > 1
+
+    def aligned_bam(self, sequencing_name: str, sample_name: str) -> str:
+        """
+        Get the bam of a sample after the alignment and the duplicate removal: BAM/<sample>_bowtie.bam when the sample is aligned by a single job, else BAM/<sample>_bowtie.merged.bam (written by the job merging the chunks).
+        """
+        base, _, _ = self._sequencings[sequencing_name]
+        if self.is_scattered(sequencing_name, sample_name):
+            return f"{base}/BAM/{sample_name}_bowtie.merged.bam"
+        return f"{base}/BAM/{sample_name}_bowtie.bam"
+
+
 def get_all_sequencings_related_paths(cfg: dict, mode: str) -> list:
     """
     Get the path to the files generated by the pipeline for the samples of all sequencings and projects.
 
+    It builds a [](`genomake.pipelines.chromake.scripts.paths.PathIndex`) at each call; create the index once to get the paths of several modes.
+
     Parameters
     ----------
     cfg : dict
@@ -17,119 +393,36 @@ def get_all_sequencings_related_paths(cfg: dict, mode: str) -> list:
     
     mode: str
         String representing the files to get. Accepted values are:
-            - sequencing (raw fastq)
+            - SEQUENCINGS (folder of the sequencings)
+            - fastq_raw (raw fastq)
+            - fastqc_raw (fastqc reports of the raw fastq)
             - multiqc_raw (multiqc report regrouping the fastqc of the raw fastq files)
             - cutadapt (fastq after adapter trimming)
-            - fastqc_trimmed (fastqc reports after the adapter trimming)
+            - fastqc_trimmed (QC metrics of the trimmed fastq, in the format of FastQC)
             - multiqc_trimmed (multiqc report after adapter trimming)
+            - multiqc_bam (multiqc report of the flagstat and stats of the bam files)
             - bam (bam files after alignment with bowtie2)
             - bam_filtered_coord (bam files after filtering the non-standard chromosomes and sorted by coordinate)
             - bam_filtered_name (bam files after filtering the non-standard chromosomes and sorted by name)
+            - flagstat (output of samtools flagstat on the bam files)
+            - stats (output of samtools stats on the bam files)
             - bedgraph (bedGrapg files generated by HOMER for UCSC visualisation)
+            - bed (fragment files, the same files as bed_sorted)
+            - bed_sorted (fragment files)
+            - fragment_store (binary fragment files, see genomake.pipelines.chromake.scripts.fragment_store)
+            - bins (fragment counts in genome-wide bins, see genomake.pipelines.chromake.scripts.bins)
+            - correlation (coverage matrix, Spearman correlation matrix and heatmap of the samples, see genomake.pipelines.chromake.scripts.correlation)
+        The trimming files (cutadapt, fastqc_trimmed, multiqc_trimmed) are only listed for the sequencings with adaptors.
     
     Returns
     -------
     :
         A list of file paths.
     """
-    res = []
-    for sequencing_name, sequencing_data in cfg["SEQUENCINGS"].items():
-        base = Path(sequencing_data["PATH"])
-        if mode == "SEQUENCINGS":
-            res.append(base)
-        elif mode == "fastq_raw":
-            for sample in sequencing_data.get("SAMPLES", {}).values():
-                if sample["R1"]:
-                    res.append(base / sample["R1"])
-                if sample["R2"]:
-                    res.append(base / sample["R2"])
-            if "INPUT" in sequencing_data:
-                for sample in sequencing_data.get("INPUT", {}).values():
-                    if sample["R1"]:
-                        res.append(base / sample["R1"])
-                    if sample["R2"]:
-                        res.append(base / sample["R2"])
-        elif mode == "fastqc_raw":
-            for sample in sequencing_data.get("SAMPLES", {}).values():
-                if sample["R1"]:
-                    res.append(base / "QC/FASTQC/RAW" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R1"]).name))
-                if sample["R2"]:
-                    res.append(base / "QC/FASTQC/RAW" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R2"]).name))
-            if "INPUT" in sequencing_data:
-                for sample in sequencing_data.get("INPUT", {}).values():
-                    if sample["R1"]:
-                        res.append(base / "QC/FASTQC/RAW" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R1"]).name))
-                    if sample["R2"]:
-                        res.append(base / "QC/FASTQC/RAW" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R2"]).name))
-        elif mode == "multiqc_raw":
-            res.append(base / "QC/MULTIQC/Raw_fastq.html")
-        elif mode == "multiqc_trimmed":
-            res.append(base / "QC/MULTIQC//Trimmed_fastq.html")
-        elif mode == "multiqc_bam":
-            res.append(base / "QC/MULTIQC/Bam_report.html")
-        elif mode == "cutadapt":
-            for sample in sequencing_data.get("SAMPLES", {}).values():
-                if sample["R1"]:
-                    res.append(base / "TRIMMED" / Path(sample["R1"]).name)
-                if sample["R2"]:
-                    res.append(base / "TRIMMED" / Path(sample["R2"]).name)
-            if "INPUT" in sequencing_data:
-                for sample in sequencing_data.get("INPUT", {}).values():
-                    if sample["R1"]:
-                        res.append(base / "TRIMMED" / Path(sample["R1"]).name)
-                    if sample["R2"]:
-                        res.append(base / "TRIMMED" / Path(sample["R2"]).name)
-        elif mode == "fastqc_trimmed":
-            for sample in sequencing_data.get("SAMPLES", {}).values():
-                if sample["R1"]:
-                    res.append(base / "QC/FASTQC/TRIMMED" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R1"]).name))
-                if sample["R2"]:
-                    res.append(base / "QC/FASTQC/TRIMMED" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R2"]).name))
-            if "INPUT" in sequencing_data:
-                for sample in sequencing_data.get("INPUT", {}).values():
-                    if sample["R1"]:
-                        res.append(base / "QC/FASTQC/TRIMMED" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R1"]).name))
-                    if sample["R2"]:
-                        res.append(base / "QC/FASTQC/TRIMMED" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R2"]).name))
-        elif mode == "bam":
-            for sample_name in sequencing_data["SAMPLES"].keys():
-                res.append(base / "BAM" / (sample_name + ".bam"))
-            if "INPUT" in sequencing_data:
-                for sample_name in sequencing_data["INPUT"].keys():
-                    res.append(base / "BAM" / (sample_name + ".bam"))
-        elif mode == "bam_filtered_coord":
-            for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                res.append(base / "BAM" / (sample_name + "_filtered.coordsort.bam"))
-            if "INPUT" in cfg["SEQUENCINGS"][sequencing_name]:
-                for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                    res.append(base / "BAM" / (sample_name + "_filtered.coordsort.bam"))
-        elif mode == "bam_filtered_name":
-            for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                res.append(base / "BAM" / (sample_name + "_filtered.namesort.bam"))
-            if "INPUT" in cfg["SEQUENCINGS"][sequencing_name]:
-                for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                    res.append(base / "BAM" / (sample_name + "_filtered.namesort.bam"))
-        elif mode == "bedgraph":
-            for sample_name in sequencing_data["SAMPLES"].keys():
-                res.append(base / "BEDGRAPH" / (sample_name + "_UCSC_track.bedGraph"))
-            if "INPUT" in sequencing_data:
-                for sample_name in sequencing_data["INPUT"].keys():
-                    res.append(base / "BEDGRAPH" / (sample_name + "_UCSC_track.bedGraph"))  
-        elif mode == "bed":
-            for sample_name in sequencing_data["SAMPLES"].keys():
-                res.append(base / "BED" / (sample_name + ".bed"))
-            if "INPUT" in sequencing_data:
-                for sample_name in sequencing_data["INPUT"].keys():
-                    res.append(base / "BED" / (sample_name + ".bed"))
-        elif mode == "bed_sorted":
-            for sample_name in sequencing_data["SAMPLES"].keys():
-                res.append(base / "BED" / (sample_name + "_sorted.bed"))
-            if "INPUT" in sequencing_data:
-                for sample_name in sequencing_data["INPUT"].keys():
-                    res.append(base / "BED" / (sample_name + "_sorted.bed"))
-        else:
-            print(f"There is an error, chromake.scripts.path.get_path dont recognize the {mode} mode!")      
-    return res
+    if mode not in PathIndex.MODES:
+        print(f"There is an error, chromake.scripts.path.get_path dont recognize the {mode} mode!")
+        return []
+    return PathIndex(cfg).all_paths(mode)
         
 def get_sequencings_related_paths(cfg: dict,
                                        sequencing_name: str,
@@ -137,6 +430,8 @@ def get_sequencings_related_paths(cfg: dict,
     """
     Get the path to the files generated by the pipeline for the samples of a specific sequencing.
 
+    It builds a [](`genomake.pipelines.chromake.scripts.paths.PathIndex`) at each call; create the index once to get the paths of several modes.
+
     Parameters
     ----------
     cfg : dict
@@ -146,132 +441,26 @@ def get_sequencings_related_paths(cfg: dict,
         String representing the name of the sequencing
     
     mode: str
-        String representing the files to get. Accepted values are:
-            - sequencing (raw fastq)
-            - multiqc_raw (multiqc report regrouping the fastqc of the raw fastq files)
-            - cutadapt (fastq after adapter trimming)
-            - fastqc_trimmed (fastqc reports after the adapter trimming)
-            - multiqc_trimmed (multiqc report after adapter trimming)
-            - bam (bam files after alignment with bowtie2)
-            - bam_filtered (bam files after filtering the non-standard chromosomes)
-            - flagstat (output of samtools flagstat on the bam files)
-            - stats (output of samtools stats on the bam files)
-            - multiqc_stats (multiqc on the folder containing the stats output)
+        String representing the files to get. Accepted values are the same as [](`genomake.pipelines.chromake.scripts.paths.get_all_sequencings_related_paths`).
     
     Returns
     -------
     :
         A list of all file paths.
     """
-    res = []
-    if sequencing_name in cfg["SEQUENCINGS"].keys():
-        base = Path(cfg["SEQUENCINGS"][sequencing_name]["PATH"])
-        if mode == "SEQUENCINGS":
-            res.append(base)
-        elif mode == "fastq_raw":
-            for sample in cfg["SEQUENCINGS"][sequencing_name].get("SAMPLES", {}).values():
-                if sample["R1"]:
-                    res.append(base / sample["R1"])
-                if sample["R2"]:
-                    res.append(base / sample["R2"])
-            if "INPUT" in cfg["SEQUENCINGS"][sequencing_name]:
-                for sample in cfg["SEQUENCINGS"][sequencing_name].get("INPUT", {}).values():
-                    if sample["R1"]:
-                        res.append(base / sample["R1"])
-                    if sample["R2"]:
-                        res.append(base / sample["R2"])
-        elif mode == "fastqc_raw":
-            for sample in cfg["SEQUENCINGS"][sequencing_name].get("SAMPLES", {}).values():
-                if sample["R1"]:
-                    res.append(base / "QC/FASTQC/RAW" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R1"]).name))
-                if sample["R2"]:
-                    res.append(base / "QC/FASTQC/RAW" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R2"]).name))
-            if "INPUT" in cfg["SEQUENCINGS"][sequencing_name]:
-                for sample in cfg["SEQUENCINGS"][sequencing_name].get("INPUT", {}).values():
-                    if sample["R1"]:
-                        res.append(base / "QC/FASTQC/RAW" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R1"]).name))
-                    if sample["R2"]:
-                        res.append(base / "QC/FASTQC/RAW" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R2"]).name))
-        elif mode == "multiqc_raw":
-            res.append(base / "QC/MULTIQC/Raw_fastq.html")
-        elif mode == "multiqc_trimmed":
-            res.append(base / "QC/MULTIQC//Trimmed_fastq.html")
-        elif mode == "multiqc_bam":
-            res.append(base / "QC/MULTIQC/Bam_report.html")
-        elif mode == "cutadapt":
-            for sample in cfg["SEQUENCINGS"][sequencing_name].get("SAMPLES", {}).values():
-                if sample["R1"]:
-                    res.append(base / "TRIMMED" / Path(sample["R1"]).name)
-                if sample["R2"]:
-                    res.append(base / "TRIMMED" / Path(sample["R2"]).name)
-            if "INPUT" in cfg["SEQUENCINGS"][sequencing_name]:
-                for inp in cfg["SEQUENCINGS"][sequencing_name].get("SAMPLES", {}).values():
-                    if sample["R1"]:
-                        res.append(base / "TRIMMED" / Path(inp["R1"]).name)
-                    if sample["R2"]:
-                        res.append(base / "TRIMMED" / Path(inp["R2"]).name)
-        elif mode == "fastqc_trimmed":
-            for sample in cfg["SEQUENCINGS"][sequencing_name].get("SAMPLES", {}).values():
-                if sample["R1"]:
-                    res.append(base / "QC/FASTQC/TRIMMED" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R1"]).name))
-                if sample["R2"]:
-                    res.append(base / "QC/FASTQC/TRIMMED" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(sample["R2"]).name))
-            if "INPUT" in cfg["SEQUENCINGS"][sequencing_name]:
-                for inp in cfg["SEQUENCINGS"][sequencing_name].get("SAMPLES", {}).values():
-                    if sample["R1"]:
-                        res.append(base / "QC/FASTQC/TRIMMED" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(inp["R1"]).name))
-                    if sample["R2"]:
-                        res.append(base / "QC/FASTQC/TRIMMED" / re.sub(r"\.fastq(\.gz)?$", "_fastqc.html", Path(inp["R2"]).name))
-        elif mode == "bam":
-            for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                res.append(base / "BAM" / (sample_name + ".bam"))
-            if "INPUT" in cfg["SEQUENCINGS"][sequencing_name]:
-                for sample_name in cfg["SEQUENCINGS"][sequencing_name]["INPUT"].keys():
-                    res.append(base / "BAM" / (sample_name + ".bam"))
-        elif mode == "bam_filtered_coord":
-            for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                res.append(base / "BAM" / (sample_name + "_filtered.coordsort.bam"))
-            if "INPUT" in cfg["SEQUENCINGS"][sequencing_name]:
-                for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                    res.append(base / "BAM" / (sample_name + "_filtered.coordsort.bam"))
-        elif mode == "bam_filtered_name":
-            for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                res.append(base / "BAM" / (sample_name + "_filtered.namesort.bam"))
-            if "INPUT" in cfg["SEQUENCINGS"][sequencing_name]:
-                for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                    res.append(base / "BAM" / (sample_name + "_filtered.namesort.bam"))
-        elif mode == "flagstat":
-            for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                res.append(base / "QC/flagstat" / (sample_name + "_flagstat.txt"))
-            if "INPUT" in cfg["SEQUENCINGS"][sequencing_name]:
-                for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                    res.append(base / "QC/flagstat" / (sample_name + "_flagstat.txt"))
-        elif mode == "stats":
-            for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                res.append(base / "QC/stats" / (sample_name + "_stats.txt"))
-            if "INPUT" in cfg["SEQUENCINGS"][sequencing_name]:
-                for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                    res.append(base / "QC/stats" / (sample_name + "_stats.txt"))
-        elif mode == "bed":
-            for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                res.append(base / "BED" / (sample_name + ".bed"))
-            if "INPUT" in cfg["SEQUENCINGS"][sequencing_name]:
-                for sample_name in cfg["SEQUENCINGS"][sequencing_name]["INPUT"].keys():
-                    res.append(base / "BED" / (sample_name + ".bed"))
-        elif mode == "bed_sorted":
-            for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                res.append(base / "BED" / (sample_name + "_sorted.bed"))
-            if "INPUT" in cfg["SEQUENCINGS"][sequencing_name]:
-                for sample_name in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].keys():
-                    res.append(base / "BED" / (sample_name + "_sorted.bed"))
-    else:
+    if sequencing_name not in cfg["SEQUENCINGS"].keys():
         print(f"There is an error, the configuration file don't contains a {sequencing_name} project!")
-    return res
+        return []
+    if mode not in PathIndex.MODES:
+        print(f"There is an error, chromake.scripts.path.get_path dont recognize the {mode} mode!")
+        return []
+    return PathIndex(cfg).sequencing_paths(sequencing_name, mode)
 
 
 def get_project_paths_for_macs(cfg: dict,
                                 project_name: str,
-                                mode: str
+                                mode: str,
+                                path_index: PathIndex = None
                                 ):
     """
     Get the files necessary for the macs2/macs3 rules of a project.
@@ -286,8 +475,12 @@ def get_project_paths_for_macs(cfg: dict,
     
     mode: str
         String indicating the output. Accepted values are:
-            - macs (dict with all inputs and the outputs of the macs3 command for all samples associated with the project)
+            - macs (dict with all inputs and the outputs of the macs3 command, and the fragment store counted in the peaks, for all samples associated with the project)
             - macs_output (list of all outputs of the macs3 command for the project)
+
+    path_index: PathIndex
+        Index of the files of the configuration. Built from cfg if None.
+
     Returns
     -------
     :
@@ -303,6 +496,8 @@ def get_project_paths_for_macs(cfg: dict,
         raise RuntimeError(f"The project {project_name} don't indicate any valid sequencing. Please add a sequencing or remove this project.")
     
     if mode == "macs":
+        if path_index is None:
+            path_index = PathIndex(cfg)
         res={}
         for sequencing_name in cfg["PROJECTS"][project_name]["SEQUENCINGS"]:
             if sequencing_name not in cfg["SEQUENCINGS"]:
@@ -311,12 +506,14 @@ def get_project_paths_for_macs(cfg: dict,
                 # ChIP-seq samples need an input when identifying the peaks
                 if "INPUT" not in cfg["SEQUENCINGS"][sequencing_name] or len(cfg["SEQUENCINGS"][sequencing_name]["INPUT"]) < 1:
                     raise RuntimeError(f"The type of the project {project_name} necessite an input for the callpeak command of macs but the associated {sequencing_name} don't list any.")
-                path_input_bed = str(Path( cfg["SEQUENCINGS"][sequencing_name]["PATH"]) / "BED" / (list(cfg["SEQUENCINGS"][sequencing_name]["INPUT"].keys())[0] + "_sorted.bed"))
+                path_input_bed = path_index.sample_path(sequencing_name, list(cfg["SEQUENCINGS"][sequencing_name]["INPUT"].keys())[0], "bed_sorted")
                 for sample_name, sample_data in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].items():
                     if sample_data["TYPE"] == cfg["PROJECTS"][project_name]["TYPE"]:
                         res["_".join([sequencing_name, sample_name])]={
                             "INPUT": path_input_bed,
-                            "SAMPLE": str(Path( cfg["SEQUENCINGS"][sequencing_name]["PATH"]) / "BED" / (sample_name + "_sorted.bed")),
+                            "SAMPLE": path_index.sample_path(sequencing_name, sample_name, "bed_sorted"),
+                            "FRAGMENTS": path_index.sample_path(sequencing_name, sample_name, "fragment_store"),
+                            "BINS": path_index.sample_path(sequencing_name, sample_name, "bins"),
                             "OUTDIR": str(Path(cfg["PROJECTS"][project_name]["PROJECT_PATH"]) / "peaks/"),
                             "NAME": "_".join(["macs",project_name, sequencing_name, sample_name])
                             }
@@ -325,7 +522,9 @@ def get_project_paths_for_macs(cfg: dict,
                 for sample_name, sample_data in cfg["SEQUENCINGS"][sequencing_name]["SAMPLES"].items():
                     if sample_data["TYPE"] == cfg["PROJECTS"][project_name]["TYPE"]:
                         res["_".join([sequencing_name, sample_name])]={
-                            "SAMPLE": str(Path( cfg["SEQUENCINGS"][sequencing_name]["PATH"]) / "BED" / (sample_name + "_sorted.bed")),
+                            "SAMPLE": path_index.sample_path(sequencing_name, sample_name, "bed_sorted"),
+                            "FRAGMENTS": path_index.sample_path(sequencing_name, sample_name, "fragment_store"),
+                            "BINS": path_index.sample_path(sequencing_name, sample_name, "bins"),
                             "OUTDIR": str(Path(cfg["PROJECTS"][project_name]["PROJECT_PATH"]) / "peaks/"),
                             "NAME": "_".join(["macs",project_name, sequencing_name, sample_name])
                             }
@@ -358,9 +557,71 @@ def get_project_paths_for_macs(cfg: dict,
         return res
     
 
+def get_project_consensus_peaks(cfg: dict, project_name: str) -> str:
+    """
+    Get the bed file of the consensus peaks of a project (peaks found in at least MIN_SAMPLES_FOR_PEAKS of its samples).
+
+    Parameters
+    ----------
+    cfg : dict
+        Dict representing the configuration of an analysis with the chromake pipeline.
+
+    project_name: str
+        String representing the name of the project in cfg
+
+    Returns
+    -------
+    str
+        The path of the bed file.
+    """
+    return str(Path(cfg["PROJECTS"][project_name]["PROJECT_PATH"]) / f"peaks/consensus_{project_name}.bed")
+
+
+def get_project_count_matrix(cfg: dict, project_name: str) -> list:
+    """
+    Get the files of the peak x sample count matrix of a project (see [](`genomake.pipelines.chromake.scripts.counts.get_count_matrix_paths`)).
+
+    Parameters
+    ----------
+    cfg : dict
+        Dict representing the configuration of an analysis with the chromake pipeline.
+
+    project_name: str
+        String representing the name of the project in cfg
+
+    Returns
+    -------
+    list
+        The paths of the sparse matrix (.npz), of its rows (.peaks.tsv) and of its columns (.samples.tsv).
+    """
+    prefix = Path(cfg["PROJECTS"][project_name]["PROJECT_PATH"]) / f"counts/counts_{project_name}"
+    return [f"{prefix}.npz", f"{prefix}.peaks.tsv", f"{prefix}.samples.tsv"]
+
+
+def get_project_correlation(cfg: dict, project_name: str) -> list:
+    """
+    Get the files comparing the coverage of the samples of a project (see [](`genomake.pipelines.chromake.scripts.correlation.compare_samples`)).
+
+    Parameters
+    ----------
+    cfg : dict
+        Dict representing the configuration of an analysis with the chromake pipeline.
+
+    project_name: str
+        String representing the name of the project in cfg
+
+    Returns
+    -------
+    list
+        The paths of the coverage matrix (.npy), of the correlation matrix (.tsv) and of the heatmap (.png).
+    """
+    prefix = Path(cfg["PROJECTS"][project_name]["PROJECT_PATH"]) / f"correlation/{project_name}"
+    return [f"{prefix}_coverage_matrix.npy", f"{prefix}_correlation_matrix.tsv", f"{prefix}_correlation_plot.png"]
+
+
 def get_all_project_peaks(cfg: dict):
     """
-    Get the files necessary for the macs3 rules of all projects.
+    Get the files created by the peak calling of all projects.
 
     Parameters
     ----------
@@ -370,15 +631,13 @@ def get_all_project_peaks(cfg: dict):
     Returns
     -------
     :
-        A list of files outputed by macs2 or macs3
+        A list of files outputed by macs2 or macs3, and of the consensus peaks, the count matrix and the correlation of the samples of each project
     """
     res = []
     if "PROJECTS" in cfg:
         for project_name in cfg["PROJECTS"].keys():
             res.extend(get_project_paths_for_macs(cfg, project_name, "macs_output"))
+            res.append(get_project_consensus_peaks(cfg, project_name))
+            res.extend(get_project_count_matrix(cfg, project_name))
+            res.extend(get_project_correlation(cfg, project_name))
     return res
-    
-    
-
-
-
@@ -0,0 +1,207 @@
+"""
+The peaks module of chromake contains functions to compute the consensus peaks of a project from the peaks called by macs on each of its samples.
+
+The peaks of all samples (narrowPeak or broadPeak files, only their first three columns are read) are merged by a sweep-line over the intervals sorted by chromosome and start: an interval opens a new region when it starts after the furthest end reached by the previous intervals of its chromosome (running maximum of the ends). The number of distinct samples with a peak in each region is counted, and the regions supported by at least MIN_SAMPLES_FOR_PEAKS samples are written as the consensus peaks of the project. All steps are vectorized with numpy, so hundreds of samples are merged in seconds.
+
+"""
+import argparse
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+_COORDINATE_BITS = 40
+"""Bits of the coordinates in the keys combining a chromosome and a position."""
+
+_TAB = ord("\t")
+_NEWLINE = ord("\n")
+_ZERO = ord("0")
+
+
+def _parse_integers(data: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    lengths = ends - starts
+    values = np.zeros(len(starts), dtype=np.int64)
+    for k in range(int(lengths.max(initial=0))):
+        digits = np.where(lengths > k, data[np.maximum(ends - 1 - k, 0)].astype(np.int64) - _ZERO, 0)
+        if digits.min() < 0 or digits.max() > 9:
+            raise RuntimeError("The coordinates of the peaks are not integers.")
+        values += digits * 10 ** k
+    return values
+
+
+def read_peak_file(path: str):
+    """
+    Read the intervals of a peak file (narrowPeak, broadPeak or bed) with numpy. The lines whose second field is not a number (header, track or comment lines) are skipped.
+
+    Parameters
+    ----------
+    path : str
+        Path to the peak file.
+
+    Returns
+    -------
+    :
+        The names of the chromosomes of the file, and the chromosome (index in the names), start and end of each peak.
+    """
+    data = np.fromfile(path, dtype=np.uint8)
+    if len(data) and data[-1] != _NEWLINE:
+        data = np.append(data, np.uint8(_NEWLINE))
+    line_ends = np.flatnonzero(data == _NEWLINE)
+    line_starts = np.concatenate([[0], line_ends[:-1] + 1]).astype(np.int64)
+    # tabs and newlines are the only bytes below the printable characters in a peak file
+    delimiters = np.flatnonzero(data <= _NEWLINE)
+    # the chromosome ends at the first delimiter of the line, the start and the end at the next two
+    first = np.searchsorted(delimiters, line_starts)
+    valid = (first + 2 < len(delimiters)) & (line_ends > line_starts)
+    first = first[valid]
+    line_starts, line_ends = line_starts[valid], line_ends[valid]
+    chrom_ends, start_ends, end_ends = delimiters[first], delimiters[first + 1], delimiters[first + 2]
+    valid = (data[chrom_ends] == _TAB) & (data[start_ends] == _TAB) & (end_ends <= line_ends)
+    valid &= (data[np.minimum(chrom_ends + 1, len(data) - 1)] >= _ZERO) & (data[np.minimum(chrom_ends + 1, len(data) - 1)] <= _ZERO + 9)
+    line_starts, chrom_ends, start_ends, end_ends = line_starts[valid], chrom_ends[valid], start_ends[valid], end_ends[valid]
+
+    starts = _parse_integers(data, chrom_ends + 1, start_ends)
+    ends = _parse_integers(data, start_ends + 1, end_ends)
+    # the chromosomes are identified by a hash of their name, computed for all lines at once
+    chrom_lengths = chrom_ends - line_starts
+    hashes = np.zeros(len(line_starts), dtype=np.uint64)
+    for k in range(int(chrom_lengths.max(initial=0))):
+        chars = np.where(chrom_lengths > k, data[np.minimum(line_starts + k, len(data) - 1)], 0).astype(np.uint64)
+        hashes = (hashes * np.uint64(1099511628211)) ^ chars
+    hashes ^= chrom_lengths.astype(np.uint64) << np.uint64(56)
+    sorted_hashes = np.sort(hashes)
+    distinct = sorted_hashes[np.concatenate([[True], sorted_hashes[1:] != sorted_hashes[:-1]])] if len(hashes) else sorted_hashes
+    chroms = np.searchsorted(distinct, hashes)
+    first_lines = np.zeros(len(distinct), dtype=np.int64)
+    first_lines[chroms[::-1]] = np.arange(len(chroms))[::-1]
+    names = [data[line_starts[line]:chrom_ends[line]].tobytes().decode() for line in first_lines]
+    return names, chroms, starts, ends
+
+
+def merge_intervals(chroms: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+    """
+    Merge overlapping intervals with a sweep-line (intervals that only touch are not merged).
+
+    Parameters
+    ----------
+    chroms : np.ndarray
+        Codes of the chromosomes of the intervals (integers, in the order of the output).
+
+    starts, ends : np.ndarray
+        Coordinates of the intervals (0-based, half-open).
+
+    Returns
+    -------
+    :
+        The order of the sorted intervals, the region of each sorted interval, and the chromosome codes, starts and ends of the regions.
+    """
+    # the chromosome is in the high bits of the keys, so the running maximum restarts on each chromosome
+    chroms = chroms.astype(np.int64)
+    order = np.argsort((chroms << _COORDINATE_BITS) | starts)
+    chroms = chroms[order]
+    starts = starts[order]
+    ends = ends[order]
+    if len(order) == 0:
+        return order, np.zeros(0, dtype=np.int64), chroms, starts, ends
+    start_keys = (chroms << _COORDINATE_BITS) | starts
+    reached = np.maximum.accumulate((chroms << _COORDINATE_BITS) | ends)
+    new_region = np.empty(len(order), dtype=bool)
+    new_region[0] = True
+    new_region[1:] = start_keys[1:] >= reached[:-1]
+    first = np.flatnonzero(new_region)
+    regions = np.cumsum(new_region) - 1
+    return order, regions, chroms[first], starts[first], np.maximum.reduceat(ends, first)
+
+
+def consensus_peaks(peak_files: list, min_samples: int = 1, threads: int = 1) -> dict:
+    """
+    Compute the consensus peaks of samples.
+
+    Parameters
+    ----------
+    peak_files : list
+        Peak files of the samples (one per sample).
+
+    min_samples : int
+        Minimal number of samples with a peak in a region to keep it.
+
+    threads : int
+        Number of peak files read in parallel.
+
+    Returns
+    -------
+    dict
+        The chrom, start, end and number of samples (n_samples) arrays of the consensus peaks, sorted by chromosome (in lexicographic order) and start.
+    """
+    with ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+        peaks = list(pool.map(read_peak_file, peak_files))
+    chrom_names = sorted({name for names, _, _, _ in peaks for name in names})
+    chrom_index = {name: index for index, name in enumerate(chrom_names)}
+    # the chromosomes of each file are coded by their index in the sorted names of all files
+    chrom_codes = np.concatenate([np.array([chrom_index[name] for name in names], dtype=np.int64)[chroms] if len(names) else chroms for names, chroms, _, _ in peaks])
+    starts = np.concatenate([sample_peaks[2] for sample_peaks in peaks])
+    ends = np.concatenate([sample_peaks[3] for sample_peaks in peaks])
+    samples = np.repeat(np.arange(len(peak_files)), [len(sample_peaks[2]) for sample_peaks in peaks])
+    if len(starts) and (ends.max() >= 1 << _COORDINATE_BITS or (ends < starts).any()):
+        raise RuntimeError("The peak files contain invalid coordinates.")
+
+    order, regions, region_chroms, region_starts, region_ends = merge_intervals(chrom_codes, starts, ends)
+    # distinct samples of each region
+    pairs = np.sort(regions * len(peak_files) + samples[order])
+    if len(pairs):
+        pairs = pairs[np.concatenate([[True], pairs[1:] != pairs[:-1]])]
+    n_samples = np.bincount(pairs // len(peak_files), minlength=len(region_starts))
+    kept = n_samples >= min_samples
+    return {
+        "chrom": np.array(chrom_names + [""], dtype=object)[region_chroms[kept]],
+        "start": region_starts[kept],
+        "end": region_ends[kept],
+        "n_samples": n_samples[kept],
+    }
+
+
+def write_consensus_peaks(consensus: dict, output: str, name_prefix: str = "peak") -> None:
+    """
+    Write consensus peaks as a bed file (chrom, start, end, name, number of samples, strand).
+
+    Parameters
+    ----------
+    consensus : dict
+        Consensus peaks (see [](`genomake.pipelines.chromake.scripts.peaks.consensus_peaks`)).
+
+    output : str
+        Path to the bed file.
+
+    name_prefix : str
+        Prefix of the names of the peaks (<prefix>_<index>).
+    """
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    tmp_output = f"{output}.{os.getpid()}.tmp"
+    with open(tmp_output, "w", encoding="utf-8") as fh:
+        fh.writelines(
+            f"{chrom}\t{start}\t{end}\t{name_prefix}_{index}\t{n_samples}\t.\n"
+            for index, (chrom, start, end, n_samples) in enumerate(
+                zip(consensus["chrom"], consensus["start"].tolist(), consensus["end"].tolist(), consensus["n_samples"].tolist()), start=1
+            )
+        )
+    os.replace(tmp_output, output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compute the consensus peaks of the samples of a project: the regions of overlapping peaks found in at least --min-samples samples."
+    )
+    parser.add_argument("-i", "--inputs", type=str, nargs="+", required=True, help="Peak files of the samples (narrowPeak, broadPeak or bed).")
+    parser.add_argument("-o", "--output", type=str, required=True, help="Bed file of the consensus peaks.")
+    parser.add_argument("--min-samples", type=int, default=1, help="Minimal number of samples with a peak in a region. Default to 1.")
+    parser.add_argument("--name-prefix", type=str, default="peak", help="Prefix of the names of the consensus peaks. Default to peak.")
+    parser.add_argument("-@", "--threads", type=int, default=1, help="Number of peak files read in parallel. Default to 1.")
+    args = parser.parse_args()
+    consensus = consensus_peaks(args.inputs, args.min_samples, args.threads)
+    write_consensus_peaks(consensus, args.output, args.name_prefix)
+    print(f"{len(consensus['start'])} consensus peaks found in at least {args.min_samples} of {len(args.inputs)} samples.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+The perf_report module of chromake contains functions to collect the benchmarks recorded by the rules of the pipeline and summarize where the cluster time is spent.
+
+The benchmarks are written by snakemake in the QC/BENCHMARKS/<rule kind>/<job>.tsv files of each sequencing (per-sample and per-sequencing rules) and of each project (peak calling, consensus peaks, counts and correlation of the project).
+
+"""
+import csv
+import math
+from pathlib import Path
+
+from genomake.pipelines.chromake.scripts.paths import PathIndex
+from genomake.pipelines.chromake.scripts.snakemake_functions import BENCHMARK_WILDCARDS, RESOURCE_MODELS
+
+BENCHMARK_FIELDS = ["s", "max_rss", "max_vms", "io_in", "io_out", "mean_load", "cpu_time"]
+"""Numeric fields of the snakemake benchmark files kept in the report."""
+
+PERCENTILES = [50, 90, 99]
+"""Percentiles of the wall time and of the memory reported for each kind of rule."""
+
+
+def _to_float(value: str):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _percentile(values: list, percentile: float):
+    """
+    Nearest-rank percentile of a list of values (None if the list is empty).
+    """
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return values[max(0, min(len(values) - 1, math.ceil(percentile / 100 * len(values)) - 1))]
+
+
+def collect_benchmarks(cfg: dict) -> list:
+    """
+    Collect the benchmarks of all sequencings and projects of a configuration.
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration file of the chromake pipeline
+
+    Returns
+    -------
+    list
+        A list of dict (one per job) with the SEQUENCING (empty for the project rules), PROJECT (empty for the sequencing rules), RULE and JOB fields and the fields of the last line of its benchmark (see BENCHMARK_FIELDS). Snakemake overwrites the benchmark of a job at each attempt, so it is the benchmark of the last attempt.
+    """
+    # the sequencing rules write their benchmarks in the sequencing folder, the project rules (macs, consensus peaks, counts, correlation) in the project folder
+    sources = [(sequencing_name, "", sequencing_data["PATH"]) for sequencing_name, sequencing_data in cfg.get("SEQUENCINGS", {}).items()]
+    sources += [("", project_name, project_data["PROJECT_PATH"]) for project_name, project_data in (cfg.get("PROJECTS") or {}).items()]
+    records = []
+    for sequencing_name, project_name, path in sources:
+        benchmark_dir = Path(path) / "QC/BENCHMARKS"
+        if not benchmark_dir.is_dir():
+            continue
+        for benchmark in sorted(benchmark_dir.glob("*/*.tsv")):
+            with open(benchmark, "r", encoding="utf-8") as fh:
+                rows = list(csv.DictReader(fh, delimiter="\t"))
+            if not rows:
+                continue
+            record = {
+                "SEQUENCING": sequencing_name,
+                "PROJECT": project_name,
+                "RULE": benchmark.parent.name,
+                "JOB": benchmark.stem,
+            }
+            for field in BENCHMARK_FIELDS:
+                record[field] = _to_float(rows[-1].get(field))
+            records.append(record)
+    return records
+
+
+def summarize_by_rule(records: list) -> list:
+    """
+    Summarize the benchmarks by kind of rule.
+
+    Parameters
+    ----------
+    records : list
+        List returned by [](`genomake.pipelines.chromake.scripts.perf_report.collect_benchmarks`).
+
+    Returns
+    -------
+    list
+        A list of dict (one per kind of rule, the most expensive first) with the number of jobs, the total wall and CPU hours, and the percentiles of the wall time (s) and of the memory (max_rss, MB).
+    """
+    by_rule = {}
+    for record in records:
+        by_rule.setdefault(record["RULE"], []).append(record)
+    summary = []
+    for rule, rule_records in by_rule.items():
+        row = {
+            "RULE": rule,
+            "JOBS": len(rule_records),
+            "WALL_HOURS": round(sum(r["s"] or 0 for r in rule_records) / 3600, 3),
+            "CPU_HOURS": round(sum(r["cpu_time"] or 0 for r in rule_records) / 3600, 3),
+        }
+        for percentile in PERCENTILES:
+            row[f"S_P{percentile}"] = _percentile([r["s"] for r in rule_records], percentile)
+        for percentile in PERCENTILES:
+            row[f"MAX_RSS_P{percentile}"] = _percentile([r["max_rss"] for r in rule_records], percentile)
+        row["MEAN_LOAD"] = _percentile([r["mean_load"] for r in rule_records], 50)
+        summary.append(row)
+    return sorted(summary, key=lambda row: row["WALL_HOURS"], reverse=True)
+
+
+def summarize_by_sample(records: list, cfg: dict) -> list:
+    """
+    Summarize the benchmarks by sample (all the per-sample rules of a sample, including its lanes, chunks and raw fastq).
+
+    The jobs are associated to their sample with [](`genomake.pipelines.chromake.scripts.paths.PathIndex.job_sample`), the jobs of the samples removed from the configuration are ignored.
+
+    Parameters
+    ----------
+    records : list
+        List returned by [](`genomake.pipelines.chromake.scripts.perf_report.collect_benchmarks`).
+
+    cfg : dict
+        Configuration file of the chromake pipeline
+
+    Returns
+    -------
+    list
+        A list of dict (one per sample, the slowest first) with the number of jobs, the total wall and CPU hours, and the largest memory used.
+    """
+    if not cfg.get("SEQUENCINGS"):
+        return []
+    path_index = PathIndex(cfg)
+    samples = {}
+    for sequencing_name in cfg["SEQUENCINGS"]:
+        for sample_name in path_index.samples(sequencing_name):
+            samples[(sequencing_name, sample_name)] = []
+    for record in records:
+        if record["RULE"] not in RESOURCE_MODELS:
+            # per-sequencing and project rules
+            continue
+        sample_name, _ = path_index.job_sample(record["SEQUENCING"], record["JOB"], BENCHMARK_WILDCARDS.get(record["RULE"], "sample"))
+        if sample_name is not None:
+            samples[(record["SEQUENCING"], sample_name)].append(record)
+    summary = []
+    for (sequencing_name, sample_name), sample_records in samples.items():
+        if not sample_records:
+            continue
+        summary.append({
+            "SEQUENCING": sequencing_name,
+            "SAMPLE": sample_name,
+            "JOBS": len(sample_records),
+            "WALL_HOURS": round(sum(r["s"] or 0 for r in sample_records) / 3600, 3),
+            "CPU_HOURS": round(sum(r["cpu_time"] or 0 for r in sample_records) / 3600, 3),
+            "MAX_RSS": max((r["max_rss"] for r in sample_records if r["max_rss"] is not None), default=None),
+            "SLOWEST_RULE": max(sample_records, key=lambda r: r["s"] or 0)["RULE"],
+        })
+    return sorted(summary, key=lambda row: row["WALL_HOURS"], reverse=True)
+
+
+def _write_tsv(rows: list, output_path: Path) -> None:
+    if not rows:
+        output_path.write_text("", encoding="utf-8")
+        return
+    with open(output_path, "w", encoding="utf-8", newline="") as fh:
+        writer = csv.DictWriter(fh, fieldnames=list(rows[0].keys()), delimiter="\t")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_perf_report(cfg: dict, output_prefix: str, top: int = 10) -> dict:
+    """
+    Collect the benchmarks of all sequencings and projects and write the performance report.
+
+    The files written are `<output_prefix>_jobs.tsv` (one line per job), `<output_prefix>_rules.tsv` (per-rule statistics and percentiles), `<output_prefix>_samples.tsv` (per-sample statistics) and `<output_prefix>_slowest.tsv` (the slowest jobs).
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration file of the chromake pipeline
+
+    output_prefix : str
+        Prefix of the files to write.
+
+    top : int
+        Number of jobs in the list of the slowest jobs.
+
+    Returns
+    -------
+    dict
+        The tables of the report ('jobs', 'rules', 'samples', 'slowest').
+    """
+    records = collect_benchmarks(cfg)
+    report = {
+        "jobs": records,
+        "rules": summarize_by_rule(records),
+        "samples": summarize_by_sample(records, cfg),
+        "slowest": sorted(records, key=lambda r: r["s"] or 0, reverse=True)[:top],
+    }
+    Path(output_prefix).parent.mkdir(parents=True, exist_ok=True)
+    for name, rows in report.items():
+        _write_tsv(rows, Path(f"{output_prefix}_{name}.tsv"))
+    return report
+
+
+def format_table(rows: list) -> str:
+    """
+    Format a list of dict as an aligned text table.
+    """
+    if not rows:
+        return "(no benchmark found)"
+    columns = list(rows[0].keys())
+    cells = [[str(c) for c in columns]] + [["" if row[c] is None else str(row[c]) for c in columns] for row in rows]
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(line, widths)) for line in cells)
@@ -0,0 +1,134 @@
+"""
+The plan module of chromake contains functions to compile the execution plan of a configuration and to cache it.
+
+The plan contains the configuration checked by [](`genomake.pipelines.chromake.scripts.config.check_config_format`) (with its default values), the [](`genomake.pipelines.chromake.scripts.paths.PathIndex`) of its files, and the inputs and outputs of the peak calling of each project. It is compiled once and written in a cache file named after the hash of the configuration, so the snakefile evaluated by each cluster job loads it instead of checking the configuration and generating the paths again.
+
+"""
+import copy
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+
+from genomake.pipelines.chromake.scripts.config import check_config_format
+from genomake.pipelines.chromake.scripts.paths import (PathIndex, get_project_consensus_peaks, get_project_correlation,
+                                                        get_project_count_matrix, get_project_paths_for_macs)
+
+PLAN_VERSION = 1
+"""Version of the format of the plans, part of their hash."""
+
+PLAN_CACHE_DIR = ".snakemake/chromake_plans"
+"""Folder of the cached plans, relative to the working directory of snakemake (shared by the controller and the cluster jobs)."""
+
+MAX_CACHED_PLANS = 20
+"""Number of plans kept in the cache folder (the most recently used)."""
+
+_SOURCES = ["config.py", "paths.py", "plan.py"]
+"""Modules whose code is part of the hash of the plans, so a new version of the pipeline never loads an older plan."""
+
+
+def get_plan_hash(cfg: dict) -> str:
+    """
+    Get the hash of the plan of a configuration.
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration of the chromake pipeline, as given to snakemake (before its check).
+
+    Returns
+    -------
+    str
+        The sha256 of the configuration, of PLAN_VERSION, and of the code of the modules generating the plan.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"chromake plan {PLAN_VERSION}\n".encode())
+    for source in _SOURCES:
+        digest.update((Path(__file__).parent / source).read_bytes())
+    digest.update(json.dumps(cfg, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def compile_plan(cfg: dict) -> dict:
+    """
+    Compile the execution plan of a configuration.
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration of the chromake pipeline. It is not modified.
+
+    Returns
+    -------
+    dict
+        A dict with the checked configuration (CONFIG), the index of its files (PATH_INDEX), the inputs of the macs rules of each project (MACS, see [](`genomake.pipelines.chromake.scripts.paths.get_project_paths_for_macs`)), and the outputs of the peak calling, consensus peaks, count matrix and correlation of each project (PEAKS, by project, with the MACS_OUTPUT, CONSENSUS_PEAKS, COUNT_MATRIX and CORRELATION keys).
+    """
+    checked_cfg = copy.deepcopy(cfg)
+    check_config_format(checked_cfg)
+    path_index = PathIndex(checked_cfg)
+    macs = {
+        project_name: get_project_paths_for_macs(checked_cfg, project_name, "macs", path_index)
+        for project_name in checked_cfg.get("PROJECTS", {})
+    }
+    peaks = {
+        project_name: {
+            "MACS_OUTPUT": get_project_paths_for_macs(checked_cfg, project_name, "macs_output"),
+            "CONSENSUS_PEAKS": get_project_consensus_peaks(checked_cfg, project_name),
+            "COUNT_MATRIX": get_project_count_matrix(checked_cfg, project_name),
+            "CORRELATION": get_project_correlation(checked_cfg, project_name),
+        }
+        for project_name in checked_cfg.get("PROJECTS", {})
+    }
+    return {"CONFIG": checked_cfg, "PATH_INDEX": path_index, "MACS": macs, "PEAKS": peaks}
+
+
+def _prune_cache(cache_dir: Path) -> None:
+    plans = sorted(cache_dir.glob("*.pickle"), key=lambda path: path.stat().st_mtime, reverse=True)
+    for plan_path in plans[MAX_CACHED_PLANS:]:
+        plan_path.unlink(missing_ok=True)
+
+
+def load_plan(cfg: dict, cache_dir: str = PLAN_CACHE_DIR) -> dict:
+    """
+    Load the execution plan of a configuration from the cache, or compile it and write it in the cache.
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration of the chromake pipeline, as given to snakemake.
+
+    cache_dir : str
+        Folder of the cached plans. The plan is compiled at each call if it is empty.
+
+    Returns
+    -------
+    dict
+        The plan (see [](`genomake.pipelines.chromake.scripts.plan.compile_plan`)).
+    """
+    if not cache_dir:
+        return compile_plan(cfg)
+    plan_path = Path(cache_dir) / (get_plan_hash(cfg) + ".pickle")
+    try:
+        with open(plan_path, "rb") as fh:
+            plan = pickle.load(fh)
+        # the modification time of the plans is used to keep the most recently used in the cache
+        os.utime(plan_path)
+        return plan
+    except FileNotFoundError:
+        pass
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        print(f"The cached plan {plan_path} can't be read, it is compiled again.")
+
+    plan = compile_plan(cfg)
+    try:
+        plan_path.parent.mkdir(parents=True, exist_ok=True)
+        # write in a temporary file so a job never reads a partial plan
+        tmp_path = plan_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as fh:
+            pickle.dump(plan, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, plan_path)
+        _prune_cache(plan_path.parent)
+    except OSError as error:
+        print(f"The plan can't be written in {plan_path.parent} ({error}), it will be compiled by each job.")
+    return plan
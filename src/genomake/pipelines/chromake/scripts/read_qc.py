@@ -0,0 +1,430 @@
+"""
+The read_qc module of chromake contains functions to compute the QC metrics of the trimmed reads while they are written, instead of running FastQC on the trimmed fastq.
+
+cutadapt writes the trimmed read pairs as an interleaved fastq on its standard output. The reads are split in their R1 and R2 files (compressed by a gzip process each) and their statistics are accumulated by batches with numpy: per base quality, per sequence quality, per base content, GC content, N content, length distribution, duplication levels and adapter content. A `<fastq>_fastqc/fastqc_data.txt` file (the format of FastQC, read by the fastqc module of MultiQC) is written for each fastq, so the trimmed reads are decompressed only once by the pipeline.
+
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+
+BATCH_SIZE = 100000
+"""Number of read pairs accumulated in a batch."""
+
+MAX_TRACKED_SEQUENCES = 100000
+"""Number of distinct sequences tracked for the duplication levels (like FastQC)."""
+
+DUPLICATION_PREFIX = 50
+"""Number of bases of the reads compared for the duplication levels."""
+
+ADAPTERS = {
+    "Illumina Universal Adapter": b"AGATCGGAAGAG",
+    "Illumina Small RNA 3' Adapter": b"TGGAATTCTCGG",
+    "Illumina Small RNA 5' Adapter": b"GATCGTCGGACT",
+    "Nextera Transposase Sequence": b"CTGTCTCTTATA",
+}
+"""Adapters searched in the reads (the default adapters of FastQC)."""
+
+QUALITY_OFFSET = 33
+"""Offset of the quality scores (Sanger / Illumina 1.8+)."""
+
+MAX_QUALITY = 94
+"""Number of quality scores (0 to 93)."""
+
+FASTQC_VERSION = "0.12.1"
+"""Version of FastQC whose format is written."""
+
+DUPLICATION_LEVELS = ["1", "2", "3", "4", "5", "6", "7", "8", "9", ">10", ">50", ">100", ">500", ">1k", ">5k", ">10k+"]
+DUPLICATION_BOUNDS = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 50, 100, 500, 1000, 5000, 10000]
+
+_BASE_CODES = np.full(256, 4, dtype=np.int64)
+for _code, _base in enumerate(b"ACGT"):
+    _BASE_CODES[_base] = _code
+    _BASE_CODES[ord(chr(_base).lower())] = _code
+
+
+class ReadStats:
+    """
+    Statistics of the reads of a fastq file, accumulated by batches.
+
+    Parameters
+    ----------
+    filename : str
+        Name of the fastq file (the name of the sample in MultiQC).
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.n_reads = 0
+        self.n_bases = 0
+        self.max_length = 0
+        self.quality_counts = np.zeros((0, MAX_QUALITY), dtype=np.int64)
+        self.base_counts = np.zeros((0, 5), dtype=np.int64)
+        self.length_counts = np.zeros(1, dtype=np.int64)
+        self.mean_quality_counts = np.zeros(MAX_QUALITY, dtype=np.int64)
+        self.gc_counts = np.zeros(101, dtype=np.int64)
+        self.adapter_counts = {name: np.zeros(0, dtype=np.int64) for name in ADAPTERS}
+        self.tracked = Counter()
+
+    def _grow(self, length: int) -> None:
+        if length <= self.max_length:
+            return
+        extra = length - self.max_length
+        self.quality_counts = np.vstack([self.quality_counts, np.zeros((extra, MAX_QUALITY), dtype=np.int64)])
+        self.base_counts = np.vstack([self.base_counts, np.zeros((extra, 5), dtype=np.int64)])
+        self.length_counts = np.concatenate([self.length_counts, np.zeros(extra, dtype=np.int64)])
+        for name in ADAPTERS:
+            self.adapter_counts[name] = np.concatenate([self.adapter_counts[name], np.zeros(extra, dtype=np.int64)])
+        self.max_length = length
+
+    def add_batch(self, sequences: list, qualities: list) -> None:
+        """
+        Add a batch of reads to the statistics.
+
+        Parameters
+        ----------
+        sequences : list
+            Sequence lines of the reads (bytes ending with a newline).
+
+        qualities : list
+            Quality lines of the reads (bytes ending with a newline).
+        """
+        n = len(sequences)
+        if n == 0:
+            return
+        line_lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=n)
+        lengths = line_lengths - 1
+        joined = b"".join(sequences)
+        seq = np.frombuffer(joined, dtype=np.uint8)
+        qual = np.frombuffer(b"".join(qualities), dtype=np.uint8)
+        if len(seq) != len(qual):
+            raise RuntimeError(f"The sequences and the qualities of the reads of {self.filename} don't have the same length.")
+        self._grow(int(lengths.max()))
+        length = self.max_length
+
+        # position of each base in its read, without the newlines
+        line_starts = np.cumsum(line_lengths) - line_lengths
+        bases = seq != ord("\n")
+        positions = (np.arange(len(seq)) - np.repeat(line_starts, line_lengths))[bases]
+        codes = _BASE_CODES[seq[bases]]
+        scores = qual[bases].astype(np.int64) - QUALITY_OFFSET
+        if len(scores) and (scores.min() < 0 or scores.max() >= MAX_QUALITY):
+            raise RuntimeError(f"The quality scores of {self.filename} are not encoded as Sanger / Illumina 1.8+.")
+
+        self.quality_counts += np.bincount(positions * MAX_QUALITY + scores, minlength=length * MAX_QUALITY).reshape(length, MAX_QUALITY)
+        self.base_counts += np.bincount(positions * 5 + codes, minlength=length * 5).reshape(length, 5)
+        self.length_counts += np.bincount(lengths, minlength=length + 1)
+
+        # sums of each read (the empty reads are excluded)
+        read_starts = (np.cumsum(lengths) - lengths)[lengths > 0]
+        read_lengths = lengths[lengths > 0]
+        if len(read_starts):
+            mean_qualities = np.add.reduceat(scores, read_starts) // read_lengths
+            self.mean_quality_counts += np.bincount(mean_qualities, minlength=MAX_QUALITY)
+            gc = np.add.reduceat(((codes == 1) | (codes == 2)).astype(np.int64), read_starts)
+            acgt = np.add.reduceat((codes < 4).astype(np.int64), read_starts)
+            called = acgt > 0
+            self.gc_counts += np.bincount(np.rint(100 * gc[called] / acgt[called]).astype(np.int64), minlength=101)
+
+        for name, adapter in ADAPTERS.items():
+            offsets = _find_all(joined, adapter)
+            if len(offsets) == 0:
+                continue
+            reads = np.searchsorted(line_starts, offsets, side="right") - 1
+            # only the first occurrence of an adapter is counted in a read
+            _, first = np.unique(reads, return_index=True)
+            self.adapter_counts[name] += np.bincount(offsets[first] - line_starts[reads[first]], minlength=length)
+
+        tracked = self.tracked
+        if len(tracked) < MAX_TRACKED_SEQUENCES:
+            tracked.update(line[:DUPLICATION_PREFIX] for line in sequences)
+        else:
+            # once enough distinct sequences are tracked, only their duplicates are counted
+            for line in sequences:
+                key = line[:DUPLICATION_PREFIX]
+                if key in tracked:
+                    tracked[key] += 1
+
+        self.n_reads += n
+        self.n_bases += int(lengths.sum())
+
+    def _per_base_quality(self) -> list:
+        totals = self.quality_counts.sum(axis=1)
+        cumulative = self.quality_counts.cumsum(axis=1)
+        scores = np.arange(MAX_QUALITY)
+        rows = []
+        for position in range(self.max_length):
+            if totals[position] == 0:
+                continue
+            quantiles = [int(np.searchsorted(cumulative[position], fraction * totals[position])) for fraction in (0.5, 0.25, 0.75, 0.1, 0.9)]
+            mean = float((self.quality_counts[position] * scores).sum() / totals[position])
+            rows.append([position + 1, round(mean, 2), *quantiles])
+        return rows
+
+    def _duplication_levels(self):
+        counts = np.fromiter(self.tracked.values(), dtype=np.int64, count=len(self.tracked))
+        total = counts.sum()
+        if total == 0:
+            return 100.0, [[level, 0.0, 0.0] for level in DUPLICATION_LEVELS]
+        levels = np.searchsorted(DUPLICATION_BOUNDS, counts, side="right") - 1
+        distinct = np.bincount(levels, minlength=len(DUPLICATION_LEVELS))
+        reads = np.bincount(levels, weights=counts, minlength=len(DUPLICATION_LEVELS))
+        rows = [
+            [level, round(100 * distinct[i] / len(counts), 2), round(100 * reads[i] / total, 2)]
+            for i, level in enumerate(DUPLICATION_LEVELS)
+        ]
+        return round(100 * len(counts) / total, 2), rows
+
+    def write_fastqc_data(self, path: str) -> None:
+        """
+        Write the statistics in the format of the fastqc_data.txt file of FastQC.
+
+        The pass / warn / fail status of the modules use the default limits of FastQC. The duplication levels are computed on the tracked sequences, without the extrapolation of FastQC to the whole file.
+
+        Parameters
+        ----------
+        path : str
+            Path to the fastqc_data.txt file.
+        """
+        n_reads = max(self.n_reads, 1)
+        positions = range(1, self.max_length + 1)
+        acgt = self.base_counts[:, :4].sum(axis=1)
+        base_percents = 100 * self.base_counts[:, :4] / np.maximum(acgt, 1)[:, None]
+        position_totals = np.maximum(self.base_counts.sum(axis=1), 1)
+        n_percents = 100 * self.base_counts[:, 4] / position_totals
+        gc_percent = round(100 * self.base_counts[:, 1:3].sum() / max(self.base_counts[:, :4].sum(), 1))
+        lengths = np.flatnonzero(self.length_counts)
+        length_range = "0" if len(lengths) == 0 else str(lengths[0]) if lengths[0] == lengths[-1] else f"{lengths[0]}-{lengths[-1]}"
+        per_base_quality = self._per_base_quality()
+        deduplicated, duplication_rows = self._duplication_levels()
+        adapter_percents = {name: 100 * np.cumsum(counts) / n_reads for name, counts in self.adapter_counts.items()}
+
+        # expected GC content: normal distribution of same mean and standard deviation
+        gc_values = np.arange(101)
+        gc_total = self.gc_counts.sum()
+        gc_mean = (self.gc_counts * gc_values).sum() / max(gc_total, 1)
+        gc_std = np.sqrt((self.gc_counts * (gc_values - gc_mean) ** 2).sum() / max(gc_total, 1))
+        if gc_std > 0:
+            expected = np.exp(-0.5 * ((gc_values - gc_mean) / gc_std) ** 2)
+            expected = gc_total * expected / expected.sum()
+        else:
+            expected = self.gc_counts
+        gc_deviation = 100 * np.abs(self.gc_counts - expected).sum() / max(gc_total, 1)
+
+        statuses = {
+            "Basic Statistics": "pass",
+            "Per base sequence quality": _status(
+                any(row[3] < 5 or row[2] < 20 for row in per_base_quality),
+                any(row[3] < 10 or row[2] < 25 for row in per_base_quality),
+            ),
+            "Per sequence quality scores": _status(
+                self.mean_quality_counts.argmax() < 20, self.mean_quality_counts.argmax() < 27
+            ),
+            "Per base sequence content": _status(*(
+                (np.abs(base_percents[:, 0] - base_percents[:, 3]).max(initial=0) > limit
+                 or np.abs(base_percents[:, 1] - base_percents[:, 2]).max(initial=0) > limit)
+                for limit in (20, 10)
+            )),
+            "Per sequence GC content": _status(gc_deviation > 30, gc_deviation > 15),
+            "Per base N content": _status(n_percents.max(initial=0) > 20, n_percents.max(initial=0) > 5),
+            "Sequence Length Distribution": _status(self.length_counts[0] > 0, len(lengths) > 1),
+            "Sequence Duplication Levels": _status(deduplicated < 50, deduplicated < 80),
+            "Adapter Content": _status(*(
+                any(percents.max(initial=0) > limit for percents in adapter_percents.values()) for limit in (10, 5)
+            )),
+        }
+        modules = {
+            "Basic Statistics": (["Measure", "Value"], [
+                ["Filename", self.filename],
+                ["File type", "Conventional base calls"],
+                ["Encoding", "Sanger / Illumina 1.9"],
+                ["Total Sequences", self.n_reads],
+                ["Total Bases", self.n_bases],
+                ["Sequences flagged as poor quality", 0],
+                ["Sequence length", length_range],
+                ["%GC", gc_percent],
+            ]),
+            "Per base sequence quality": (
+                ["Base", "Mean", "Median", "Lower Quartile", "Upper Quartile", "10th Percentile", "90th Percentile"],
+                per_base_quality,
+            ),
+            "Per sequence quality scores": (
+                ["Quality", "Count"],
+                [[score, count] for score, count in enumerate(self.mean_quality_counts) if count],
+            ),
+            "Per base sequence content": (
+                ["Base", "G", "A", "T", "C"],
+                [[position, *(round(base_percents[position - 1, code], 2) for code in (2, 0, 3, 1))]
+                 for position in positions if acgt[position - 1]],
+            ),
+            "Per sequence GC content": (["GC Content", "Count"], [[gc, count] for gc, count in enumerate(self.gc_counts)]),
+            "Per base N content": (["Base", "N-Count"], [[position, round(n_percents[position - 1], 2)] for position in positions]),
+            "Sequence Length Distribution": (
+                ["Length", "Count"], [[length, self.length_counts[length]] for length in lengths]
+            ),
+            "Sequence Duplication Levels": (
+                ["Duplication Level", "Percentage of deduplicated", "Percentage of total"], duplication_rows
+            ),
+            "Adapter Content": (
+                ["Position", *ADAPTERS],
+                [[position, *(round(adapter_percents[name][position - 1], 2) for name in ADAPTERS)] for position in positions],
+            ),
+        }
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            fh.write(f"##FastQC\t{FASTQC_VERSION}\n")
+            for name, (header, rows) in modules.items():
+                fh.write(f">>{name}\t{statuses[name]}\n")
+                if name == "Sequence Duplication Levels":
+                    fh.write(f"#Total Deduplicated Percentage\t{deduplicated}\n")
+                fh.write("#" + "\t".join(header) + "\n")
+                for row in rows:
+                    fh.write("\t".join(str(value) for value in row) + "\n")
+                fh.write(">>END_MODULE\n")
+
+
+def _find_all(data: bytes, pattern: bytes) -> np.ndarray:
+    offsets = []
+    offset = data.find(pattern)
+    while offset >= 0:
+        offsets.append(offset)
+        offset = data.find(pattern, offset + 1)
+    return np.array(offsets, dtype=np.int64)
+
+
+def _status(fail: bool, warn: bool) -> str:
+    return "fail" if fail else "warn" if warn else "pass"
+
+
+def _open_writer(path: str, threads: int):
+    """
+    Open a compression process writing in path (pigz if it is installed, else gzip).
+    """
+    if shutil.which("pigz"):
+        command = ["pigz", "-1", "-c", "-p", str(max(threads, 1))]
+    else:
+        command = ["gzip", "-1", "-c"]
+    fh = open(path, "wb")
+    proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=fh)
+    fh.close()
+    return proc
+
+
+def get_report_path(output_dir: str, fastq: str) -> str:
+    """
+    Get the path of the fastqc_data.txt file of a fastq file.
+
+    Parameters
+    ----------
+    output_dir : str
+        Folder of the reports.
+
+    fastq : str
+        Path to the fastq file.
+
+    Returns
+    -------
+    str
+        `<output_dir>/<fastq name without .fastq.gz>_fastqc/fastqc_data.txt`, like an extracted FastQC report.
+    """
+    stem = re.sub(r"\.f(ast)?q(\.gz)?$", "", os.path.basename(fastq))
+    return str(Path(output_dir) / f"{stem}_fastqc" / "fastqc_data.txt")
+
+
+def split_interleaved_fastq(stream,
+                            r1_output: str,
+                            r2_output: str,
+                            r1_report: str,
+                            r2_report: str,
+                            threads: int = 1,
+                            batch_size: int = BATCH_SIZE) -> int:
+    """
+    Split an interleaved fastq stream in its R1 and R2 files and write the QC metrics of both files.
+
+    Parameters
+    ----------
+    stream :
+        Binary stream of the interleaved fastq (R1 and R2 records alternate).
+
+    r1_output, r2_output : str
+        Paths to the gzipped R1 and R2 fastq files to create.
+
+    r1_report, r2_report : str
+        Paths to the fastqc_data.txt files of the R1 and R2 fastq.
+
+    threads : int
+        Number of threads of each compression process (with pigz).
+
+    batch_size : int
+        Number of read pairs accumulated in a batch.
+
+    Returns
+    -------
+    int
+        The number of read pairs.
+    """
+    r1_stats = ReadStats(os.path.basename(r1_output))
+    r2_stats = ReadStats(os.path.basename(r2_output))
+    writers = [_open_writer(r1_output, threads), _open_writer(r2_output, threads)]
+    n_pairs = 0
+    pool = ThreadPoolExecutor(2)
+    try:
+        while True:
+            lines = list(islice(stream, 8 * batch_size))
+            if not lines:
+                break
+            if len(lines) % 8 != 0:
+                raise RuntimeError("The interleaved fastq is truncated: its number of lines is not a multiple of 8.")
+            if not lines[-1].endswith(b"\n"):
+                lines[-1] += b"\n"
+            r1_lines = [line for record in range(0, len(lines), 8) for line in lines[record:record + 4]]
+            r2_lines = [line for record in range(4, len(lines), 8) for line in lines[record:record + 4]]
+            # the reads are written by threads (the compression runs while the statistics are computed)
+            writes = [pool.submit(writers[0].stdin.writelines, r1_lines), pool.submit(writers[1].stdin.writelines, r2_lines)]
+            r1_stats.add_batch(r1_lines[1::4], r1_lines[3::4])
+            r2_stats.add_batch(r2_lines[1::4], r2_lines[3::4])
+            for write in writes:
+                write.result()
+            n_pairs += len(lines) // 8
+    finally:
+        pool.shutdown()
+        for proc in writers:
+            proc.stdin.close()
+        errors = [proc.wait() for proc in writers]
+    if any(errors):
+        raise RuntimeError(f"The compression of {r1_output} and {r2_output} failed.")
+    r1_stats.write_fastqc_data(r1_report)
+    r2_stats.write_fastqc_data(r2_report)
+    return n_pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Split the interleaved fastq written by cutadapt on the standard input in gzipped R1 and R2 files, and write their QC metrics in the format of FastQC (fastqc_data.txt)."
+    )
+    parser.add_argument("-o", dest="r1_output", type=str, required=True, help="R1 fastq file to create (gzipped).")
+    parser.add_argument("-p", dest="r2_output", type=str, required=True, help="R2 fastq file to create (gzipped).")
+    parser.add_argument("--report-dir", type=str, required=True, help="Folder of the reports (<fastq>_fastqc/fastqc_data.txt).")
+    parser.add_argument("-@", "--threads", type=int, default=1, help="Number of threads of each compression process. Default to 1.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"Number of read pairs accumulated in a batch. Default to {BATCH_SIZE}.")
+    args = parser.parse_args()
+    n_pairs = split_interleaved_fastq(
+        sys.stdin.buffer, args.r1_output, args.r2_output,
+        get_report_path(args.report_dir, args.r1_output), get_report_path(args.report_dir, args.r2_output),
+        args.threads, args.batch_size,
+    )
+    print(f"{n_pairs} read pairs written.")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,70 @@
 The snakemake_functions module contains functions called inside the snakefile.
 
 """
+import math
+from pathlib import Path
+
+from genomake.pipelines.chromake.scripts.paths import get_sample_fastq, has_trimming, PathIndex
+
+
+RESOURCE_MODELS = {
+    "fastqc_raw": {"CORES": 1, "MEM_BASE": 1000, "MEM_PER_GB": 0, "MEM_MAX": 1500, "MIN_BASE": 5, "CORE_MIN_PER_GB": 5, "MIN_MAX": 60, "THREADS_PER_GB": None},
+    "cutadapt": {"CORES": "CUTADAPT", "MEM_BASE": 1500, "MEM_PER_GB": 300, "MEM_MAX": 4000, "MIN_BASE": 10, "CORE_MIN_PER_GB": 20, "MIN_MAX": 60, "THREADS_PER_GB": 2},
+    "bowtie2": {"CORES": "BOWTIE2", "MEM_BASE": 8000, "MEM_PER_GB": 1500, "MEM_MAX": 20000, "MIN_BASE": 20, "CORE_MIN_PER_GB": 300, "MIN_MAX": 180, "THREADS_PER_GB": 4},
+    "bowtie2_picard": {"CORES": "BOWTIE2", "MEM_BASE": 8000, "MEM_PER_GB": 5000, "MEM_MAX": 60000, "MIN_BASE": 20, "CORE_MIN_PER_GB": 300, "MIN_MAX": 180, "THREADS_PER_GB": 4},
+    "bowtie2_chunk": {"CORES": "BOWTIE2", "MEM_BASE": 6000, "MEM_PER_GB": 4000, "MEM_MAX": 20000, "MIN_BASE": 20, "CORE_MIN_PER_GB": 300, "MIN_MAX": 120, "THREADS_PER_GB": 4},
+    "bowtie2_gather": {"CORES": "SAMTOOLS_QC", "MEM_BASE": 2000, "MEM_PER_GB": 500, "MEM_MAX": 8000, "MIN_BASE": 10, "CORE_MIN_PER_GB": 20, "MIN_MAX": 120, "THREADS_PER_GB": 1},
+    "bowtie2_gather_picard": {"CORES": "SAMTOOLS_QC", "MEM_BASE": 4000, "MEM_PER_GB": 3000, "MEM_MAX": 30000, "MIN_BASE": 10, "CORE_MIN_PER_GB": 20, "MIN_MAX": 120, "THREADS_PER_GB": 1},
+    "fastq_split": {"CORES": 4, "MEM_BASE": 1000, "MEM_PER_GB": 0, "MEM_MAX": 2000, "MIN_BASE": 10, "CORE_MIN_PER_GB": 10, "MIN_MAX": 60, "THREADS_PER_GB": None},
+    "bam_filter": {"CORES": "SAMTOOLS_QC", "MEM_BASE": 2000, "MEM_PER_GB": 200, "MEM_MAX": 4000, "MIN_BASE": 10, "CORE_MIN_PER_GB": 10, "MIN_MAX": 60, "THREADS_PER_GB": 1},
+    "bam_namesort": {"CORES": "SAMTOOLS_QC", "MEM_BASE": 2000, "MEM_PER_GB": 1500, "MEM_MAX": 10000, "MIN_BASE": 10, "CORE_MIN_PER_GB": 15, "MIN_MAX": 60, "THREADS_PER_GB": 1},
+    "homer": {"CORES": 1, "MEM_BASE": 4000, "MEM_PER_GB": 2000, "MEM_MAX": 16000, "MIN_BASE": 20, "CORE_MIN_PER_GB": 15, "MIN_MAX": 120, "THREADS_PER_GB": None},
+    "samtools_qc": {"CORES": "SAMTOOLS_QC", "MEM_BASE": 1000, "MEM_PER_GB": 100, "MEM_MAX": 2000, "MIN_BASE": 5, "CORE_MIN_PER_GB": 5, "MIN_MAX": 60, "THREADS_PER_GB": 1},
+    "bedtools": {"CORES": "BEDTOOLS", "MEM_BASE": 4000, "MEM_PER_GB": 4000, "MEM_MAX": 30000, "MIN_BASE": 20, "CORE_MIN_PER_GB": 25, "MIN_MAX": 180, "THREADS_PER_GB": 1},
+    "bins": {"CORES": 1, "MEM_BASE": 1000, "MEM_PER_GB": 100, "MEM_MAX": 3000, "MIN_BASE": 5, "CORE_MIN_PER_GB": 1, "MIN_MAX": 30, "THREADS_PER_GB": None},
+}
+"""
+Resource model of the per-sample rules. The input size is the size (in GB) of the raw fastq of the sample (or of the chunk) and:
+
+- memory (MB) = MEM_BASE + MEM_PER_GB * size, at most MEM_MAX unless calibrated from the benchmarks
+- threads = THREADS_PER_GB * size, between 1 and the CORES_PER_JOBS field named CORES (CORES is the number of threads if it is an int)
+- runtime (min) = MIN_BASE + CORE_MIN_PER_GB * size / threads
+
+When the size is unknown (fastq not found), MEM_MAX, MIN_MAX and the CORES_PER_JOBS value are used.
+"""
+
+BENCHMARK_WILDCARDS = {"fastqc_raw": "fastq", "cutadapt": "unit", "fastq_split": "unit", "bowtie2_chunk": "chunk"}
+"""Wildcard naming the benchmarks of the per-sample rules run on each raw fastq, lane or chunk (see [](`genomake.pipelines.chromake.scripts.paths.PathIndex.job_sample`)). The benchmarks of the other kinds of RESOURCE_MODELS are named after the sample."""
+
+MIN_BENCHMARKS_FOR_CALIBRATION = 3
+"""Number of benchmarks of a rule needed to replace the default MEM_PER_GB and CORE_MIN_PER_GB of its model."""
+
+CALIBRATION_MARGIN = 1.2
+"""Safety margin applied to the values calibrated from the benchmarks."""
+
+SCRATCH_SHELL_PREFIX = (
+    "set -euo pipefail; "
+    # create a private working folder in the scratch folder given as argument
+    "make_scratch() {{ mkdir -p \"$1\"; mktemp -d \"$1/chromake_XXXXXX\"; }}; "
+    # move files (source destination pairs) to their final path, the destination is only replaced once complete
+    "publish() {{ while [ $# -ge 2 ]; do mv -f \"$1\" \"$2.part\" && mv -f \"$2.part\" \"$2\"; shift 2; done; }}; "
+    # restore the outputs of a job from an entry of the alignment cache (fails if the entry is empty or not cached)
+    "cache_fetch() {{ [ -n \"$1\" ] && python -m genomake.pipelines.chromake.scripts.alignment_cache fetch --entry \"$@\"; }}; "
+    # store the outputs of a job in an entry of the alignment cache (entry, label, maximal size of the cache, files)
+    "cache_store() {{ if [ -n \"$1\" ]; then local entry=\"$1\" label=\"$2\" max_gb=\"$3\"; shift 3; "
+    "python -m genomake.pipelines.chromake.scripts.alignment_cache store --entry \"$entry\" --label \"$label\" --max-gb \"$max_gb\" \"$@\"; fi; }}; "
+)
+"""
+Prefix of the shell commands of the pipeline (see `shell.prefix` in the snakefile). It keeps the strict mode of snakemake and defines the shell functions used to stage the intermediate files of a job in a scratch folder:
+
+- `SCRATCH=$(make_scratch <scratch dir>)` creates a folder private to the job, removed by `trap 'rm -rf "$SCRATCH"' EXIT` on success and on failure
+- `publish <file in scratch> <output> ...` moves the final files to their output path, through a temporary '.part' file so an output is never seen partially written
+
+and the shell functions of the alignment cache (see [](`genomake.pipelines.chromake.scripts.alignment_cache`)):
+
+- `if cache_fetch <entry> <output> ...; then exit 0; fi` restores the outputs of a job from the cache, it fails when the entry is empty (cache disabled) or not in the cache
+- `cache_store <entry> <label> <max size in GB> <output> ...` stores the outputs of a job in the cache, it does nothing when the entry is empty
+"""
 
 
 def get_qos_from_time(attempt: int, default_time_min: int, cfg: dict)->str:
@@ -60,4 +124,551 @@ def detect_macs_version():
         CALLER = "macs2"
     else:
         raise RuntimeError("Neither MACS2 nor MACS3 is installed!")
-    return CALLER
\ No newline at end of file
+    return CALLER
+
+def get_benchmark_path(sequencing_data: dict, rule_kind: str, job_name: str) -> str:
+    """
+    Get the path of the benchmark file of a job. Benchmarks are written in the QC/BENCHMARKS folder of the sequencing, with one folder per kind of rule.
+
+    Parameters
+    ----------
+    sequencing_data : dict
+        Dict representing a sequencing in the configuration.
+
+    rule_kind : str
+        Kind of rule (key of RESOURCE_MODELS for the per-sample rules, e.g. 'bowtie2').
+
+    job_name : str
+        Name of the sample (or of the chunk) processed by the job.
+
+    Returns
+    -------
+    str
+        The path of the benchmark file.
+    """
+    return str(Path(sequencing_data["PATH"]) / "QC/BENCHMARKS" / rule_kind / (job_name + ".tsv"))
+
+
+def get_scratch_dir(cfg: dict, default_dir: str) -> str:
+    """
+    Get the folder where a job writes its intermediate files (SAM files, unsorted or unfiltered bam, sort temporary files...).
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration file of the chromake pipeline
+
+    default_dir : str
+        Folder used when SCRATCH_DIR is not set, usually the folder of the outputs of the job.
+
+    Returns
+    -------
+    str
+        SCRATCH_DIR if set (it can contain environment variables such as $TMPDIR that are expanded by the shell of the job, on the node running it), else `default_dir`.
+    """
+    if cfg.get("SCRATCH_DIR", ""):
+        return str(cfg["SCRATCH_DIR"])
+    return str(default_dir)
+
+
+BOWTIE2_INDEX_MB = 4000
+"""Memory (MB) of a bowtie2 job used by the index of the genome (about 3.5 GB for the human genome), not available to the sort of its output."""
+
+MIN_SORT_MEMORY_MB = 64
+"""Minimal memory (MB) per thread given to `samtools sort`."""
+
+
+def get_sort_memory(wildcards, threads: int, resources) -> str:
+    """
+    Get the memory per thread of the `samtools sort` of the output of bowtie2 (its -m option), so the sort buffers fit in the memory requested by the job.
+
+    It is used as a params function of the bowtie2 rules, snakemake gives it the threads and the resources of the job (the memory grows with the attempts).
+
+    Parameters
+    ----------
+    wildcards :
+        Wildcards of the job.
+
+    threads : int
+        Number of threads of the job, also used by `samtools sort`.
+
+    resources :
+        Resources of the job, with the mem_mb of the attempt.
+
+    Returns
+    -------
+    str
+        The memory per thread, e.g. '512M': the memory of the job without the bowtie2 index, with 20% left to the overhead of samtools, divided by the threads.
+    """
+    sort_mb = int((resources.mem_mb - BOWTIE2_INDEX_MB) * 0.8 / max(threads, 1))
+    return f"{max(sort_mb, MIN_SORT_MEMORY_MB)}M"
+
+
+GROUPED_SAMPLE_RULES = ["samtools_qc", "homer", "bins"]
+"""Kinds of the short per-sample rules grouped when JOB_GROUPING is set (see [](`genomake.pipelines.chromake.scripts.snakemake_functions.get_job_group`))."""
+
+GROUPED_SEQUENCING_RULES = ["multiqc_raw", "multiqc_trimmed", "multiqc_bam"]
+"""Kinds of the short per-sequencing rules grouped when JOB_GROUPING is set."""
+
+
+def get_job_group(cfg: dict, path_index: PathIndex, sequencing_name: str, rule_kind: str):
+    """
+    Get the group of a rule of a sequencing (group directive of snakemake), so the short steps run in one cluster job instead of one job each.
+
+    - with JOB_GROUPING 'sample', the short per-sample rules (GROUPED_SAMPLE_RULES) of each block of GROUP_SIZE consecutive samples of the sequencing are in the group <sequencing>_samples<block>
+    - with JOB_GROUPING 'sequencing', they are all in the group <sequencing>_short, whose jobs are run GROUP_SIZE at a time
+    - in both modes, the multiqc reports of the sequencing (GROUPED_SEQUENCING_RULES) are in the group <sequencing>_reports
+
+    The jobs of a group that don't depend on each other are only run together when the number of components of the group is given to snakemake (see [](`genomake.pipelines.chromake.scripts.snakemake_functions.get_group_components`)). Snakemake ignores the groups when the jobs are run locally.
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration file of the chromake pipeline
+
+    path_index : PathIndex
+        Index of the files of the configuration.
+
+    sequencing_name : str
+        Name of the sequencing of the rule.
+
+    rule_kind : str
+        Kind of the rule (e.g. samtools_qc).
+
+    Returns
+    -------
+    str, callable or None
+        The name of the group, a function of the wildcards giving it (per-sample rules with the 'sample' grouping), or None if the rule is not grouped.
+    """
+    mode = cfg.get("JOB_GROUPING", "none")
+    if mode == "none" or rule_kind not in GROUPED_SAMPLE_RULES + GROUPED_SEQUENCING_RULES:
+        return None
+    if rule_kind in GROUPED_SEQUENCING_RULES:
+        return f"{sequencing_name}_reports"
+    if mode == "sequencing":
+        return f"{sequencing_name}_short"
+    group_size = cfg.get("GROUP_SIZE", 5)
+    blocks = {sample: position // group_size for position, sample in enumerate(path_index.samples(sequencing_name))}
+    return lambda wildcards: f"{sequencing_name}_samples{blocks[wildcards.sample]}"
+
+
+def get_group_components(cfg: dict, path_index: PathIndex) -> dict:
+    """
+    Get the number of components of the groups of the pipeline (`--group-components` option of snakemake), i.e. the number of jobs independent from each other that are run in one cluster job.
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration file of the chromake pipeline
+
+    path_index : PathIndex
+        Index of the files of the configuration.
+
+    Returns
+    -------
+    dict
+        The number of components of each group (see [](`genomake.pipelines.chromake.scripts.snakemake_functions.get_job_group`)), empty if JOB_GROUPING is 'none'.
+    """
+    mode = cfg.get("JOB_GROUPING", "none")
+    group_size = cfg.get("GROUP_SIZE", 5)
+    components = {}
+    if mode == "none":
+        return components
+    for sequencing_name, sequencing_data in cfg["SEQUENCINGS"].items():
+        # the trimmed fastq report only exists for the sequencings with adaptors
+        components[f"{sequencing_name}_reports"] = len(GROUPED_SEQUENCING_RULES) - (0 if has_trimming(sequencing_data) else 1)
+        if mode == "sequencing":
+            components[f"{sequencing_name}_short"] = group_size
+        else:
+            n_blocks = -(-len(path_index.samples(sequencing_name)) // group_size)
+            for block in range(n_blocks):
+                components[f"{sequencing_name}_samples{block}"] = group_size * len(GROUPED_SAMPLE_RULES)
+    return components
+
+
+def get_sample_input_size_gb(sequencing_data: dict, sample_data: dict) -> float:
+    """
+    Get the size of the raw fastq (all lanes, R1 and R2) of a sample in GB.
+
+    Parameters
+    ----------
+    sequencing_data : dict
+        Dict representing a sequencing in the configuration.
+
+    sample_data : dict
+        Dict representing a sample (or an input) of the sequencing.
+
+    Returns
+    -------
+    float
+        The size in GB, or 0 if a fastq is missing (e.g. not yet copied).
+    """
+    size = 0
+    for strand in ("R1", "R2"):
+        for fastq in get_sample_fastq(sample_data, strand):
+            path = Path(sequencing_data["PATH"]) / fastq
+            if not path.exists():
+                return 0
+            size += path.stat().st_size
+    return size / 1e9
+
+
+def wildcards_lookup(lookup, sequencing_name: str, wildcard: str, *args):
+    """
+    Create a function of the wildcards of a job (for the input, params... of a wildcard rule) calling a lookup of a [](`genomake.pipelines.chromake.scripts.paths.PathIndex`).
+
+    Parameters
+    ----------
+    lookup : callable
+        Method of a PathIndex called as `lookup(sequencing_name, <value of the wildcard>, *args)`, e.g. `path_index.unit_fastq`.
+
+    sequencing_name : str
+        Name of the sequencing of the rule.
+
+    wildcard : str
+        Name of the wildcard given to the lookup (sample or unit).
+
+    *args
+        Other arguments of the lookup.
+
+    Returns
+    -------
+    callable
+        A function of the wildcards. The arguments are bound when it is created, so it can be created in a loop over the sequencings.
+    """
+    return lambda wildcards: lookup(sequencing_name, getattr(wildcards, wildcard), *args)
+
+
+def macs_lookup(peak_calling_data: dict, field: str):
+    """
+    Create a function of the wildcards of a macs job giving a field of its sample in the macs data of its project.
+
+    Parameters
+    ----------
+    peak_calling_data : dict
+        Inputs and outputs of the macs rules of a project, by sample (see [](`genomake.pipelines.chromake.scripts.paths.get_project_paths_for_macs`) with the macs mode).
+
+    field : str
+        Field of the sample (SAMPLE, INPUT, OUTDIR or NAME).
+
+    Returns
+    -------
+    callable
+        A function of the wildcards (the sample is the `macs_sample` wildcard, <sequencing>_<sample>).
+    """
+    return lambda wildcards: peak_calling_data[wildcards.macs_sample][field]
+
+
+def get_input_size_function(path_index: PathIndex, sequencing_name: str, sequencing_data: dict, wildcard: str = "sample", chunks: int = 1):
+    """
+    Create a function giving the size of the raw fastq processed by a job of a wildcard rule, used to estimate its resources.
+
+    The size of a sample is read once, when the first of its jobs is created.
+
+    Parameters
+    ----------
+    path_index : PathIndex
+        Index of the files of the configuration.
+
+    sequencing_name : str
+        Name of the sequencing of the rule.
+
+    sequencing_data : dict
+        Dict representing the sequencing in the configuration.
+
+    wildcard : str
+        `sample` for the per-sample rules, `unit` for the per-lane rules (the size of the sample is divided between its lanes), or `fastq` for the rules run on each raw fastq (named after its FastQC report, see [](`genomake.pipelines.chromake.scripts.paths.PathIndex.raw_fastqc_unit`)).
+
+    chunks : int
+        Number of parts of each lane processed by separate jobs (the size of the lane is divided between them): the chunks of the alignment, or 2 for the jobs run on the R1 and on the R2 fastq.
+
+    Returns
+    -------
+    callable
+        A function of the wildcards returning the size in GB (0 if a fastq is missing).
+    """
+    samples = {**sequencing_data.get("SAMPLES", {}), **(sequencing_data.get("INPUT") or {})}
+    sizes = {}
+
+    def input_size(wildcards) -> float:
+        if wildcard == "fastq":
+            sample_name = path_index.unit_sample(sequencing_name, path_index.raw_fastqc_unit(sequencing_name, wildcards.fastq))
+        elif wildcard == "unit":
+            sample_name = path_index.unit_sample(sequencing_name, wildcards.unit)
+        else:
+            sample_name = getattr(wildcards, wildcard)
+        if sample_name not in sizes:
+            sizes[sample_name] = get_sample_input_size_gb(sequencing_data, samples[sample_name])
+        size = sizes[sample_name]
+        if wildcard in ("unit", "fastq"):
+            size = size / len(path_index.units(sequencing_name, sample_name)) / chunks
+        return size
+
+    return input_size
+
+
+def get_cache_entry_function(cfg: dict, path_index: PathIndex, sequencing_name: str, sequencing_data: dict, stage: str, wildcard: str = "sample", cached_only: bool = False):
+    """
+    Create a function giving the entry of the alignment cache used by a job of a wildcard rule (see [](`genomake.pipelines.chromake.scripts.alignment_cache`)).
+
+    The keys of a sample are computed once, when the first of its jobs is created.
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration file of the chromake pipeline.
+
+    path_index : PathIndex
+        Index of the files of the configuration.
+
+    sequencing_name : str
+        Name of the sequencing of the rule.
+
+    sequencing_data : dict
+        Dict representing the sequencing in the configuration.
+
+    stage : str
+        Step of the rule: `trimming` (per-lane rules, with `wildcard` set to `unit`), `alignment`, `filter` or `fragments`.
+
+    wildcard : str
+        `sample` for the per-sample rules, or `unit` for the per-lane rules.
+
+    cached_only : bool
+        Only give the entries already in the cache.
+
+    Returns
+    -------
+    callable
+        A function of the wildcards returning the folder of the entry, or an empty string if ALIGNMENT_CACHE isn't set (or if a fastq of the sample is missing).
+    """
+    from genomake.pipelines.chromake.scripts.alignment_cache import get_entry_path, get_stage_keys, is_cached
+
+    cache_dir = cfg.get("ALIGNMENT_CACHE", "")
+    keys = {}
+
+    def cache_entry(wildcards) -> str:
+        if not cache_dir:
+            return ""
+        if wildcard == "unit":
+            sample_name = path_index.unit_sample(sequencing_name, wildcards.unit)
+        else:
+            sample_name = getattr(wildcards, wildcard)
+        if sample_name not in keys:
+            lanes = [path_index.unit_fastq(sequencing_name, unit, "fastq_raw") for unit in path_index.units(sequencing_name, sample_name)]
+            try:
+                keys[sample_name] = get_stage_keys(sequencing_data, lanes)
+            except OSError:
+                keys[sample_name] = None
+        if keys[sample_name] is None:
+            return ""
+        key = keys[sample_name][stage]
+        if wildcard == "unit":
+            key = key[path_index.units(sequencing_name, sample_name).index(wildcards.unit)]
+        entry = str(get_entry_path(cache_dir, key))
+        if cached_only and not is_cached(entry):
+            return ""
+        return entry
+
+    return cache_entry
+
+
+def get_aligned_bam_function(path_index: PathIndex, sequencing_name: str, alignment_entry):
+    """
+    Create a function giving the aligned bam of a sample: the bam of the alignment cache if the sample is in it (the alignment jobs of the sample are then not scheduled), else [](`genomake.pipelines.chromake.scripts.paths.PathIndex.aligned_bam`).
+
+    Parameters
+    ----------
+    path_index : PathIndex
+        Index of the files of the configuration.
+
+    sequencing_name : str
+        Name of the sequencing of the rule.
+
+    alignment_entry : callable
+        Function giving the cached alignment entry of a sample (see [](`genomake.pipelines.chromake.scripts.snakemake_functions.get_cache_entry_function`) with `cached_only`).
+
+    Returns
+    -------
+    callable
+        A function of the wildcards returning the path of the bam.
+    """
+    from genomake.pipelines.chromake.scripts.alignment_cache import STAGES, get_cached_file
+
+    def aligned_bam(wildcards) -> str:
+        entry = alignment_entry(wildcards)
+        if entry:
+            return get_cached_file(entry, STAGES["alignment"].index("aligned bam"))
+        return path_index.aligned_bam(sequencing_name, wildcards.sample)
+
+    return aligned_bam
+
+
+def _read_benchmark(path: Path) -> dict:
+    """
+    Read the last line of a snakemake benchmark file (the last repeat of the benchmark, the file is overwritten at each attempt of the job).
+    """
+    with open(path, "r", encoding="utf-8") as fh:
+        lines = [line.rstrip("\n").split("\t") for line in fh if line.strip()]
+    if len(lines) < 2:
+        return {}
+    record = {}
+    for key, value in zip(lines[0], lines[-1]):
+        try:
+            record[key] = float(value)
+        except ValueError:
+            continue
+    return record
+
+
+def _high_quantile(values: list, quantile: float = 0.9) -> float:
+    """
+    Get a high quantile of a list of values (nearest rank).
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, math.ceil(quantile * len(values)) - 1)]
+
+
+def load_benchmark_calibration(cfg: dict, path_index: PathIndex = None) -> dict:
+    """
+    Calibrate the resource model from the benchmarks recorded by previous runs of the pipeline.
+
+    For each kind of rule with enough benchmarks, the memory and the CPU time per GB of input are estimated as the 90th percentile of the ratios observed (max_rss above MEM_BASE and cpu_time of the benchmarks divided by the size of the raw fastq processed by the job), with a safety margin. The jobs run on each lane, chunk or raw fastq are associated to the size of their part of the fastq of their sample (see BENCHMARK_WILDCARDS), as in [](`genomake.pipelines.chromake.scripts.snakemake_functions.get_input_size_function`).
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration file of the chromake pipeline
+
+    path_index : PathIndex
+        Index of the files of the configuration. Built from cfg if None.
+
+    Returns
+    -------
+    dict
+        A dict associating each calibrated kind of rule to its MEM_PER_GB and CORE_MIN_PER_GB.
+    """
+    ratios = {}
+    for sequencing_name, sequencing_data in cfg.get("SEQUENCINGS", {}).items():
+        benchmark_dir = Path(sequencing_data["PATH"]) / "QC/BENCHMARKS"
+        if not benchmark_dir.is_dir():
+            continue
+        if path_index is None:
+            path_index = PathIndex(cfg)
+        samples = {**sequencing_data.get("SAMPLES", {}), **(sequencing_data.get("INPUT") or {})}
+        sizes = {}
+        for rule_kind in RESOURCE_MODELS:
+            if not (benchmark_dir / rule_kind).is_dir():
+                continue
+            for benchmark in (benchmark_dir / rule_kind).glob("*.tsv"):
+                sample_name, parts = path_index.job_sample(sequencing_name, benchmark.stem, BENCHMARK_WILDCARDS.get(rule_kind, "sample"))
+                if sample_name is None:
+                    # a sample removed from the configuration
+                    continue
+                if sample_name not in sizes:
+                    sizes[sample_name] = get_sample_input_size_gb(sequencing_data, samples[sample_name])
+                size = sizes[sample_name] / parts
+                record = _read_benchmark(benchmark)
+                if size <= 0 or "max_rss" not in record or "cpu_time" not in record:
+                    continue
+                mem_per_gb = max(record["max_rss"] - RESOURCE_MODELS[rule_kind]["MEM_BASE"], 0) / size
+                ratios.setdefault(rule_kind, []).append((mem_per_gb, record["cpu_time"] / 60 / size))
+
+    calibration = {}
+    for rule_kind, values in ratios.items():
+        if len(values) < MIN_BENCHMARKS_FOR_CALIBRATION:
+            continue
+        calibration[rule_kind] = {
+            "MEM_PER_GB": CALIBRATION_MARGIN * _high_quantile([mem for mem, _ in values]),
+            "CORE_MIN_PER_GB": CALIBRATION_MARGIN * _high_quantile([cpu for _, cpu in values]),
+        }
+    return calibration
+
+
+def estimate_threads(rule_kind: str, size_gb, cfg: dict):
+    """
+    Estimate the number of threads of a job from the size of its input.
+
+    Parameters
+    ----------
+    rule_kind : str
+        Key of RESOURCE_MODELS.
+
+    size_gb : float or callable
+        Size of the raw fastq processed by the job (0 if unknown), or a function of the wildcards returning it for a wildcard rule (see [](`genomake.pipelines.chromake.scripts.snakemake_functions.get_input_size_function`)).
+
+    cfg: dict
+        Configuration file of the chromake pipeline
+
+    Returns
+    -------
+    int or callable
+        The number of threads, or a function of the wildcards returning it if `size_gb` is a function.
+    """
+    if callable(size_gb):
+        return lambda wildcards: estimate_threads(rule_kind, size_gb(wildcards), cfg)
+    model = RESOURCE_MODELS[rule_kind]
+    if isinstance(model["CORES"], int):
+        return model["CORES"]
+    max_threads = cfg["JOBS"]["CORES_PER_JOBS"][model["CORES"]]
+    if size_gb <= 0 or model["THREADS_PER_GB"] is None:
+        return max_threads
+    return max(1, min(max_threads, math.ceil(model["THREADS_PER_GB"] * size_gb)))
+
+
+def estimate_resources(rule_kind: str, size_gb, cfg: dict, calibration: dict = None) -> dict:
+    """
+    Estimate the memory and the runtime of a job from the size of its input and create the resources of its rule.
+
+    Parameters
+    ----------
+    rule_kind : str
+        Key of RESOURCE_MODELS.
+
+    size_gb : float or callable
+        Size of the raw fastq processed by the job (0 if unknown), or a function of the wildcards returning it for a wildcard rule.
+
+    cfg: dict
+        Configuration file of the chromake pipeline
+
+    calibration : dict
+        Dict returned by [](`genomake.pipelines.chromake.scripts.snakemake_functions.load_benchmark_calibration`).
+
+    Returns
+    -------
+    dict
+        The mem_mb, runtime and qos resources (functions of the wildcards and of the attempt, to be used as `resources: **estimate_resources(...)`).
+    """
+    if callable(size_gb):
+        def estimate(wildcards) -> tuple:
+            return _estimate_memory_and_runtime(rule_kind, size_gb(wildcards), cfg, calibration)
+    else:
+        mem_mb, runtime = _estimate_memory_and_runtime(rule_kind, size_gb, cfg, calibration)
+
+        def estimate(wildcards) -> tuple:
+            return mem_mb, runtime
+    return {
+        "mem_mb": lambda wildcards, attempt: estimate(wildcards)[0] * attempt,
+        "runtime": lambda wildcards, attempt: attempt * estimate(wildcards)[1],
+        "qos": lambda wildcards, attempt: get_qos_from_time(attempt, estimate(wildcards)[1], cfg),
+    }
+
+
+def _estimate_memory_and_runtime(rule_kind: str, size_gb: float, cfg: dict, calibration: dict = None) -> tuple:
+    """
+    Estimate the memory (MB) and the runtime (min) of the first attempt of a job.
+    """
+    model = dict(RESOURCE_MODELS[rule_kind])
+    if size_gb <= 0:
+        mem_mb = model["MEM_MAX"]
+        runtime = model["MIN_MAX"]
+    else:
+        mem_max = model["MEM_MAX"]
+        if calibration and rule_kind in calibration:
+            model.update(calibration[rule_kind])
+            mem_max = None
+        mem_mb = model["MEM_BASE"] + model["MEM_PER_GB"] * size_gb
+        if mem_max is not None:
+            mem_mb = min(mem_mb, mem_max)
+        threads = estimate_threads(rule_kind, size_gb, cfg)
+        runtime = model["MIN_BASE"] + model["CORE_MIN_PER_GB"] * size_gb / threads
+    return int(math.ceil(mem_mb)), int(math.ceil(runtime))
@@ -0,0 +1,384 @@
+"""
+The validate module of chromake contains functions to check the fastq files of a configuration before running the pipeline.
+
+The files of the samples and of the inputs of all sequencings are checked concurrently by a pool of threads, as most of the time is spent waiting for the (network) filesystem:
+
+- the existence and the size of each fastq (always),
+- the integrity of the gzipped fastq, by decompressing them entirely (`--gzip`),
+- the pairing of the R1 and R2 fastq of each lane: same number of reads and same read names in the same order (`--pairing`, which also checks the integrity of the files read).
+
+The decompression uses pigz when it is installed, so each file is decompressed by its own process. The sizes reported are the ones used to estimate the resources of the jobs (see [](`genomake.pipelines.chromake.scripts.snakemake_functions.estimate_resources`)).
+
+"""
+import argparse
+import csv
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from genomake.pipelines.chromake.scripts.paths import get_sample_fastq, get_sample_units
+
+THREADS = 16
+"""Default number of files checked concurrently."""
+
+BATCH_SIZE = 10000
+"""Number of reads compared at once by the pairing check."""
+
+_READ_SIZE = 1 << 20
+
+
+def list_fastq_files(cfg: dict) -> list:
+    """
+    List the fastq files of the samples and of the inputs of all sequencings.
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration of the chromake pipeline.
+
+    Returns
+    -------
+    list
+        A list of dict (one per lane) with the SEQUENCING, the GROUP (SAMPLES or INPUT), the SAMPLE, the UNIT, and the paths of the R1 and R2 fastq. A sample whose R1 and R2 fields are missing or don't list the same number of files has a single lane, without paths and with a CONFIG_ERROR.
+    """
+    lanes = []
+    for sequencing_name, sequencing_data in cfg.get("SEQUENCINGS", {}).items():
+        base = Path(sequencing_data.get("PATH", ""))
+        for group in ("SAMPLES", "INPUT"):
+            for sample_name, sample_data in (sequencing_data.get(group) or {}).items():
+                n_r1 = len(get_sample_fastq(sample_data, "R1"))
+                n_r2 = len(get_sample_fastq(sample_data, "R2"))
+                if n_r1 == 0 or n_r1 != n_r2:
+                    lanes.append({
+                        "SEQUENCING": sequencing_name,
+                        "GROUP": group,
+                        "SAMPLE": sample_name,
+                        "UNIT": sample_name,
+                        "R1": None,
+                        "R2": None,
+                        "CONFIG_ERROR": f"{n_r1} R1 and {n_r2} R2 files in the configuration",
+                    })
+                    continue
+                for unit, r1, r2 in get_sample_units(sample_name, sample_data):
+                    lanes.append({
+                        "SEQUENCING": sequencing_name,
+                        "GROUP": group,
+                        "SAMPLE": sample_name,
+                        "UNIT": unit,
+                        "R1": str(base / r1),
+                        "R2": str(base / r2),
+                    })
+    return lanes
+
+
+def _file_size(path: str):
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+
+def stat_fastq_files(paths: list, threads: int = THREADS) -> dict:
+    """
+    Get the size of files concurrently.
+
+    Parameters
+    ----------
+    paths : list
+        Paths of the files.
+
+    threads : int
+        Number of files checked concurrently.
+
+    Returns
+    -------
+    dict
+        The size in bytes of each path, None if the file doesn't exist or can't be read.
+    """
+    paths = list(dict.fromkeys(paths))
+    with ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+        return dict(zip(paths, pool.map(_file_size, paths)))
+
+
+class _FastqReader:
+    """
+    Read the lines of a fastq file (gzipped or not) and report the decompression errors when it is closed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.proc = None
+        self.eof = False
+        if path.endswith(".gz") and shutil.which("pigz"):
+            self.proc = subprocess.Popen(["pigz", "-dc", path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.fh = self.proc.stdout
+        elif path.endswith(".gz"):
+            self.fh = gzip.open(path, "rb")
+        else:
+            self.fh = open(path, "rb")
+
+    def read_lines(self, n_lines: int) -> list:
+        lines = list(islice(self.fh, n_lines))
+        self.eof = len(lines) < n_lines
+        return lines
+
+    def close(self) -> str:
+        """
+        Close the file and return the error of the decompression, None if there is none (or if the file was not read until its end).
+        """
+        if self.proc is not None and not self.eof:
+            self.proc.kill()
+        self.fh.close()
+        if self.proc is None:
+            return None
+        stderr = self.proc.stderr.read().decode(errors="replace").strip()
+        self.proc.stderr.close()
+        if self.proc.wait() != 0 and self.eof:
+            return stderr or f"pigz failed to decompress {self.path}"
+        return None
+
+
+def check_gzip(path: str) -> str:
+    """
+    Check the integrity of a gzipped file by decompressing it entirely (CRC and truncation).
+
+    Parameters
+    ----------
+    path : str
+        Path of the file. Files without the .gz extension are not checked.
+
+    Returns
+    -------
+    str
+        The error found, None if the file is valid.
+    """
+    if not path.endswith(".gz"):
+        return None
+    reader = _FastqReader(path)
+    error = None
+    try:
+        while reader.fh.read(_READ_SIZE):
+            pass
+        reader.eof = True
+    except (OSError, EOFError, zlib.error) as exc:
+        error = str(exc) or type(exc).__name__
+    return reader.close() or error
+
+
+def _read_name(header: bytes) -> bytes:
+    # @<name>/1 or @<name> 1:N:0:<index>
+    name = header.split(maxsplit=1)[0] if header.strip() else b""
+    if name[-2:] in (b"/1", b"/2"):
+        name = name[:-2]
+    return name
+
+
+def check_fastq_pair(r1: str, r2: str, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Check that the R1 and R2 fastq of a lane contain the same reads in the same order.
+
+    The files are read entirely, so the check also detects the truncated and corrupted gzipped files.
+
+    Parameters
+    ----------
+    r1 : str
+        Path to the R1 fastq file.
+
+    r2 : str
+        Path to the R2 fastq file.
+
+    batch_size : int
+        Number of reads compared at once.
+
+    Returns
+    -------
+    dict
+        The number of READS (pairs read before an error) and the ERROR found (None if the files are paired).
+    """
+    readers = [_FastqReader(r1), _FastqReader(r2)]
+    n_reads = 0
+    error = None
+    try:
+        while error is None:
+            r1_lines = readers[0].read_lines(4 * batch_size)
+            r2_lines = readers[1].read_lines(4 * batch_size)
+            if not r1_lines and not r2_lines:
+                break
+            if len(r1_lines) != len(r2_lines):
+                error = "R1 and R2 don't contain the same number of reads"
+                break
+            if len(r1_lines) % 4 != 0:
+                error = "the last read is truncated"
+                break
+            for index in range(0, len(r1_lines), 4):
+                if not (r1_lines[index].startswith(b"@") and r2_lines[index].startswith(b"@")
+                        and r1_lines[index + 2].startswith(b"+") and r2_lines[index + 2].startswith(b"+")):
+                    error = f"read {n_reads + 1} is not a valid fastq record"
+                    break
+                if _read_name(r1_lines[index]) != _read_name(r2_lines[index]):
+                    error = f"read {n_reads + 1} has different names in R1 and R2 ({_read_name(r1_lines[index]).decode(errors='replace')} and {_read_name(r2_lines[index]).decode(errors='replace')})"
+                    break
+                n_reads += 1
+    except (OSError, EOFError, zlib.error) as exc:
+        error = str(exc) or type(exc).__name__
+    decompression_errors = [reader.close() for reader in readers]
+    # a decompression error explains the other errors found
+    for path, decompression_error in zip((r1, r2), decompression_errors):
+        if decompression_error:
+            error = f"{Path(path).name}: {decompression_error}"
+    return {"READS": n_reads, "ERROR": error}
+
+
+def validate_fastq(cfg: dict, threads: int = THREADS, gzip_check: bool = False, pairing: bool = False) -> list:
+    """
+    Check the fastq files of the samples and of the inputs of a configuration.
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration of the chromake pipeline.
+
+    threads : int
+        Number of files (or pairs of files) checked concurrently.
+
+    gzip_check : bool
+        Check the integrity of the gzipped files. Not needed with `pairing`, which reads the files entirely.
+
+    pairing : bool
+        Check that the R1 and R2 fastq of each lane contain the same reads in the same order.
+
+    Returns
+    -------
+    list
+        A list of dict (one per lane) with the SEQUENCING, GROUP, SAMPLE, UNIT, R1 and R2 paths, their size (R1_GB and R2_GB, None if missing), the number of READS (if `pairing`), and the ERRORS found (empty string if none).
+    """
+    lanes = list_fastq_files(cfg)
+    sizes = stat_fastq_files([lane[strand] for lane in lanes for strand in ("R1", "R2") if lane[strand]], threads)
+    errors = {index: [] for index in range(len(lanes))}
+    for index, lane in enumerate(lanes):
+        if "CONFIG_ERROR" in lane:
+            errors[index].append(lane["CONFIG_ERROR"])
+            continue
+        for strand in ("R1", "R2"):
+            if sizes[lane[strand]] is None:
+                errors[index].append(f"{strand} not found")
+    # the content is only read for the lanes whose files all exist
+    readable = [index for index in range(len(lanes)) if not errors[index]]
+
+    with ThreadPoolExecutor(max_workers=max(threads, 1)) as pool:
+        if pairing:
+            results = pool.map(lambda index: check_fastq_pair(lanes[index]["R1"], lanes[index]["R2"]), readable)
+            for index, result in zip(readable, results):
+                lanes[index]["READS"] = result["READS"]
+                if result["ERROR"]:
+                    errors[index].append(result["ERROR"])
+        elif gzip_check:
+            paths = [lanes[index][strand] for index in readable for strand in ("R1", "R2")]
+            gzip_errors = dict(zip(paths, pool.map(check_gzip, paths)))
+            for index in readable:
+                for strand in ("R1", "R2"):
+                    if gzip_errors[lanes[index][strand]]:
+                        errors[index].append(f"{strand}: {gzip_errors[lanes[index][strand]]}")
+
+    report = []
+    for index, lane in enumerate(lanes):
+        row = {key: lane[key] for key in ("SEQUENCING", "GROUP", "SAMPLE", "UNIT", "R1", "R2")}
+        for strand in ("R1", "R2"):
+            size = sizes.get(lane[strand])
+            row[f"{strand}_GB"] = None if size is None else round(size / 1e9, 3)
+        if pairing:
+            row["READS"] = lane.get("READS")
+        row["ERRORS"] = "; ".join(errors[index])
+        report.append(row)
+    return report
+
+
+def summarize_sample_sizes(report: list) -> list:
+    """
+    Sum the size of the fastq of each sample from the report of [](`genomake.pipelines.chromake.scripts.validate.validate_fastq`).
+
+    Parameters
+    ----------
+    report : list
+        Report of validate_fastq.
+
+    Returns
+    -------
+    list
+        A list of dict with the SEQUENCING, the SAMPLE, its number of LANES, and the size of its fastq (SIZE_GB, the input size used to estimate the resources of its jobs), sorted by decreasing size.
+    """
+    samples = {}
+    for row in report:
+        key = (row["SEQUENCING"], row["SAMPLE"])
+        sample = samples.setdefault(key, {"SEQUENCING": row["SEQUENCING"], "SAMPLE": row["SAMPLE"], "LANES": 0, "SIZE_GB": 0})
+        sample["LANES"] += 1
+        sample["SIZE_GB"] = round(sample["SIZE_GB"] + (row["R1_GB"] or 0) + (row["R2_GB"] or 0), 3)
+    return sorted(samples.values(), key=lambda sample: sample["SIZE_GB"], reverse=True)
+
+
+def validate_report(cfg: dict, threads: int = THREADS, gzip_check: bool = False, pairing: bool = False, output: str = None) -> bool:
+    """
+    Check the fastq files of a configuration and print the errors and the size of the samples.
+
+    Parameters
+    ----------
+    cfg : dict
+        Configuration of the chromake pipeline.
+
+    threads, gzip_check, pairing :
+        See [](`genomake.pipelines.chromake.scripts.validate.validate_fastq`).
+
+    output : str
+        TSV file where the report (one line per lane) is written. Not written if None.
+
+    Returns
+    -------
+    bool
+        True if no error was found.
+    """
+    from genomake.pipelines.chromake.scripts.perf_report import format_table
+
+    report = validate_fastq(cfg, threads, gzip_check, pairing)
+    if output and report:
+        with open(output, "w", encoding="utf-8", newline="") as fh:
+            writer = csv.DictWriter(fh, fieldnames=list(report[0].keys()), delimiter="\t")
+            writer.writeheader()
+            writer.writerows(report)
+    failed = [row for row in report if row["ERRORS"]]
+    sizes = summarize_sample_sizes(report)
+    print(f"{len(report)} lanes of {len(sizes)} samples checked, {sum(sample['SIZE_GB'] for sample in sizes):.3f} GB of fastq.")
+    if sizes:
+        print("\nPer sample:")
+        print(format_table(sizes))
+    if failed:
+        print(f"\n{len(failed)} lanes with errors:")
+        print(format_table([{key: row[key] for key in ("SEQUENCING", "SAMPLE", "UNIT", "ERRORS")} for row in failed]))
+    return not failed
+
+
+def main():
+    import yaml
+
+    parser = argparse.ArgumentParser(
+        description="Check the fastq files of the samples and of the inputs of a chromake configuration."
+    )
+    parser.add_argument("--config-path", "-c", type=str, required=True, help="Path to the configuration file of the pipeline.")
+    parser.add_argument("--threads", "-t", type=int, default=THREADS, help=f"Number of files checked concurrently. Default to {THREADS}.")
+    parser.add_argument("--gzip", action="store_true", default=False, help="Check the integrity of the gzipped fastq (decompress them entirely).")
+    parser.add_argument("--pairing", action="store_true", default=False, help="Check that the R1 and R2 fastq of each lane contain the same reads in the same order (also checks the integrity of the files).")
+    parser.add_argument("--output", "-o", type=str, default=None, help="TSV file where the report (one line per lane) is written.")
+    args = parser.parse_args()
+    with open(args.config_path, "r", encoding="utf-8") as fh:
+        cfg = yaml.safe_load(fh)
+    if not validate_report(cfg, args.threads, args.gzip, args.pairing, args.output):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Bin vectors and Spearman correlation of chromake compared to naive implementations.
+"""
+import numpy as np
+
+from genomake.pipelines.chromake.scripts import correlation
+from genomake.pipelines.chromake.scripts.bins import bin_fragments
+
+
+def _write_vector(path, vector):
+    np.save(path, vector)
+    with open(str(path)[:-len(".npy")] + ".tsv", "w", encoding="utf-8") as fh:
+        fh.write(f"chr1\t0\t{len(vector)}\n")
+
+
+def test_bin_fragments():
+    rng = np.random.default_rng(1)
+    starts = rng.integers(0, 9900, 500)
+    ends = starts + rng.integers(1, 400, 500)
+    expected = np.zeros(10, dtype=np.int64)
+    for start, end in zip(starts, ends):
+        for index in range(start // 1000, min((end - 1) // 1000, 9) + 1):
+            expected[index] += 1
+    assert np.array_equal(bin_fragments(starts, ends, 10, 1000), expected)
+
+
+def test_average_ranks():
+    values = np.array([3, 1, 3, 2, 3, 0, 1])
+    expected = [np.mean([rank for rank, other in enumerate(sorted(values), 1) if other == value]) for value in values]
+    assert np.array_equal(correlation.average_ranks(values), expected)
+
+
+def test_spearman_correlation(tmp_path):
+    rng = np.random.default_rng(2)
+    vectors = [rng.poisson(rng.uniform(0.5, 5), 10000) for _ in range(6)] + [np.full(10000, 3)]
+    rank_paths = []
+    for index, vector in enumerate(vectors):
+        rank_paths.append(str(tmp_path / f"{index}.npy"))
+        np.save(rank_paths[-1], correlation.scaled_ranks(vector))
+    result = correlation.spearman_correlation(rank_paths)
+    expected = np.corrcoef([correlation.average_ranks(vector) for vector in vectors[:-1]])
+    assert np.allclose(result[:-1, :-1], expected, atol=1e-12)
+    assert np.isnan(result[-1]).all() and np.isnan(result[:, -1]).all()
+
+
+def test_compare_samples_incremental(tmp_path):
+    rng = np.random.default_rng(3)
+    paths = []
+    for index in range(8):
+        paths.append(str(tmp_path / f"s{index}.npy"))
+        _write_vector(paths[-1], rng.poisson(rng.uniform(0.5, 5), 20000).astype(np.int32))
+    labels = [f"s{index}" for index in range(8)]
+    for n in (3, 5, 8):
+        stats = correlation.compare_samples(paths[:n], labels[:n], str(tmp_path / "inc/matrix.npy"), str(tmp_path / "inc/correlation.tsv"), str(tmp_path / "inc/plot.png"))
+    assert stats["PAIRS"] == 8 * 9 // 2 - 5 * 6 // 2
+    correlation.compare_samples(paths, labels, str(tmp_path / "full/matrix.npy"), str(tmp_path / "full/correlation.tsv"), str(tmp_path / "full/plot.png"))
+    assert (tmp_path / "inc/correlation.tsv").read_text() == (tmp_path / "full/correlation.tsv").read_text()
+    assert np.array_equal(np.load(tmp_path / "inc/matrix.npy"), np.load(tmp_path / "full/matrix.npy"))
@@ -0,0 +1,64 @@
+"""
+Peak counts of chromake compared to a naive overlap count.
+"""
+import numpy as np
+
+from genomake.pipelines.chromake.scripts.counts import build_count_matrix, count_fragments, get_count_matrix_paths
+from genomake.pipelines.chromake.scripts.fragment_store import write_fragment_store
+
+CHROMS = ["chr1", "chr2"]
+
+
+def _fragments(rng):
+    starts = rng.integers(0, 10000, 2000)
+    ends = starts + rng.integers(1, 500, 2000)
+    order = np.lexsort((ends, starts))
+    return starts[order], ends[order]
+
+
+def _peaks(rng):
+    starts = np.sort(rng.integers(0, 10000, 60))
+    return starts, starts + rng.integers(1, 300, 60)
+
+
+def _naive_counts(starts, ends, peak_starts, peak_ends):
+    return np.array([int(((starts < peak_end) & (ends > peak_start)).sum()) for peak_start, peak_end in zip(peak_starts, peak_ends)])
+
+
+def test_count_fragments():
+    rng = np.random.default_rng(1)
+    starts, ends = _fragments(rng)
+    peak_starts, peak_ends = _peaks(rng)
+    # peaks touching fragments on both sides
+    peak_starts = np.append(peak_starts, [ends[0], starts[-1] - 10])
+    peak_ends = np.append(peak_ends, [ends[0] + 5, starts[-1]])
+    assert np.array_equal(count_fragments(starts, ends, peak_starts, peak_ends), _naive_counts(starts, ends, peak_starts, peak_ends))
+
+
+def test_build_count_matrix(tmp_path):
+    rng = np.random.default_rng(2)
+    peaks = {chrom: _peaks(rng) for chrom in CHROMS}
+    with open(tmp_path / "peaks.bed", "w", encoding="utf-8") as fh:
+        for chrom in CHROMS:
+            fh.writelines(f"{chrom}\t{start}\t{end}\tpeak\n" for start, end in zip(*peaks[chrom]))
+    samples = []
+    for index in range(4):
+        fragments = {chrom: _fragments(rng) for chrom in CHROMS}
+        write_fragment_store(str(tmp_path / f"s{index}"), [(chrom, np.vstack(fragments[chrom])) for chrom in CHROMS])
+        samples.append(fragments)
+    expected = np.array([
+        np.concatenate([_naive_counts(*fragments[chrom], *peaks[chrom]) for chrom in CHROMS]) for fragments in samples
+    ]).T
+
+    prefix = str(tmp_path / "counts/counts")
+    names = [f"s{index}" for index in range(4)]
+    stores = [str(tmp_path / f"s{index}.npy") for index in range(4)]
+    build_count_matrix(str(tmp_path / "peaks.bed"), names[:2], stores[:2], prefix)
+    stats = build_count_matrix(str(tmp_path / "peaks.bed"), names, stores, prefix, threads=2)
+    assert stats["COUNTED"] == 2
+    with np.load(get_count_matrix_paths(prefix)[0]) as matrix:
+        dense = np.zeros(tuple(matrix["shape"]), dtype=np.int64)
+        indptr = matrix["indptr"]
+        for column in range(dense.shape[1]):
+            dense[matrix["indices"][indptr[column]:indptr[column + 1]], column] = matrix["data"][indptr[column]:indptr[column + 1]]
+    assert np.array_equal(dense, expected)
@@ -0,0 +1,60 @@
+"""
+Coverage tracks of chromake compared to a naive per-base sum of the fragments.
+"""
+import numpy as np
+
+from genomake.pipelines.chromake.scripts.coverage import chromosome_coverage, get_scale_factor
+
+CHROM_SIZE = 5003
+
+
+def _fragments(seed):
+    rng = np.random.default_rng(seed)
+    starts = np.sort(rng.integers(0, CHROM_SIZE - 300, 400))
+    ends = starts + rng.integers(1, 300, 400)
+    order = np.lexsort((ends, starts))
+    return starts[order], ends[order]
+
+
+def _naive_depth(starts, ends):
+    depth = np.zeros(CHROM_SIZE, dtype=np.int64)
+    for start, end in zip(starts, ends):
+        depth[start:end] += 1
+    return depth
+
+
+def _expand(starts, ends, values):
+    track = np.zeros(CHROM_SIZE, dtype=np.float64)
+    for start, end, value in zip(starts, ends, values):
+        track[start:end] = value
+    return track
+
+
+def test_base_coverage():
+    starts, ends = _fragments(1)
+    interval_starts, interval_ends, depth = chromosome_coverage(starts, ends, CHROM_SIZE)
+    assert np.array_equal(_expand(interval_starts, interval_ends, depth), _naive_depth(starts, ends))
+    # like bedtools genomecov -bg: no interval of null depth, and the adjacent intervals have different depths
+    assert (depth > 0).all()
+    assert not ((interval_starts[1:] == interval_ends[:-1]) & (depth[1:] == depth[:-1])).any()
+
+
+def test_bin_coverage():
+    starts, ends = _fragments(2)
+    depth = _naive_depth(starts, ends)
+    edges = list(range(0, CHROM_SIZE, 100)) + [CHROM_SIZE]
+    expected = np.zeros(CHROM_SIZE, dtype=np.float64)
+    for start, end in zip(edges[:-1], edges[1:]):
+        expected[start:end] = depth[start:end].mean()
+    assert np.allclose(_expand(*chromosome_coverage(starts, ends, CHROM_SIZE, 100)), expected)
+
+
+def test_empty_coverage():
+    empty = np.zeros(0, dtype=np.int64)
+    for bin_size in (1, 100):
+        assert all(len(array) == 0 for array in chromosome_coverage(empty, empty, CHROM_SIZE, bin_size))
+
+
+def test_scale_factor():
+    assert get_scale_factor(2_000_000, "none") == 1.0
+    assert get_scale_factor(2_000_000, "CPM") == 0.5
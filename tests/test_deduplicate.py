@@ -0,0 +1,129 @@
+"""
+Duplicate removal of chromake compared to a brute-force implementation of the picard rules.
+"""
+import random
+from collections import defaultdict
+
+import pysam
+
+from genomake.pipelines.chromake.scripts.deduplicate import MIN_BASE_QUALITY, remove_duplicates
+
+HEADER = {
+    "HD": {"VN": "1.6", "SO": "coordinate"},
+    "SQ": [{"SN": "chr1", "LN": 100000}, {"SN": "chr2", "LN": 100000}],
+    "RG": [{"ID": "a", "SM": "s", "LB": "L1"}, {"ID": "b", "SM": "s", "LB": "L2"}],
+}
+
+LIBRARIES = {read_group["ID"]: read_group["LB"] for read_group in HEADER["RG"]}
+
+
+def _read(name, flag, chrom, start, cigar, mate_chrom, mate_start, qualities, read_group):
+    read = pysam.AlignedSegment()
+    read.query_name = name
+    read.query_sequence = "A" * sum(length for _, length in cigar)
+    read.flag = flag
+    read.reference_id = chrom
+    read.reference_start = start
+    read.cigartuples = cigar
+    read.mapping_quality = 30
+    read.next_reference_id = mate_chrom
+    read.next_reference_start = mate_start
+    read.query_qualities = pysam.qualitystring_to_array("".join(chr(q + 33) for q in qualities))
+    read.set_tag("RG", read_group)
+    return read
+
+
+def _write_bam(path):
+    rng = random.Random(7)
+    reads = []
+    for n in range(3000):
+        name = f"r{n}"
+        read_group = rng.choice("ab")
+        qualities = [[rng.choice([10, 30, 40]) for _ in range(50)] for _ in range(2)]
+        chrom1 = rng.randrange(2)
+        start1 = rng.randrange(100, 1500)
+        clip = rng.choice([0, 0, 3])
+        cigar1 = [(4, clip), (0, 50 - clip)] if clip else [(0, 50)]
+        if rng.random() < 0.1:
+            # the mate is unmapped
+            reads.append(_read(name, 1 | 8 | 64, chrom1, start1, cigar1, -1, -1, qualities[0], read_group))
+            continue
+        if rng.random() < 0.2:
+            # the mates are on different chromosomes
+            chrom2, start2 = 1 - chrom1, rng.randrange(100, 400)
+        else:
+            chrom2, start2 = chrom1, start1 + rng.choice([100, 150, 200])
+        reads.append(_read(name, 1 | 32 | 64, chrom1, start1, cigar1, chrom2, start2, qualities[0], read_group))
+        reads.append(_read(name, 1 | 16 | 128, chrom2, start2, [(0, 50)], chrom1, start1, qualities[1], read_group))
+        if rng.random() < 0.05:
+            # a secondary alignment, before or after the primary alignments
+            reads.append(_read(name, 1 | 256 | 64, chrom1, rng.randrange(0, 3000), [(0, 50)], chrom2, start2, qualities[0], read_group))
+    reads.sort(key=lambda read: (read.reference_id, read.reference_start))
+    with pysam.AlignmentFile(path, "wb", header=HEADER) as bam:
+        for read in reads:
+            bam.write(read)
+    pysam.index(path)
+
+
+def _five_prime(read):
+    if read.is_reverse:
+        position = read.reference_end - 1
+        for operation, length in reversed(read.cigartuples):
+            if operation not in (4, 5):
+                break
+            position += length
+    else:
+        position = read.reference_start
+        for operation, length in read.cigartuples:
+            if operation not in (4, 5):
+                break
+            position -= length
+    return LIBRARIES[read.get_tag("RG")], read.reference_id, position, read.is_reverse
+
+
+def _score(read):
+    return sum(q for q in read.query_qualities if q >= MIN_BASE_QUALITY)
+
+
+def _brute_force(path):
+    with pysam.AlignmentFile(path, "rb") as bam:
+        reads = list(bam.fetch(until_eof=True))
+    primary = defaultdict(list)
+    for index, read in enumerate(reads):
+        if not read.is_secondary:
+            primary[read.query_name].append((index, read))
+    pair_groups = defaultdict(list)
+    pair_ends = set()
+    singles = []
+    for name, mates in primary.items():
+        if len(mates) == 2:
+            (index1, read1), (index2, read2) = mates
+            ends = tuple(sorted([_five_prime(read1), _five_prime(read2)]))
+            pair_ends.update(ends)
+            pair_groups[ends].append((-(_score(read1) + _score(read2)), min(index1, index2), name))
+        else:
+            singles += mates
+    duplicates = set()
+    for group in pair_groups.values():
+        duplicates.update(name for _, _, name in sorted(group)[1:])
+    single_groups = defaultdict(list)
+    for index, read in singles:
+        end = _five_prime(read)
+        if end in pair_ends:
+            duplicates.add(read.query_name)
+        else:
+            single_groups[end].append((-_score(read), index, read.query_name))
+    for group in single_groups.values():
+        duplicates.update(name for _, _, name in sorted(group)[1:])
+    return [(read.query_name, read.flag) for read in reads if read.query_name not in duplicates]
+
+
+def test_remove_duplicates(tmp_path):
+    bam_path = str(tmp_path / "in.bam")
+    _write_bam(bam_path)
+    expected = _brute_force(bam_path)
+    metrics = remove_duplicates(bam_path, str(tmp_path / "out.bam"), str(tmp_path / "metrics.txt"), threads=2)
+    with pysam.AlignmentFile(str(tmp_path / "out.bam"), "rb") as bam:
+        kept = [(read.query_name, read.flag) for read in bam.fetch(until_eof=True)]
+    assert kept == expected
+    assert metrics["READ_PAIRS_EXAMINED"] + metrics["UNPAIRED_READS_EXAMINED"] == 3000
@@ -0,0 +1,42 @@
+"""
+Binary fragment store of chromake compared to the fragment bed file it mirrors.
+"""
+import numpy as np
+
+from genomake.pipelines.chromake.scripts.fragment_store import (
+    STORE_DTYPE,
+    fragment_store_from_bed,
+    fragment_store_to_bed,
+    open_fragment_store,
+    read_fragment_index,
+)
+
+
+def _write_bed(path):
+    rng = np.random.default_rng(5)
+    lines = []
+    for chrom in ("chr1", "chr10", "chr2"):
+        starts = rng.integers(0, 100000, 300)
+        ends = starts + rng.integers(1, 1000, 300)
+        lines += [f"{chrom}\t{start}\t{end}\n" for start, end in sorted(zip(starts.tolist(), ends.tolist()))]
+    path.write_text("".join(lines), encoding="utf-8")
+    return lines
+
+
+def test_round_trip(tmp_path):
+    lines = _write_bed(tmp_path / "fragments.bed")
+    assert fragment_store_from_bed(str(tmp_path / "fragments.bed"), str(tmp_path / "store")) == len(lines)
+    assert list(read_fragment_index(str(tmp_path / "store"))) == ["chr1", "chr10", "chr2"]
+    assert fragment_store_to_bed(str(tmp_path / "store"), str(tmp_path / "copy.bed")) == len(lines)
+    assert (tmp_path / "copy.bed").read_text(encoding="utf-8") == "".join(lines)
+
+
+def test_open_store(tmp_path):
+    lines = _write_bed(tmp_path / "fragments.bed")
+    fragment_store_from_bed(str(tmp_path / "fragments.bed"), str(tmp_path / "store"))
+    store = open_fragment_store(str(tmp_path / "store"))
+    for chrom, (starts, ends) in store.items():
+        expected = [line.split("\t") for line in lines if line.startswith(chrom + "\t")]
+        assert starts.dtype == STORE_DTYPE and ends.dtype == STORE_DTYPE
+        assert starts.tolist() == [int(fields[1]) for fields in expected]
+        assert ends.tolist() == [int(fields[2]) for fields in expected]
@@ -0,0 +1,99 @@
+"""
+Fragments of chromake compared to the bedtools pipeline they replace (bamtobed -bedpe of the name-sorted bam, length filter, intersect -f 0.5 -r -v).
+"""
+import random
+
+import numpy as np
+import pysam
+
+from genomake.pipelines.chromake.scripts.fragments import MAX_FRAGMENT_LENGTH, chromosome_fragments, remove_blacklisted
+
+HEADER = {"HD": {"VN": "1.6", "SO": "coordinate"}, "SQ": [{"SN": "chr1", "LN": 100000}, {"SN": "chr2", "LN": 100000}]}
+
+
+def _read(name, flag, chrom, start, length, mate_chrom, mate_start):
+    read = pysam.AlignedSegment()
+    read.query_name = name
+    read.query_sequence = "A" * length
+    read.flag = flag
+    read.reference_id = chrom
+    read.reference_start = start
+    read.cigartuples = [(0, length)]
+    read.mapping_quality = 30
+    read.next_reference_id = mate_chrom
+    read.next_reference_start = mate_start
+    return read
+
+
+def _write_bam(path):
+    rng = random.Random(3)
+    reads = []
+    for n in range(2000):
+        name = f"r{n}"
+        start1 = rng.randrange(0, 5000)
+        # overlapping mates, mates starting at the same position, long fragments and R2 on the left
+        start2 = start1 + rng.choice([0, 0, 20, 150, 400, 990, 1200, -30])
+        if start2 < 0:
+            start2 = start1
+        length1, length2 = rng.choice([50, 75]), rng.choice([30, 50, 75])
+        chrom1 = rng.randrange(2)
+        chrom2 = chrom1 if rng.random() < 0.9 else 1 - chrom1
+        if rng.random() < 0.05:
+            reads.append(_read(name, 1 | 8 | 64, chrom1, start1, length1, -1, -1))
+            continue
+        reads.append(_read(name, 1 | 32 | 64, chrom1, start1, length1, chrom2, start2))
+        reads.append(_read(name, 1 | 16 | 128, chrom2, start2, length2, chrom1, start1))
+        if rng.random() < 0.05:
+            reads.append(_read(name, 1 | 256 | 64, chrom1, rng.randrange(0, 5000), length1, chrom2, start2))
+    reads.sort(key=lambda read: (read.reference_id, read.reference_start))
+    with pysam.AlignmentFile(path, "wb", header=HEADER) as bam:
+        for read in reads:
+            bam.write(read)
+    pysam.index(path)
+
+
+def _bedtools_fragments(path, chrom):
+    """
+    bamtobed -bedpe of the name-sorted bam (R1 then R2), then awk '$1==$4 && $6-$2 < 1000' and cut -f 1,2,6.
+    """
+    mates = {}
+    with pysam.AlignmentFile(path, "rb") as bam:
+        for read in bam.fetch(until_eof=True):
+            if read.is_secondary or read.is_supplementary or read.is_unmapped or read.mate_is_unmapped:
+                continue
+            mates.setdefault(read.query_name, [None, None])[0 if read.is_read1 else 1] = read
+    fragments = []
+    for read1, read2 in mates.values():
+        if read1.reference_name != chrom or read2.reference_name != chrom:
+            continue
+        if read1.reference_start > read2.reference_start:
+            read1, read2 = read2, read1
+        if read2.reference_end - read1.reference_start < MAX_FRAGMENT_LENGTH:
+            fragments.append((read1.reference_start, read2.reference_end))
+    return sorted(fragments)
+
+
+def test_chromosome_fragments(tmp_path):
+    bam_path = str(tmp_path / "in.bam")
+    _write_bam(bam_path)
+    for chrom in ("chr1", "chr2"):
+        starts, ends = chromosome_fragments(bam_path, chrom)
+        assert list(zip(starts.tolist(), ends.tolist())) == _bedtools_fragments(bam_path, chrom)
+
+
+def test_remove_blacklisted():
+    rng = np.random.default_rng(4)
+    starts = np.sort(rng.integers(0, 20000, 3000))
+    ends = starts + rng.integers(1, MAX_FRAGMENT_LENGTH, 3000)
+    regions = np.array([[1000, 1300], [5000, 5100], [8000, 9500], [15000, 15002], [16000, 18500]], dtype=np.int64)
+    expected = [
+        (start, end) for start, end in zip(starts.tolist(), ends.tolist())
+        if not any(
+            min(end, region_end) - max(start, region_start) > 0
+            and min(end, region_end) - max(start, region_start) >= 0.5 * (end - start)
+            and min(end, region_end) - max(start, region_start) >= 0.5 * (region_end - region_start)
+            for region_start, region_end in regions.tolist()
+        )
+    ]
+    kept_starts, kept_ends = remove_blacklisted(starts, ends, regions)
+    assert list(zip(kept_starts.tolist(), kept_ends.tolist())) == expected
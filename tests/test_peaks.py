@@ -0,0 +1,47 @@
+"""
+Consensus peaks of chromake compared to a naive merge of the peaks of the samples.
+"""
+import numpy as np
+
+from genomake.pipelines.chromake.scripts.peaks import consensus_peaks, read_peak_file
+
+CHROMS = ["chr1", "chr10", "chr2", "chrX"]
+
+
+def _write_peaks(path, rng):
+    peaks = []
+    for _ in range(rng.integers(50, 150)):
+        start = int(rng.integers(0, 20000))
+        peaks.append((CHROMS[rng.integers(len(CHROMS))], start, start + int(rng.integers(50, 600))))
+    lines = ["track name=peaks\n"] + [f"{chrom}\t{start}\t{end}\tpeak\t0\t.\t5.2\t3.1\t2.0\t150\n" for chrom, start, end in peaks]
+    path.write_text("".join(lines), encoding="utf-8")
+    return peaks
+
+
+def _naive_consensus(sample_peaks, min_samples):
+    intervals = sorted((chrom, start, end, sample) for sample, peaks in enumerate(sample_peaks) for chrom, start, end in peaks)
+    regions = []
+    for chrom, start, end, sample in intervals:
+        # intervals that only touch are not merged
+        if regions and regions[-1][0] == chrom and start < regions[-1][2]:
+            regions[-1][2] = max(regions[-1][2], end)
+            regions[-1][3].add(sample)
+        else:
+            regions.append([chrom, start, end, {sample}])
+    return [(chrom, start, end, len(samples)) for chrom, start, end, samples in regions if len(samples) >= min_samples]
+
+
+def test_read_peak_file(tmp_path):
+    peaks = _write_peaks(tmp_path / "sample.narrowPeak", np.random.default_rng(1))
+    names, chroms, starts, ends = read_peak_file(str(tmp_path / "sample.narrowPeak"))
+    assert list(zip([names[chrom] for chrom in chroms], starts.tolist(), ends.tolist())) == peaks
+
+
+def test_consensus_peaks(tmp_path):
+    rng = np.random.default_rng(2)
+    sample_peaks = [_write_peaks(tmp_path / f"s{index}.narrowPeak", rng) for index in range(6)]
+    paths = [str(tmp_path / f"s{index}.narrowPeak") for index in range(6)]
+    for min_samples in (1, 2, 4):
+        consensus = consensus_peaks(paths, min_samples, threads=2)
+        result = list(zip(consensus["chrom"].tolist(), consensus["start"].tolist(), consensus["end"].tolist(), consensus["n_samples"].tolist()))
+        assert result == _naive_consensus(sample_peaks, min_samples)
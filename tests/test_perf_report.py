@@ -0,0 +1,42 @@
+"""
+Per-sample summary of the benchmarks of chromake, with the fastq names of bcl2fastq.
+"""
+from genomake.pipelines.chromake.scripts import perf_report
+
+
+def _write_benchmark(path, rule_kind, job_name, seconds):
+    benchmark = path / "QC/BENCHMARKS" / rule_kind / f"{job_name}.tsv"
+    benchmark.parent.mkdir(parents=True, exist_ok=True)
+    benchmark.write_text(f"s\tmax_rss\tcpu_time\n{seconds}\t100\t{seconds}\n")
+
+
+def test_summarize_by_sample(tmp_path):
+    samples = {
+        # two lanes
+        "A": {
+            "R1": ["FASTQ/A_S1_L001_R1_001.fastq.gz", "FASTQ/A_S1_L002_R1_001.fastq.gz"],
+            "R2": ["FASTQ/A_S1_L001_R2_001.fastq.gz", "FASTQ/A_S1_L002_R2_001.fastq.gz"],
+        },
+        # a single lane, the sample name ends like a lane
+        "B_L1": {"R1": "FASTQ/B_L1_S2_L001_R1_001.fastq.gz", "R2": "FASTQ/B_L1_S2_L001_R2_001.fastq.gz"},
+    }
+    cfg = {"SEQUENCINGS": {"SEQ": {"PATH": str(tmp_path), "SAMPLES": samples, "PARAMETERS": {"ALIGNMENT_CHUNKS": 2}}}}
+    for lane in (1, 2):
+        for strand in ("R1", "R2"):
+            _write_benchmark(tmp_path, "fastqc_raw", f"A_S1_L00{lane}_{strand}_001", 10)
+        _write_benchmark(tmp_path, "cutadapt", f"A_L{lane}", 20)
+        for chunk in (1, 2):
+            _write_benchmark(tmp_path, "bowtie2_chunk", f"A_L{lane}_C{chunk}", 100)
+    _write_benchmark(tmp_path, "bowtie2_gather", "A", 50)
+    for strand in ("R1", "R2"):
+        _write_benchmark(tmp_path, "fastqc_raw", f"B_L1_S2_L001_{strand}_001", 10)
+    _write_benchmark(tmp_path, "bowtie2_chunk", "B_L1_C1", 100)
+    _write_benchmark(tmp_path, "bowtie2_chunk", "B_L1_C2", 100)
+    _write_benchmark(tmp_path, "bowtie2_gather", "B_L1", 50)
+    # per-sequencing rule and sample removed from the configuration
+    _write_benchmark(tmp_path, "multiqc_raw", "SEQ", 30)
+    _write_benchmark(tmp_path, "bowtie2_gather", "C", 50)
+
+    summary = perf_report.summarize_by_sample(perf_report.collect_benchmarks(cfg), cfg)
+    assert {row["SAMPLE"]: row["JOBS"] for row in summary} == {"A": 11, "B_L1": 5}
+    assert {row["SAMPLE"]: row["WALL_HOURS"] for row in summary} == {"A": round(530 / 3600, 3), "B_L1": round(270 / 3600, 3)}
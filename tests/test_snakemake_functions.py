@@ -0,0 +1,51 @@
+"""
+Calibration of the resource model of chromake from the benchmarks of a multi-lane sequencing.
+"""
+import pytest
+
+from genomake.pipelines.chromake.scripts.snakemake_functions import CALIBRATION_MARGIN, RESOURCE_MODELS, load_benchmark_calibration
+
+FASTQ_BYTES = 1_000_000
+
+
+def _write_sequencing(path):
+    samples = {}
+    for sample_name in ("A", "B", "C"):
+        samples[sample_name] = {
+            "R1": [f"FASTQ/{sample_name}_S1_L00{lane}_R1_001.fastq.gz" for lane in (1, 2)],
+            "R2": [f"FASTQ/{sample_name}_S1_L00{lane}_R2_001.fastq.gz" for lane in (1, 2)],
+            "TYPE": "ATAC",
+        }
+        for fastq in samples[sample_name]["R1"] + samples[sample_name]["R2"]:
+            (path / fastq).parent.mkdir(parents=True, exist_ok=True)
+            (path / fastq).write_bytes(b"\0" * FASTQ_BYTES)
+    return {"SEQUENCINGS": {"SEQ": {"PATH": str(path), "SAMPLES": samples, "PARAMETERS": {"ALIGNMENT_CHUNKS": 2}}}}
+
+
+def _write_benchmark(path, rule_kind, job_name, size_gb, mem_per_gb, core_min_per_gb):
+    benchmark = path / "QC/BENCHMARKS" / rule_kind / f"{job_name}.tsv"
+    benchmark.parent.mkdir(parents=True, exist_ok=True)
+    max_rss = RESOURCE_MODELS[rule_kind]["MEM_BASE"] + mem_per_gb * size_gb
+    benchmark.write_text(f"s\tmax_rss\tcpu_time\n10\t{max_rss}\t{core_min_per_gb * size_gb * 60}\n")
+
+
+def test_calibration_of_lanes_chunks_and_fastq(tmp_path):
+    cfg = _write_sequencing(tmp_path)
+    # 4 fastq per sample: a lane is half of the sample, a chunk a quarter, a raw fastq a quarter
+    sample_gb = 4 * FASTQ_BYTES / 1e9
+    for sample_name in ("A", "B", "C"):
+        _write_benchmark(tmp_path, "bowtie2_gather", sample_name, sample_gb, 500, 10)
+        for lane in (1, 2):
+            _write_benchmark(tmp_path, "cutadapt", f"{sample_name}_L{lane}", sample_gb / 2, 1000, 30)
+            for chunk in (1, 2):
+                _write_benchmark(tmp_path, "bowtie2_chunk", f"{sample_name}_L{lane}_C{chunk}", sample_gb / 4, 3000, 200)
+            for strand in ("R1", "R2"):
+                _write_benchmark(tmp_path, "fastqc_raw", f"{sample_name}_S1_L00{lane}_{strand}_001", sample_gb / 4, 100, 5)
+    # benchmarks of a sample removed from the configuration
+    _write_benchmark(tmp_path, "cutadapt", "D_L1", sample_gb / 2, 10 ** 6, 10 ** 6)
+    calibration = load_benchmark_calibration(cfg)
+    expected = {"bowtie2_gather": (500, 10), "cutadapt": (1000, 30), "bowtie2_chunk": (3000, 200), "fastqc_raw": (100, 5)}
+    assert set(calibration) == set(expected)
+    for rule_kind, (mem_per_gb, core_min_per_gb) in expected.items():
+        assert calibration[rule_kind]["MEM_PER_GB"] == pytest.approx(CALIBRATION_MARGIN * mem_per_gb)
+        assert calibration[rule_kind]["CORE_MIN_PER_GB"] == pytest.approx(CALIBRATION_MARGIN * core_min_per_gb)
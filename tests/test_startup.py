@@ -0,0 +1,23 @@
+"""
+Import-time and parse-time budgets of the cli and of the chromake snakefile.
+"""
+from genomake.pipelines.chromake.scripts import dag_benchmark
+
+
+def test_cli_import_time():
+    result = dag_benchmark.measure_import_time(["genomake.cli"])
+    assert result["HEAVY_MODULES"] == []
+    assert result["IMPORT_MS"] < dag_benchmark.IMPORT_BUDGET_MS
+
+
+def test_snakefile_modules_import_time():
+    result = dag_benchmark.measure_import_time(dag_benchmark.STARTUP_MODULES["snakefile"])
+    assert result["HEAVY_MODULES"] == []
+    assert result["IMPORT_MS"] < dag_benchmark.IMPORT_BUDGET_MS
+
+
+def test_snakefile_parse_time():
+    result = dag_benchmark.measure_snakefile_parse(n_samples=10)
+    assert result["HEAVY_MODULES"] == []
+    assert result["IMPORT_MS"] < dag_benchmark.IMPORT_BUDGET_MS
+    assert result["PARSE_S"] < dag_benchmark.PARSE_BUDGET_S